@@ -1,12 +1,34 @@
+import io
+import os
 import streamlit as st
-import pandas as pd
 import logging
 
 
-from level_agreement.validation.file_validation import validate_file_column, validate_empty_file, validate_empty_rows, \
-    validate_ids
-from level_agreement.merging.merging_df import merge_df, compare_prediction_columns
-from level_agreement.output.output_file import predictions_metrics, rename_columns
+from level_agreement.pipeline.comparison import Comparison
+from level_agreement.pipeline.multi_comparison import MultiComparison, annotator_name
+from level_agreement.output.output_file import rename_columns
+from level_agreement.output.columnar_file import save_comparison
+from level_agreement.output.excel_export import excel_bytes, EXCEL_MIME
+from level_agreement.caching.result_cache import ResultCache, result_key, DEFAULT_MAX_MB
+from level_agreement.validation.duplicate_keys import DUPLICATE_POLICIES
+from level_agreement.monitoring.stages import recording, stage
+from level_agreement.upload.file_upload import file_columns, REQUIRED_COLUMNS
+
+# Sidebar names of the duplicate policies
+DUPLICATE_POLICY_NAMES = {
+    "error": "Stop with an error",
+    "first": "Keep the first row",
+    "last": "Keep the last row",
+    "union": "Combine their labels",
+}
+
+# Sidebar help of the duplicate policies, as the default changed from multiplying such rows in the merge
+DUPLICATE_POLICY_HELP = ("Files with rows sharing an id and comment used to be merged by pairing every such row with "
+                         "every matching row of the other file, which multiplied them. They now stop with an error "
+                         "unless another option is picked here.")
+
+# Rows of the label substitutions table shown on the page, the download has all of them
+LABEL_SUBSTITUTIONS_SHOWN = 20
 
 # Set up logging
 logging.basicConfig(
@@ -15,6 +37,136 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
+
+
+@st.cache_resource
+def get_result_cache():
+    """
+    Returns the result cache shared by every session of this app process.
+
+    The budget and an optional directory, to keep results on disk and share them between processes, are read
+    from the LEVEL_AGREEMENT_CACHE_MB and LEVEL_AGREEMENT_CACHE_DIR environment variables.
+    """
+    return ResultCache(max_mb=float(os.environ.get("LEVEL_AGREEMENT_CACHE_MB", DEFAULT_MAX_MB)),
+                       directory=os.environ.get("LEVEL_AGREEMENT_CACHE_DIR"))
+
+
+def compare_uploaded_files(ground_truth_file, comparison_file, duplicate_policy="error", group_columns=None,
+                           annotator_files=None, intervals=False):
+    """
+    Runs the full comparison of two uploaded files.
+
+    Args:
+        duplicate_policy (str): How rows sharing an id and comment are resolved, one of DUPLICATE_POLICIES.
+        group_columns (list): Columns of the ground-truth file to break the metrics down by.
+        annotator_files (list): Further uploaded files, the agreement of all the files is measured together.
+        intervals (bool): Add bootstrap and jackknife confidence intervals of the accuracy and kappa.
+
+    Returns:
+        dict: The comparison frame and metrics tables.
+    """
+    comparison = Comparison(ground_truth_file, comparison_file, duplicate_policy=duplicate_policy,
+                            group_columns=group_columns)
+
+    # To check if both dataframes are empty and contains any empty rows, then drop mismatched IDs
+    logging.info(f":hourglass: Validating files to check for empty file, empty rows and column names")
+    st.write(f":hourglass: Validating files to check for empty file, empty rows and column names")
+    comparison.validated
+
+    if comparison.validation_report.empty:
+        logging.info(f"Files Validated - All Good!")
+        st.write(f":white_check_mark: Files Validated - All Good!")
+    else:
+        message = f"Files Validated - {len(comparison.validation_report)} problems found, see the validation report"
+        logging.info(message)
+        st.write(f":warning: {message}")
+
+    for name, duplicate_rows in zip(["Prediction X", "Prediction Y"], comparison.duplicate_rows):
+        if duplicate_rows:
+            message = f"{duplicate_rows} rows of {name} shared an id and comment, resolved with '{duplicate_policy}'"
+            logging.info(message)
+            st.write(f":warning: {message}")
+
+    if not comparison.dropped_ids.empty:
+        dropped_rows = comparison.dropped_ids['Rows'].sum()
+        logging.info(f"{dropped_rows} rows with IDs missing from the other file were removed")
+        st.write(f":warning: {dropped_rows} rows with IDs missing from the other file were removed")
+
+    logging.info(f"Merging files - creating prediction_x and prediction_y columns")
+    st.write(f":hourglass: Merging files - creating prediction_x and prediction_y columns")
+    comparison.merged
+
+    logging.info(f"Retrieving differences in label predictions")
+    st.write(f":hourglass: Retrieving differences in label predictions")
+    if comparison.differences is None:
+        st.write(f":white_check_mark: Great, Columns match!")
+
+    logging.info(f":hourglass: Retrieving prediction metrics")
+    st.write(f":hourglass: Retrieving prediction metrics")
+
+    if intervals:
+        logging.info(f":hourglass: Resampling the comparison for confidence intervals")
+        st.write(f":hourglass: Resampling the comparison for confidence intervals")
+
+    # Agreement of every annotator, reusing the two DataFrames already read
+    multi_comparison = None
+    if annotator_files:
+        logging.info(f":hourglass: Measuring the agreement of {len(annotator_files) + 2} annotators")
+        st.write(f":hourglass: Measuring the agreement of {len(annotator_files) + 2} annotators")
+        files = [ground_truth_file, comparison_file] + list(annotator_files)
+        multi_comparison = MultiComparison(comparison.dataframes + list(annotator_files),
+                                           names=[annotator_name(file, number) for number, file in enumerate(files)],
+                                           duplicate_policy=duplicate_policy)
+
+    return {
+        "compare_files": comparison.compared,
+        "metrics": comparison.metrics,
+        "confidence_intervals": comparison.confidence_intervals if intervals else None,
+        "label_metrics": comparison.label_metrics,
+        "label_substitutions": comparison.label_substitutions,
+        "grouped_metrics": comparison.grouped_metrics if group_columns else None,
+        "dropped_ids": comparison.dropped_ids,
+        "validation_report": comparison.validation_report,
+        "index": comparison.index,
+        "annotator_metrics": None if multi_comparison is None else multi_comparison.metrics,
+        "pairwise_kappa": None if multi_comparison is None else multi_comparison.pairwise_kappa,
+    }
+
+
+def export_results(results, ground_truth_file, comparison_file):
+    """
+    Builds the CSV downloads, with the prediction columns named after the uploaded files.
+
+    The Excel and Parquet downloads are built separately, only once they are requested.
+
+    Returns:
+        dict: The renamed comparison frame and the download contents.
+    """
+    # Rename prediction columns to file name, on a copy so the cached frame keeps its column names
+    compare_files = rename_columns(results["compare_files"].copy(), ground_truth_file, comparison_file)
+
+    with stage("export_csv", rows=len(compare_files)):
+        compare_file_results_csv = compare_files.to_csv(index=False)
+
+    grouped = results["grouped_metrics"]
+    annotator_metrics = results["annotator_metrics"]
+    intervals = results["confidence_intervals"]
+
+    return {
+        "compare_files": compare_files,
+        "csv": compare_file_results_csv,
+        "metrics_csv": results["metrics"].to_csv(index=False),
+        "confidence_intervals_csv": None if intervals is None else intervals.to_csv(index=False),
+        "label_metrics_csv": results["label_metrics"].to_csv(index=False),
+        "label_substitutions_csv": results["label_substitutions"].to_csv(index=False),
+        "grouped_metrics_csv": None if grouped is None else grouped.to_csv(index=False),
+        "dropped_ids_csv": results["dropped_ids"].to_csv(index=False),
+        "annotator_metrics_csv": None if annotator_metrics is None else annotator_metrics.to_csv(index=False),
+        "pairwise_kappa_csv": None if annotator_metrics is None else results["pairwise_kappa"].to_csv(),
+        "validation_report_csv": results["validation_report"].to_csv(index=False),
+    }
+
+
 if __name__ == "__main__":
     st.title("Agreement Checker")
     st.markdown(f""":sparkles: This tool compares two sets of processed data, 'X' serving as the ground truth and 'Y' as
@@ -30,90 +182,235 @@ if __name__ == "__main__":
     if 'compare_data' not in st.session_state:
         st.session_state.compare_data = False
 
-    ground_truth_file = st.sidebar.file_uploader("Prediction X: Ground-Truth Dataset", type=["csv"])
-    comparison_file = st.sidebar.file_uploader("Prediction Y: Comparison Dataset", type=["csv"])
+    ground_truth_file = st.sidebar.file_uploader("Prediction X: Ground-Truth Dataset",
+                                                 type=["csv", "parquet", "feather", "arrow"])
+    comparison_file = st.sidebar.file_uploader("Prediction Y: Comparison Dataset",
+                                               type=["csv", "parquet", "feather", "arrow"])
+    duplicate_policy = st.sidebar.selectbox("Rows Sharing an ID and Comment", DUPLICATE_POLICIES,
+                                            format_func=DUPLICATE_POLICY_NAMES.get, help=DUPLICATE_POLICY_HELP)
+
+    # Any other column of the ground-truth file, such as a channel or an annotator, can break the metrics down
+    group_options = []
+    if ground_truth_file is not None:
+        try:
+            group_options = [column for column in file_columns(ground_truth_file) if column not in REQUIRED_COLUMNS]
+        except ValueError:
+            # Such as an empty file, reported when the files are compared
+            ground_truth_file.seek(0)
+    group_columns = st.sidebar.multiselect("Group Metrics By", group_options)
+
+    # Files of more annotators of the same comments, measured together with X and Y
+    annotator_files = st.sidebar.file_uploader("Additional Annotator Datasets",
+                                               type=["csv", "parquet", "feather", "arrow"], accept_multiple_files=True)
+    intervals = st.sidebar.checkbox("Confidence Intervals for Accuracy and Kappa")
     compare_data_button = st.sidebar.button("Compare Data")
 
     if compare_data_button and ground_truth_file is not None and comparison_file is not None:
-        # Returns both csv files as dataframes
-        gt_df = pd.read_csv(ground_truth_file)
-        comp_df = pd.read_csv(comparison_file)
-        dataframes = [gt_df, comp_df]
-
-        # To check if both dataframes are empty and contains any empty rows
-        logging.info(f":hourglass: Validating files to check for empty file, empty rows and column names")
-        st.write(f":hourglass: Validating files to check for empty file, empty rows and column names")
-        for df in dataframes:
-            empty_df_check = validate_empty_file(df)
-            empty_rows_check = validate_empty_rows(df)
-            file_column_check = validate_file_column(df)
+        # Reuse the results of any earlier comparison of the same two files
+        result_cache = get_result_cache()
+        options = {"duplicate_policy": duplicate_policy, "group_columns": group_columns, "intervals": intervals}
+        cache_key = result_key(ground_truth_file, comparison_file, *annotator_files, options=options)
+        results = result_cache.get(cache_key)
 
-        logging.info(f"Files Validated - All Good!")
-        st.write(f":white_check_mark: Files Validated - All Good!")
+        # Record the time and memory of every stage of this run
+        with recording() as recorder:
+            if results is None:
+                try:
+                    results = compare_uploaded_files(ground_truth_file, comparison_file, duplicate_policy,
+                                                     group_columns, annotator_files, intervals)
+                except (ValueError, AssertionError) as error:
+                    # Such as rows sharing an id and comment under the 'Stop with an error' policy, or an empty
+                    # file, which the validators report with an AssertionError
+                    logging.error(f"Comparison failed: {error}")
+                    st.error(f":x: {error}")
+                    st.stop()
+                result_cache.put(cache_key, results)
+            else:
+                logging.info(f"Reusing the cached comparison of these files")
+                st.write(f":zap: Reusing the cached comparison of these files")
 
-        logging.info(f"Checking for mismatched IDs - both datasets need to have the same IDs present")
-        st.write(f":hourglass: Checking for mismatched IDs - both datasets need to have the same IDs present")
-        id_check = validate_ids(gt_df, comp_df)
+            exports = export_results(results, ground_truth_file, comparison_file)
 
-        logging.info(f"Merging files - creating prediction_x and prediction_y columns")
-        st.write(f":hourglass: Merging files - creating prediction_x and prediction_y columns")
+        # Keep the results for the reruns Streamlit does on every interaction, such as downloads
+        st.session_state.compare_data = True
+        st.session_state.results = results
+        st.session_state.exports = exports
+        st.session_state.stage_records = recorder.frame()
 
-        # Merging the two files into one - producing columns prediction_x and prediction_y
-        merged_df = merge_df(gt_df, comp_df)
+    if st.session_state.compare_data:
+        results = st.session_state.results
+        exports = st.session_state.exports
 
-        logging.info(f"Retrieving differences in label predictions")
-        st.write(f":hourglass: Retrieving differences in label predictions")
-        logging.info(f":hourglass: Retrieving prediction metrics")
-        st.write(f":hourglass: Retrieving prediction metrics")
+        # Display the time and memory of every stage
+        with st.expander("Stage Timings", expanded=False):
+            st.dataframe(st.session_state.stage_records)
+            st.caption("CPU time of this session's thread, memory is the peak of the whole app process")
 
-        # Comparing the two dataframes to find the rows with differences in the prediction columns
-        compare_files = compare_prediction_columns(gt_df, comp_df)
+        # Display metrics table
+        with st.expander("Metrics Table", expanded=False):
+            st.table(results["metrics"])
 
-        # Grab prediction_differences column and compute metrics
-        metrics_df = predictions_metrics(compare_files)
+        # Display how far the accuracy and kappa could move with another sample of comments
+        if results["confidence_intervals"] is not None:
+            with st.expander("Confidence Intervals", expanded=False):
+                st.dataframe(results["confidence_intervals"], hide_index=True)
+                st.caption("95% intervals from bootstrap resamples and the delete-one jackknife")
 
-        # Rename prediction columns to file name
-        renamed_columns = rename_columns(compare_files, ground_truth_file, comparison_file)
+        # Display the metrics of every group
+        if results["grouped_metrics"] is not None:
+            with st.expander("Grouped Metrics Table", expanded=False):
+                st.dataframe(results["grouped_metrics"], hide_index=True)
 
-        # Display metrics table
-        with st.expander("Metrics Table", expanded=False):
-            st.table(metrics_df)
+        # Display the agreement of every annotator
+        if results["annotator_metrics"] is not None:
+            with st.expander("Multi-Annotator Agreement", expanded=False):
+                st.table(results["annotator_metrics"])
+                st.dataframe(results["pairwise_kappa"])
+                st.caption("Cohen's kappa of every pair of annotators, over the comments both labelled")
+
+        # Display per-label metrics table
+        with st.expander("Per-Label Metrics Table", expanded=False):
+            st.dataframe(results["label_metrics"])
+
+        # Display which X label became which Y label, most frequent first
+        with st.expander("Label Substitutions Table", expanded=False):
+            st.dataframe(results["label_substitutions"].head(LABEL_SUBSTITUTIONS_SHOWN), hide_index=True)
+            st.caption(f"Showing the {min(LABEL_SUBSTITUTIONS_SHOWN, len(results['label_substitutions']))} most "
+                       f"frequent of {len(results['label_substitutions'])} substitutions")
 
         logging.info(f"Process Complete - Please see prediction differences & metrics table below:")
 
         st.write(f":white_check_mark: Process Complete - Please see prediction differences below:")
 
-        # Download metrics table
-        metrics_results = metrics_df.to_csv(index=False)
-
-        # Display Comparison table
+        # Display Comparison table, one filtered page at a time so only that page is sent to the browser
         with st.expander("Comparison Table", expanded=False):
-            st.table(compare_files)
-        compare_file_results_csv = compare_files.to_csv(index=False)
+            index = results["index"]
+            filter_types, filter_labels, filter_search = st.columns(3)
+            types = filter_types.multiselect("Type", index.types)
+            labels = filter_labels.multiselect("Labels", index.labels)
+            search = filter_search.text_input("Comment Contains")
+            rows = index.filter(types=types, labels=labels, search=search)
 
-        with pd.ExcelWriter('prediction_differences.xlsx') as writer:
-            compare_files.to_excel(writer, index=False)
+            page_size_column, page_column = st.columns(2)
+            page_size = page_size_column.selectbox("Rows per Page", [25, 50, 100, 500], index=1)
+            page_count = index.page_count(rows, page_size)
+            page = page_column.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+
+            st.dataframe(index.page(rows, page, page_size, frame=exports["compare_files"]), hide_index=True)
+            first_row = min((page - 1) * page_size + 1, len(rows))
+            st.caption(f"Showing rows {first_row}-{min(page * page_size, len(rows))} of {len(rows)} matching rows "
+                       f"({len(index)} in total)")
 
         st.download_button(
             label="Download Prediction Differences - CSV",
-            data=compare_file_results_csv,
+            data=exports["csv"],
             file_name="prediction_differences.csv",
             mime="text/csv",
             key="download-csv",
         )
 
-        st.download_button(
-            label="Download Prediction Differences - XLS",
-            data=open('prediction_differences.xlsx', 'rb'),
-            file_name="prediction_differences.xls",
-            mime="application/vnd.ms-excel",
-            key="download-xls",
-        )
+        # The workbook is slow to build for large comparisons, so it is only built when asked for, in memory
+        if "xlsx" not in exports and st.button("Prepare Prediction Differences - Excel", key="prepare-xlsx"):
+            with st.spinner("Building the Excel workbook"):
+                exports["xlsx"] = excel_bytes(exports["compare_files"])
+
+        if "xlsx" in exports:
+            st.download_button(
+                label="Download Prediction Differences - Excel",
+                data=exports["xlsx"],
+                file_name="prediction_differences.xlsx",
+                mime=EXCEL_MIME,
+                key="download-xlsx",
+            )
+
+        # The Parquet file is written from the frame before its columns were renamed, with the parsed label columns
+        if "parquet" not in exports and st.button("Prepare Prediction Differences - Parquet", key="prepare-parquet"):
+            with st.spinner("Building the Parquet file"):
+                compare_file_results_parquet = io.BytesIO()
+                save_comparison(results["compare_files"], compare_file_results_parquet, file_format="parquet")
+                exports["parquet"] = compare_file_results_parquet.getvalue()
+
+        if "parquet" in exports:
+            st.download_button(
+                label="Download Prediction Differences - Parquet",
+                data=exports["parquet"],
+                file_name="prediction_differences.parquet",
+                mime="application/vnd.apache.parquet",
+                key="download-parquet",
+            )
 
         st.download_button(
             label="Download Metric Results - CSV",
-            data=metrics_results,
+            data=exports["metrics_csv"],
             file_name="prediction_metrics.csv",
             mime="text/csv",
             key="download csv",
         )
+
+        if results["confidence_intervals"] is not None:
+            st.download_button(
+                label="Download Confidence Intervals - CSV",
+                data=exports["confidence_intervals_csv"],
+                file_name="confidence_intervals.csv",
+                mime="text/csv",
+                key="download-confidence-intervals-csv",
+            )
+
+        if results["grouped_metrics"] is not None:
+            st.download_button(
+                label="Download Grouped Metric Results - CSV",
+                data=exports["grouped_metrics_csv"],
+                file_name="grouped_metrics.csv",
+                mime="text/csv",
+                key="download-grouped-metrics-csv",
+            )
+
+        if results["annotator_metrics"] is not None:
+            st.download_button(
+                label="Download Multi-Annotator Agreement - CSV",
+                data=exports["annotator_metrics_csv"],
+                file_name="annotator_agreement.csv",
+                mime="text/csv",
+                key="download-annotator-metrics-csv",
+            )
+            st.download_button(
+                label="Download Pairwise Kappa - CSV",
+                data=exports["pairwise_kappa_csv"],
+                file_name="pairwise_kappa.csv",
+                mime="text/csv",
+                key="download-pairwise-kappa-csv",
+            )
+
+        st.download_button(
+            label="Download Per-Label Metric Results - CSV",
+            data=exports["label_metrics_csv"],
+            file_name="label_metrics.csv",
+            mime="text/csv",
+            key="download-label-metrics-csv",
+        )
+
+        st.download_button(
+            label="Download Label Substitutions - CSV",
+            data=exports["label_substitutions_csv"],
+            file_name="label_substitutions.csv",
+            mime="text/csv",
+            key="download-label-substitutions-csv",
+        )
+
+        if not results["dropped_ids"].empty:
+            st.download_button(
+                label="Download Dropped IDs - CSV",
+                data=exports["dropped_ids_csv"],
+                file_name="dropped_ids.csv",
+                mime="text/csv",
+                key="download-dropped-ids-csv",
+            )
+
+        if not results["validation_report"].empty:
+            st.download_button(
+                label="Download Validation Report - CSV",
+                data=exports["validation_report_csv"],
+                file_name="validation_report.csv",
+                mime="text/csv",
+                key="download-validation-report-csv",
+            )
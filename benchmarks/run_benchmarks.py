@@ -0,0 +1,235 @@
+"""
+Times and memory-profiles every pipeline stage on synthetic data, and saves the results as JSON.
+
+    python -m benchmarks.run_benchmarks --rows 100000 200000 --output results.json
+    python -m benchmarks.run_benchmarks --compare old_results.json results.json
+
+Every stage is timed as the best of --repeat runs, then run once more under tracemalloc for its peak memory, so
+the profiling overhead does not show in the timings. The import time of the package's entry points is measured
+in fresh interpreters first.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import generate_pair, revise_predictions
+from level_agreement import __version__
+from level_agreement.validation.file_validation import validate_file_column, validate_empty_file, \
+    validate_empty_rows, validate_ids
+from level_agreement.validation.schema import FileSchema
+from level_agreement.merging.merging_df import merge_df, compare_prediction_columns
+from level_agreement.merging.incremental_compare import incremental_compare
+from level_agreement.merging.multi_annotator import join_annotators
+from level_agreement.output.multi_rater_metrics import agreement_metrics
+from level_agreement.output.output_file import predictions_metrics
+from level_agreement.output.label_metrics import label_transition_table
+from level_agreement.output.metrics_accumulator import MetricsAccumulator
+from level_agreement.output.confidence_intervals import confidence_intervals
+from level_agreement.output.columnar_file import save_comparison
+from level_agreement.output.excel_export import write_excel
+from level_agreement.upload.file_upload import load_file
+
+# Modules whose import time is tracked, the comparison pipeline and the command-line entry point
+IMPORT_MODULES = ["level_agreement.pipeline.comparison", "level_agreement.__main__"]
+
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+def measure(function, repeat=3):
+    """
+    Runs a function repeat times for its best wall time, then once under tracemalloc for its peak memory.
+
+    Returns:
+        tuple: (result of the last run, record with 'seconds' and 'peak_mb', or 'error' when it raised)
+    """
+    try:
+        # Some stages print their progress, which would interleave with the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                function()
+                seconds.append(time.perf_counter() - start)
+
+            tracemalloc.start()
+            try:
+                result = function()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        return None, {"error": f"{type(e).__name__}: {e}"}
+
+    return result, {"seconds": min(seconds), "peak_mb": peak / 1024 / 1024}
+
+
+def benchmark_pair(parameters, repeat=3):
+    """
+    Benchmarks every stage on one synthetic pair.
+
+    Args:
+        parameters (dict): Keyword arguments of generate_pair.
+        repeat (int): Number of timed runs of every stage.
+
+    Returns:
+        list: One record per stage, with the stage name, the number of input rows and its measurements.
+    """
+    df_x, df_y = generate_pair(**parameters)
+    records = []
+
+    def run(stage, function):
+        result, record = measure(function, repeat)
+        records.append({"stage": stage, "rows": len(df_x), **record})
+        print(f"  {stage:<28} " + (f"{record['seconds']:8.3f}s {record['peak_mb']:10.1f} MB" if "seconds" in record
+                                   else record["error"]), flush=True)
+        return result
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_x, file_y = os.path.join(directory, "x.csv"), os.path.join(directory, "y.csv")
+        df_x.to_csv(file_x, index=False)
+        df_y.to_csv(file_y, index=False)
+
+        loaded_x = run("load_file", lambda: load_file(file_x))
+        loaded_y = load_file(file_y)
+
+    # validate_empty_rows fills cells in place, so it gets a copy every run
+    run("validate_file_column", lambda: validate_file_column(loaded_x))
+    run("validate_empty_file", lambda: validate_empty_file(loaded_x))
+    run("validate_empty_rows", lambda: validate_empty_rows(loaded_x.copy()))
+    run("FileSchema.validate", lambda: FileSchema().validate(loaded_x))
+    run("validate_ids", lambda: validate_ids(loaded_x, loaded_y))
+    run("merge_df", lambda: merge_df(loaded_x, loaded_y))
+    compared = run("compare_prediction_columns", lambda: compare_prediction_columns(loaded_x, loaded_y))
+
+    # Re-comparing after 1% of the comparison rows were revised, against a snapshot of the first comparison
+    snapshot = incremental_compare(loaded_x, loaded_y)
+    revised_y = revise_predictions(loaded_y, 0.01, parameters.get("seed", 0))
+    run("incremental_compare", lambda: incremental_compare(loaded_x, revised_y, snapshot))
+
+    # Agreement of three annotators, the revised predictions standing in for the third
+    annotations = run("join_annotators", lambda: join_annotators([loaded_x, loaded_y, revised_y]))
+    run("agreement_metrics", lambda: agreement_metrics(annotations))
+
+    if compared is not None:
+        run("predictions_metrics", lambda: predictions_metrics(compared))
+        run("label_transition_table", lambda: label_transition_table(compared))
+        counts = MetricsAccumulator().update(compared)
+        run("confidence_intervals", lambda: confidence_intervals(counts, resamples=1000))
+        run("export_csv", lambda: compared.to_csv(index=False))
+        run("export_excel", lambda: write_excel(compared))
+        run("export_parquet", lambda: save_comparison(compared, io.BytesIO(), file_format="parquet"))
+
+    return records
+
+
+def benchmark_imports(modules=IMPORT_MODULES, repeat=3):
+    """
+    Times importing every module in a fresh interpreter, as a cold start of the app or the CLI would.
+
+    Returns:
+        list: One record per module, with the best import time of repeat interpreters.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")]))}
+
+    records = []
+    for module in modules:
+        try:
+            seconds = min(float(subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(module=module)],
+                                               capture_output=True, text=True, check=True, env=env).stdout)
+                          for _ in range(repeat))
+            record = {"seconds": seconds}
+            print(f"  import {module:<40} {seconds:8.3f}s", flush=True)
+        except subprocess.CalledProcessError as e:
+            record = {"error": e.stderr.strip().splitlines()[-1]}
+            print(f"  import {module:<40} {record['error']}", flush=True)
+        records.append({"stage": f"import {module}", "rows": None, **record})
+    return records
+
+
+def environment():
+    return {
+        "level_agreement": __version__,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare_results(old_path, new_path):
+    """
+    Prints the time and peak memory ratio of every stage between two result files.
+    """
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+
+    def table(results):
+        rows = [{"parameters": json.dumps(run["parameters"], sort_keys=True), **record}
+                for run in results["runs"] for record in run["stages"]]
+        return pd.DataFrame(rows).set_index(["parameters", "stage"])
+
+    joined = table(old).join(table(new), lsuffix=" old", rsuffix=" new", how="outer")
+    for column in ["seconds", "peak_mb"]:
+        if f"{column} old" in joined and f"{column} new" in joined:
+            joined[f"{column} ratio"] = joined[f"{column} new"] / joined[f"{column} old"]
+
+    print(f"{old['environment']['level_agreement']} -> {new['environment']['level_agreement']}")
+    columns = [column for column in joined.columns if column.startswith(("seconds", "peak_mb"))]
+    print(joined[columns].round(3).to_string())
+    return joined
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run_benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--comment-length", type=int, nargs="+", default=[120])
+    parser.add_argument("--vocabulary-size", type=int, nargs="+", default=[200])
+    parser.add_argument("--labels-per-row", type=int, nargs="+", default=[3])
+    parser.add_argument("--disagreement-rate", type=float, nargs="+", default=[0.1])
+    parser.add_argument("--id-mismatch-rate", type=float, nargs="+", default=[0.01])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of every stage (default: %(default)s)")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file (default: %(default)s)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.compare:
+        compare_results(*args.compare)
+        return 0
+
+    # Every combination of the varied parameters is one run
+    names = ["rows", "comment_length", "vocabulary_size", "labels_per_row", "disagreement_rate", "id_mismatch_rate"]
+    print("imports", flush=True)
+    runs = [{"parameters": {"imports": IMPORT_MODULES}, "stages": benchmark_imports(repeat=args.repeat)}]
+    for values in itertools.product(*[getattr(args, name) for name in names]):
+        parameters = dict(zip(names, values))
+        parameters["seed"] = args.seed
+        print(json.dumps(parameters), flush=True)
+        runs.append({"parameters": parameters, "stages": benchmark_pair(parameters, args.repeat)})
+
+    with open(args.output, "w") as output:
+        json.dump({"environment": environment(), "runs": runs}, output, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
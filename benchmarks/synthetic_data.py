@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+# Characters synthetic comments are made of, spaces included so comments have words
+COMMENT_CHARACTERS = np.frombuffer(b"abcdefghijklmnopqrstuvwxyz     ", dtype="S1")
+
+
+def label_vocabulary(size):
+    """
+    Returns label names shaped like the real ones, 'category.topic.sentiment'.
+    """
+    sentiments = np.array(["-1", "0", "1"])
+    return np.array([f"category-{i // 30}.topic-{i}.{sentiments[i % 3]}" for i in range(size)])
+
+
+def random_comments(rng, rows, length):
+    """
+    Returns random comments of a fixed length, built as one character array.
+    """
+    characters = rng.choice(COMMENT_CHARACTERS, size=(rows, length))
+    return characters.view(f"S{length}").ravel().astype(str)
+
+
+def _unused_label(rng, labels, vocabulary_size):
+    """
+    Draws a label that is not in a row's labels.
+    """
+    while True:
+        label = int(rng.integers(vocabulary_size))
+        if label not in labels:
+            return label
+
+
+def format_predictions(vocabulary, label_sets):
+    """
+    Formats label sets as the prediction list strings of the uploaded files.
+    """
+    quoted = [f"'{label}'" for label in vocabulary]
+    return ["[" + ", ".join([quoted[label] for label in labels]) + "]" for labels in label_sets]
+
+
+def generate_pair(rows=100_000, comment_length=120, vocabulary_size=200, labels_per_row=3, disagreement_rate=0.1,
+                  id_mismatch_rate=0.01, seed=0):
+    """
+    Generates a ground-truth and a comparison DataFrame with 'id', 'comment' and 'prediction' columns.
+
+    The same seed always gives the same pair.
+
+    Args:
+        rows (int): Number of rows in each DataFrame.
+        comment_length (int): Number of characters of every comment.
+        vocabulary_size (int): Number of distinct labels.
+        labels_per_row (int): Average number of labels of a prediction, each row draws between 0 and
+            twice as many, repeated draws are dropped.
+        disagreement_rate (float): Share of comparison rows whose labels differ from the ground truth, by an added,
+            a removed or a replaced label.
+        id_mismatch_rate (float): Share of comparison rows whose id is missing from the ground truth.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        tuple: (ground-truth DataFrame, comparison DataFrame)
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = label_vocabulary(vocabulary_size)
+
+    # Step 1: Ground-truth label sets, without repeated labels within a row
+    counts = rng.integers(0, 2 * labels_per_row + 1, size=rows)
+    draws = rng.integers(vocabulary_size, size=(rows, 2 * labels_per_row))
+    labels_x = [list(dict.fromkeys(labels[:count])) for labels, count in zip(draws.tolist(), counts.tolist())]
+
+    # Step 2: Change one label of the disagreeing rows
+    labels_y = list(labels_x)
+    for row in np.flatnonzero(rng.random(rows) < disagreement_rate):
+        labels = labels_x[row]
+        change = rng.integers(3) if len(labels) else 0
+        if change == 1:
+            labels_y[row] = labels[:-1]
+        elif len(labels) < vocabulary_size:
+            unused = _unused_label(rng, labels, vocabulary_size)
+            labels_y[row] = labels + [unused] if change == 0 else labels[:-1] + [unused]
+
+    # Step 3: Give the mismatching comparison rows ids the ground truth does not have
+    ids = rng.permutation(np.arange(rows) * 10 + rng.integers(10, size=rows))
+    ids_y = ids.copy()
+    mismatched = rng.random(rows) < id_mismatch_rate
+    ids_y[mismatched] = rows * 10 + np.arange(mismatched.sum())
+
+    comments = random_comments(rng, rows, comment_length)
+    df_x = pd.DataFrame({"id": ids, "comment": comments, "prediction": format_predictions(vocabulary, labels_x)})
+    df_y = pd.DataFrame({"id": ids_y, "comment": comments, "prediction": format_predictions(vocabulary, labels_y)})
+
+    # The comparison file lists the rows in another order
+    return df_x, df_y.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def revise_predictions(df, revision_rate=0.01, seed=0):
+    """
+    Returns a copy of a DataFrame with the predictions of a share of its rows swapped among themselves, as an
+    annotator revising a batch of rows in place would.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(df), int(len(df) * revision_rate), replace=False)
+    revised = df.copy()
+    revised.loc[rows, 'prediction'] = df['prediction'].to_numpy()[rng.permutation(rows)]
+    return revised
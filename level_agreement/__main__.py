@@ -0,0 +1,66 @@
+"""
+Compares many pairs of prediction files without the Streamlit app.
+
+    python -m level_agreement manifest.csv --output results/ --workers 8
+
+The manifest is a CSV with an 'x' column for the ground-truth files, a 'y' column for the comparison files and
+an optional 'name' column. Every pair's diff file and one 'metrics.csv' for all pairs are written to the output
+directory.
+"""
+import argparse
+import logging
+import sys
+
+from level_agreement.pipeline.batch import read_manifest, run_batch, DIFF_FORMATS
+from level_agreement.validation.duplicate_keys import DUPLICATE_POLICIES
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog="python -m level_agreement",
+                                     description="Compare pairs of prediction files listed in a manifest.")
+    parser.add_argument("manifest", help="CSV with 'x' and 'y' columns and an optional 'name' column")
+    parser.add_argument("--output", default="level_agreement_results",
+                        help="directory for the diff files and metrics.csv (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPU cores)")
+    parser.add_argument("--duplicates", choices=DUPLICATE_POLICIES, default="error",
+                        help="how rows sharing an id and comment are resolved, 'error' fails the pair where earlier "
+                             "versions multiplied such rows in the merge (default: %(default)s)")
+    parser.add_argument("--format", choices=DIFF_FORMATS, default="csv", dest="diff_format",
+                        help="format of the diff files (default: %(default)s)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep a snapshot of every pair and only compare the rows changed since the last run")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="RESAMPLES",
+                        help="add 95%% bootstrap intervals of the accuracy and kappa from this many resamples "
+                             "(default: none)")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(message)s",
+        level=logging.INFO,
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
+    try:
+        manifest = read_manifest(args.manifest)
+        metrics, summary = run_batch(manifest, args.output, workers=args.workers, duplicate_policy=args.duplicates,
+                                     diff_format=args.diff_format, incremental=args.incremental,
+                                     resamples=args.bootstrap)
+    except ValueError as e:
+        # A manifest that cannot be run at all, errors of single pairs are reported in metrics.csv instead
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    print(f"Compared {summary['Pairs']} pairs ({summary['Failed Pairs']} failed) and {summary['Total Rows']:,} rows "
+          f"in {summary['Seconds']:.2f}s: {summary['Pairs per Second']:.2f} pairs/s, "
+          f"{summary['Rows per Second']:,.0f} rows/s")
+    print(f"Metrics written to {args.output}/metrics.csv")
+
+    return 1 if summary["Failed Pairs"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from level_agreement import __version__
+
+# Memory or disk budget used when none is given, in megabytes
+DEFAULT_MAX_MB = 1024
+
+
+def file_digest(file):
+    """
+    Returns the SHA-256 hex digest of a file's bytes.
+
+    Args:
+        file: A file path, an uploaded file or bytes.
+
+    Returns:
+        str: Hex digest of the content.
+    """
+    digest = hashlib.sha256()
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        digest.update(file)
+    elif hasattr(file, "getbuffer"):
+        digest.update(file.getbuffer())
+    else:
+        with open(file, "rb") as content:
+            for block in iter(lambda: content.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def result_key(*files, options=None):
+    """
+    Builds a cache key from the content of the input files, the tool version and any options.
+
+    Args:
+        *files: File paths, uploaded files or bytes, in order.
+        options (dict): Settings that change the result.
+
+    Returns:
+        str: Cache key.
+    """
+    parts = [__version__] + [file_digest(file) for file in files] + [repr(sorted((options or {}).items()))]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def _size_of(value):
+    """
+    Estimates the memory held by a cached value.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sum(_size_of(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_size_of(item) for item in value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if hasattr(value, "nbytes"):
+        # Arrays, and objects holding arrays such as a ComparisonIndex
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    Least-recently-used cache of comparison results, keyed by result_key.
+
+    Entries live in memory, or in a directory when one is given so results survive restarts and can be
+    shared by several app processes. The least recently used entries are evicted once the total size goes
+    over the budget. The cache is safe to share between Streamlit sessions, which run in separate threads.
+
+    Args:
+        max_mb (float): Memory or disk budget, in megabytes.
+        directory (str): Directory for on-disk entries. Defaults to keeping entries in memory.
+    """
+
+    def __init__(self, max_mb=DEFAULT_MAX_MB, directory=None):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            # Pick up entries written earlier, oldest first
+            paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".pkl")]
+            for path in sorted(paths, key=os.path.getatime):
+                self._entries[os.path.basename(path)[:-4]] = (None, os.path.getsize(path))
+
+    @property
+    def size(self):
+        """
+        Total size of the cached entries, in bytes.
+        """
+        return sum(size for _, size in self._entries.values())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        """
+        Returns the cached value for a key, or None when it is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if self.directory is None:
+            return entry[0] if entry is not None else None
+
+        # On disk, the entry may also have been written or evicted by another process
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cached:
+                size = os.fstat(cached.fileno()).st_size
+                value = pickle.load(cached)
+        except (EOFError, pickle.UnpicklingError, OSError):
+            # Missing, truncated or corrupt entries are misses, and a damaged file is removed for the next put
+            with self._lock:
+                self._entries.pop(key, None)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        if entry is None:
+            with self._lock:
+                self._entries[key] = (None, size)
+        return value
+
+    def put(self, key, value):
+        """
+        Caches a value, evicting the least recently used entries to stay within the budget.
+        """
+        if self.directory is None:
+            entry = (value, _size_of(value))
+        else:
+            # Every writer gets its own temporary file, so sessions storing the same key at once cannot truncate
+            # each other's file, and whichever replaces the entry last wins with an equal value
+            descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, prefix=f"{key}.", suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "wb") as temporary:
+                    pickle.dump(value, temporary, protocol=pickle.HIGHEST_PROTOCOL)
+                size = os.path.getsize(temporary_path)
+                os.replace(temporary_path, self._path(key))
+            except BaseException:
+                try:
+                    os.remove(temporary_path)
+                except OSError:
+                    pass
+                raise
+            entry = (None, size)
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            # Always keep the newest entry, even when it is bigger than the budget on its own
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                evicted, _ = self._entries.popitem(last=False)
+                if self.directory is not None:
+                    try:
+                        os.remove(self._path(evicted))
+                    except FileNotFoundError:
+                        pass
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for a key, computing and caching it first when missing.
+
+        Args:
+            key (str): Key built by result_key.
+            compute (callable): Function returning the value.
+
+        Returns:
+            The cached or computed value.
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
@@ -0,0 +1,138 @@
+import logging
+import math
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+from level_agreement.merging.merging_df import join_predictions, compare_merged_predictions
+from level_agreement.upload.file_upload import COLUMN_DTYPES
+
+logger = logging.getLogger(__name__)
+
+# Memory budget used when none is given, in megabytes
+DEFAULT_MEMORY_LIMIT_MB = 512
+
+# Types of the spilled columns, the same in every chunk of both files. Ids are kept as written, so a chunk of
+# numeric ids hashes to the same partitions as a chunk where text or missing ids make the column strings
+SPILL_DTYPES = {**COLUMN_DTYPES, "id": str}
+
+# Rough ratio between the in-memory size of a loaded, merged and compared partition and its CSV size
+MEMORY_PER_CSV_BYTE = 4
+
+
+def partition_by_id(dataframe, partitions):
+    """
+    Assigns every row to a partition by hashing its id, so equal ids always land in the same partition.
+
+    Args:
+        dataframe (pd.DataFrame): DataFrame with an 'id' column.
+        partitions (int): Number of partitions.
+
+    Returns:
+        np.ndarray: Partition number of every row.
+    """
+    return (pd.util.hash_pandas_object(dataframe['id'], index=False).to_numpy() % partitions).astype(int)
+
+
+def _spill(file_path, spill_files, chunk_rows, partitions):
+    """
+    Reads a CSV file in chunks and appends every chunk's rows to the spill file of their partition.
+    """
+    for chunk in pd.read_csv(file_path, chunksize=chunk_rows, dtype=SPILL_DTYPES):
+        for partition, rows in chunk.groupby(partition_by_id(chunk, partitions), sort=False):
+            with open(spill_files[partition], 'ab') as spill_file:
+                pickle.dump(rows, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_spill(spill_file):
+    """
+    Reads back every chunk appended to a spill file as one DataFrame.
+    """
+    if not os.path.exists(spill_file):
+        return None
+
+    chunks = []
+    with open(spill_file, 'rb') as spill:
+        while True:
+            try:
+                chunks.append(pickle.load(spill))
+            except EOFError:
+                break
+    return pd.concat(chunks, ignore_index=True)
+
+
+def chunked_compare(file_path_1, file_path_2, output_path, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB,
+                    chunk_rows=None, spill_dir=None, comment_fingerprint=None, metrics=None):
+    """
+    Merges and compares two CSV files that may not fit in memory, writing the comparison to a CSV file.
+
+    Both inputs are read in bounded chunks and hash-partitioned by id into spill files on disk. Each partition
+    is then joined and compared on its own, and its rows are appended to output_path. The number of
+    partitions is chosen so that a single partition stays within memory_limit_mb.
+
+    Rows are written partition by partition, so their order differs from compare_prediction_columns. Ids are
+    read as text in every chunk of both files, so they match as written, see SPILL_DTYPES.
+
+    Args:
+        file_path_1 (str): Path to the ground-truth CSV file.
+        file_path_2 (str): Path to the comparison CSV file.
+        output_path (str): Path of the CSV file the comparison is written to.
+        memory_limit_mb (int): Memory budget for one chunk or partition, in megabytes.
+        chunk_rows (int): Number of rows read at a time. Defaults to a size estimated from memory_limit_mb.
+        spill_dir (str): Directory for the temporary spill files. Defaults to the system temp directory.
+        comment_fingerprint (int): Join on a 64 or 128-bit fingerprint of the comment instead of its text.
+        metrics (MetricsAccumulator): Accumulator updated with every compared partition.
+
+    Returns:
+        dict: Number of partitions, compared rows and rows with differences.
+    """
+    memory_limit = int(memory_limit_mb * 1024 * 1024)
+    input_size = os.path.getsize(file_path_1) + os.path.getsize(file_path_2)
+
+    # Step 1: Pick enough partitions for one partition of both files to fit in the budget
+    partitions = max(1, math.ceil(input_size * MEMORY_PER_CSV_BYTE / memory_limit))
+    if chunk_rows is None:
+        sample = pd.read_csv(file_path_1, nrows=1000)
+        row_size = max(1, sample.memory_usage(deep=True).sum() // max(len(sample), 1))
+        chunk_rows = int(max(1, memory_limit // (MEMORY_PER_CSV_BYTE * row_size)))
+
+    logger.info(f"Comparing in {partitions} partitions of up to {memory_limit_mb} MB, reading {chunk_rows} rows at a time")
+
+    summary = {"Partitions": partitions, "Total Rows": 0, "Total Differences": 0}
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    with tempfile.TemporaryDirectory(dir=spill_dir) as spill_path:
+        # Step 2: Spill both files to disk, one file per partition and side
+        spill_files_1 = [os.path.join(spill_path, f"x_{partition}.pkl") for partition in range(partitions)]
+        spill_files_2 = [os.path.join(spill_path, f"y_{partition}.pkl") for partition in range(partitions)]
+        _spill(file_path_1, spill_files_1, chunk_rows, partitions)
+        _spill(file_path_2, spill_files_2, chunk_rows, partitions)
+
+        # Step 3: Join and compare one partition at a time, streaming the rows to the output file
+        for spill_file_1, spill_file_2 in zip(spill_files_1, spill_files_2):
+            df1 = _read_spill(spill_file_1)
+            df2 = _read_spill(spill_file_2)
+            if df1 is None or df2 is None:
+                continue
+
+            merged_file = join_predictions(df1, df2, comment_fingerprint)
+            if merged_file.empty:
+                continue
+
+            merged_file = compare_merged_predictions(merged_file)
+            merged_file.to_csv(output_path, mode='a', index=False, header=summary["Total Rows"] == 0)
+
+            if metrics is not None:
+                metrics.update(merged_file)
+
+            summary["Total Rows"] += len(merged_file)
+            summary["Total Differences"] += int(merged_file['differences'].sum())
+
+    # Check to see if merge was successful
+    if summary["Total Rows"] == 0:
+        raise ValueError("Merge Not Successful, please check your input files")
+
+    return summary
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+# Hash keys for the two 64-bit halves of a fingerprint, pandas needs exactly 16 characters
+FINGERPRINT_HASH_KEYS = ("level-agreement0", "level-agreement1")
+
+
+def fingerprint_columns(bits):
+    """
+    Returns the names of the columns holding a comment fingerprint of the given width.
+
+    Args:
+        bits (int): Fingerprint width, either 64 or 128.
+
+    Returns:
+        list: Column names, one per 64-bit half.
+    """
+    if bits not in (64, 128):
+        raise ValueError("Comment fingerprints must be 64 or 128 bits wide")
+    return [f"comment_fingerprint_{half}" for half in range(bits // 64)]
+
+
+def fingerprint_comments(comments, bits=64):
+    """
+    Computes a fixed-width fingerprint of every comment.
+
+    Args:
+        comments (pd.Series): Comment text.
+        bits (int): Fingerprint width, either 64 or 128.
+
+    Returns:
+        pd.DataFrame: One uint64 column per 64 bits of fingerprint, aligned to the comments.
+    """
+    columns = fingerprint_columns(bits)
+    values = comments.to_numpy(dtype=object)
+
+    # Comments are nearly all distinct, so hashing them directly beats pandas' default of factorizing first
+    return pd.DataFrame({
+        column: pd.util.hash_array(values, hash_key=hash_key, categorize=False)
+        for column, hash_key in zip(columns, FINGERPRINT_HASH_KEYS)
+    }, index=comments.index)
+
+
+def add_comment_fingerprint(dataframe, bits=64):
+    """
+    Adds fingerprint columns for the comments of a DataFrame, typically right after loading it.
+
+    join_on_fingerprint reuses these columns instead of hashing the comments again.
+
+    Args:
+        dataframe (pd.DataFrame): DataFrame with a 'comment' column.
+        bits (int): Fingerprint width, either 64 or 128.
+
+    Returns:
+        pd.DataFrame: The DataFrame with the fingerprint columns added.
+    """
+    dataframe[fingerprint_columns(bits)] = fingerprint_comments(dataframe['comment'], bits)
+    return dataframe
+
+
+def _fingerprint_keys(dataframe, columns, row_column):
+    """
+    Builds the join input for one side: every column but the comment, its fingerprint and the row position.
+    """
+    keys = dataframe.drop(columns=['comment'] + [column for column in columns if column in dataframe])
+    if all(column in dataframe for column in columns):
+        fingerprint = dataframe[columns]
+    else:
+        fingerprint = fingerprint_comments(dataframe['comment'], len(columns) * 64)
+    keys = pd.concat([keys, fingerprint], axis=1)
+    keys[row_column] = np.arange(len(dataframe))
+    return keys
+
+
+def join_on_fingerprint(df1, df2, bits=64):
+    """
+    Inner joins two DataFrames on id and a fingerprint of the comment instead of the comment text.
+
+    The join's hash table only holds fixed-width keys. Fingerprints added by add_comment_fingerprint are
+    reused, otherwise they are computed here. Comment text is compared only on matched pairs, to drop
+    fingerprint collisions, and is then attached back to the matched rows.
+
+    Args:
+        df1 (pd.DataFrame): Ground-truth DataFrame.
+        df2 (pd.DataFrame): Comparison DataFrame.
+        bits (int): Fingerprint width, either 64 or 128.
+
+    Returns:
+        pd.DataFrame: The same rows and columns an inner join on id and comment would give.
+    """
+    columns = fingerprint_columns(bits)
+    comments_1 = df1['comment'].to_numpy(dtype=object)
+    comments_2 = df2['comment'].to_numpy(dtype=object)
+
+    # Step 1: Swap the comment text for its fingerprint and remember each row's position
+    keys_1 = _fingerprint_keys(df1, columns, '_row_x')
+    keys_2 = _fingerprint_keys(df2, columns, '_row_y')
+
+    # Step 2: Join on the fixed-width keys
+    merged_df = keys_1.merge(keys_2, on=["id"] + columns, how='inner')
+
+    # Step 3: Check the comment text of matched pairs only, dropping fingerprint collisions
+    rows_x = merged_df.pop('_row_x').to_numpy()
+    rows_y = merged_df.pop('_row_y').to_numpy()
+    matched_1, matched_2 = comments_1[rows_x], comments_2[rows_y]
+    matched = (matched_1 == matched_2) | (pd.isna(matched_1) & pd.isna(matched_2))
+    if not matched.all():
+        merged_df = merged_df[matched].reset_index(drop=True)
+        rows_x = rows_x[matched]
+
+    # Step 4: Attach the comment text back where an inner join on the text would have put it
+    merged_df = merged_df.drop(columns=columns)
+    merged_df.insert(df1.drop(columns=columns, errors='ignore').columns.get_loc('comment'), 'comment',
+                     comments_1[rows_x])
+
+    return merged_df
@@ -0,0 +1,172 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from level_agreement.merging.comment_fingerprint import fingerprint_columns, fingerprint_comments
+from level_agreement.merging.merging_df import join_predictions, compare_merged_predictions
+from level_agreement.monitoring.stages import instrumented
+from level_agreement.output.metrics_accumulator import MetricsAccumulator
+
+# Odd multipliers mixing column hashes into one row hash, odd so no bits are lost
+_MIX_COMMENT = np.uint64(0x9E3779B97F4A7C15)
+_MIX_PREDICTION = np.uint64(0xC2B2AE3D27D4EB4F)
+
+# Share of rows that may differ position by position before changes are looked up by value instead
+POSITIONAL_CHANGE_LIMIT = 0.1
+
+
+def row_keys(dataframe):
+    """
+    Hashes the join key of every row, its id and comment, to one uint64.
+
+    Comment fingerprints added by add_comment_fingerprint are reused instead of hashing the comments again.
+
+    Args:
+        dataframe (pd.DataFrame): DataFrame with 'id' and 'comment' columns.
+
+    Returns:
+        np.ndarray: One uint64 per row.
+    """
+    columns = fingerprint_columns(64)
+    if all(column in dataframe for column in columns):
+        comments = dataframe[columns[0]].to_numpy()
+    else:
+        comments = fingerprint_comments(dataframe['comment'])[columns[0]].to_numpy()
+    return pd.util.hash_array(dataframe['id'].to_numpy()) ^ (comments * _MIX_COMMENT)
+
+
+def row_fingerprints(dataframe, keys=None, prediction_column='prediction'):
+    """
+    Hashes the id, comment and prediction of every row to one uint64, so changed rows can be found by value.
+
+    Args:
+        dataframe (pd.DataFrame): DataFrame with 'id', 'comment' and prediction columns.
+        keys (np.ndarray): The rows' join keys from row_keys, computed here when not given.
+        prediction_column (str): The column holding the predictions.
+
+    Returns:
+        np.ndarray: One uint64 per row.
+    """
+    keys = row_keys(dataframe) if keys is None else keys
+    predictions = pd.util.hash_array(dataframe[prediction_column].to_numpy(dtype=object), categorize=False)
+    return keys ^ (predictions * _MIX_PREDICTION)
+
+
+def _changed_keys(keys_old, fingerprints_old, keys_new, fingerprints_new):
+    """
+    Returns the join keys of one side's rows that were added, removed or edited between two runs.
+
+    Revised files usually keep their row order, so rows are first compared position by position, and the keys
+    of every differing position are changed. When too many positions differ, such as after rows were sorted
+    or inserted, a fingerprint whose number of rows changed marks every row with it as changed instead.
+    """
+    common = min(len(fingerprints_old), len(fingerprints_new))
+    moved = np.flatnonzero(fingerprints_old[:common] != fingerprints_new[:common])
+    if len(moved) + max(len(fingerprints_old), len(fingerprints_new)) - common <= POSITIONAL_CHANGE_LIMIT * common:
+        return np.concatenate([keys_old[moved], keys_new[moved], keys_old[common:], keys_new[common:]])
+
+    counts = pd.Series(fingerprints_new).value_counts().sub(pd.Series(fingerprints_old).value_counts(),
+                                                            fill_value=0)
+    changed = counts.index[counts != 0]
+    return np.concatenate([keys_old[pd.Index(fingerprints_old).isin(changed)],
+                           keys_new[pd.Index(fingerprints_new).isin(changed)]])
+
+
+class ComparisonSnapshot:
+    """
+    A comparison together with what is needed to update it incrementally, see incremental_compare.
+
+    Attributes:
+        compared (pd.DataFrame): The comparison, as compare_merged_predictions returns it.
+        metrics (MetricsAccumulator): Confusion counts behind the comparison's metrics.
+        recomputed_rows (int): Number of input rows joined and compared to build this snapshot.
+    """
+
+    def __init__(self, compared, compared_keys, keys_x, fingerprints_x, keys_y, fingerprints_y, metrics,
+                 recomputed_rows):
+        self.compared = compared
+        self.compared_keys = compared_keys
+        self.keys_x = keys_x
+        self.fingerprints_x = fingerprints_x
+        self.keys_y = keys_y
+        self.fingerprints_y = fingerprints_y
+        self.metrics = metrics
+        self.recomputed_rows = recomputed_rows
+
+    def save(self, file_path):
+        """
+        Saves the snapshot, so the next run can start from it.
+        """
+        with open(file_path, "wb") as snapshot_file:
+            pickle.dump(self, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(file_path):
+        """
+        Loads a snapshot saved with save.
+        """
+        with open(file_path, "rb") as snapshot_file:
+            return pickle.load(snapshot_file)
+
+
+@instrumented("incremental_compare")
+def incremental_compare(df1, df2, previous=None, comment_fingerprint=None):
+    """
+    Joins and compares two DataFrames, recomputing only the rows that changed since a previous run.
+
+    Every input row gets a 64-bit fingerprint of its id, comment and prediction. Rows whose fingerprint is new
+    or gone since the previous snapshot mark their id and comment as changed, on either side. Only the
+    comparison rows of changed ids and comments are dropped and rebuilt from the inputs, and the metrics are
+    updated from the stored confusion counts instead of being counted again. Without a previous snapshot
+    everything is computed.
+
+    The result holds the same rows as compare_merged_predictions(join_predictions(df1, df2)), but rebuilt rows
+    come after the unchanged ones. Other columns are not fingerprinted, so rows whose id, comment and prediction
+    stayed the same keep their earlier values of them.
+
+    Args:
+        df1 (pd.DataFrame): Ground-truth DataFrame.
+        df2 (pd.DataFrame): Comparison DataFrame.
+        previous (ComparisonSnapshot): Snapshot returned by the previous run. It is not modified.
+        comment_fingerprint (int): Join on a 64 or 128-bit fingerprint of the comment instead of its text.
+
+    Returns:
+        ComparisonSnapshot: The updated comparison and its metrics.
+    """
+    # Step 1: Fingerprint every input row
+    keys_x, keys_y = row_keys(df1), row_keys(df2)
+    fingerprints_x, fingerprints_y = row_fingerprints(df1, keys_x), row_fingerprints(df2, keys_y)
+
+    # Step 2: Find the ids and comments whose rows changed on either side
+    if previous is None:
+        take_x = take_y = slice(None)
+        kept, kept_keys = None, None
+        metrics = MetricsAccumulator()
+    else:
+        changed = np.concatenate([
+            _changed_keys(previous.keys_x, previous.fingerprints_x, keys_x, fingerprints_x),
+            _changed_keys(previous.keys_y, previous.fingerprints_y, keys_y, fingerprints_y),
+        ])
+        changed = pd.unique(changed)
+        take_x, take_y = pd.Index(keys_x).isin(changed), pd.Index(keys_y).isin(changed)
+
+        # Step 3: Drop the comparison rows of changed keys, taking them out of the stored counts
+        dropped = pd.Index(previous.compared_keys).isin(changed)
+        metrics = MetricsAccumulator(previous.metrics.prediction_column_x, previous.metrics.prediction_column_y)
+        metrics.merge(previous.metrics)
+        metrics.remove(previous.compared[dropped])
+        kept, kept_keys = previous.compared[~dropped], previous.compared_keys[~dropped]
+
+    # Step 4: Join and compare the rows of changed keys only
+    rows_x, rows_y = df1[take_x], df2[take_y]
+    rebuilt = compare_merged_predictions(join_predictions(rows_x, rows_y, comment_fingerprint))
+    metrics.update(rebuilt)
+
+    compared, compared_keys = rebuilt, row_keys(rebuilt)
+    if kept is not None and not kept.empty:
+        compared = pd.concat([kept, rebuilt], ignore_index=True) if not rebuilt.empty else kept.reset_index(drop=True)
+        compared_keys = np.concatenate([kept_keys, compared_keys])
+
+    return ComparisonSnapshot(compared, compared_keys, keys_x, fingerprints_x, keys_y, fingerprints_y, metrics,
+                              len(rows_x) + len(rows_y))
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+from level_agreement.merging.label_vocabulary import encode_label_strings
+
+# Number of labels held by each bitmask word
+WORD_BITS = 64
+
+# Number of set bits in every possible byte, used when numpy has no bitwise_count
+_BYTE_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def bitset_words(vocabulary_size):
+    """
+    Returns the number of 64-bit words needed to hold one bit per label of the vocabulary.
+    """
+    return max(1, -(-vocabulary_size // WORD_BITS))
+
+
+def pack_label_sets(offsets, codes, vocabulary_size):
+    """
+    Packs label sets stored in compressed sparse row form into bitmasks.
+
+    Args:
+        offsets (np.ndarray): Row offsets returned by encode_label_strings.
+        codes (np.ndarray): Label codes returned by encode_label_strings.
+        vocabulary_size (int): Number of labels in the vocabulary.
+
+    Returns:
+        np.ndarray: uint64 array of shape (sets, words) where bit ``code % 64`` of word ``code // 64`` is set
+        when the label is part of the set.
+    """
+    set_count = len(offsets) - 1
+    bitsets = np.zeros((set_count, bitset_words(vocabulary_size)), dtype=np.uint64)
+    owner = np.repeat(np.arange(set_count), np.diff(offsets))
+    bits = np.left_shift(np.uint64(1), (codes % WORD_BITS).astype(np.uint64))
+    np.bitwise_or.at(bitsets, (owner, codes // WORD_BITS), bits)
+    return bitsets
+
+
+def has_labels(bitsets, set_index, labels):
+    """
+    Checks whether each label is part of the matching set.
+
+    Args:
+        bitsets (np.ndarray): Bitmasks returned by pack_label_sets.
+        set_index (np.ndarray): Index of the set to look in, one per label.
+        labels (np.ndarray): Label codes to look up.
+
+    Returns:
+        np.ndarray: Boolean array, True where the label is in its set.
+    """
+    words = bitsets[set_index, labels // WORD_BITS]
+    return (np.right_shift(words, (labels % WORD_BITS).astype(np.uint64)) & np.uint64(1)).astype(bool)
+
+
+def popcount(bitsets):
+    """
+    Counts the labels held by each bitmask.
+
+    Args:
+        bitsets (np.ndarray): uint64 array of shape (rows, words).
+
+    Returns:
+        np.ndarray: Number of labels in every row.
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bitsets).sum(axis=1, dtype=np.int64)
+    per_byte = _BYTE_POPCOUNT[np.ascontiguousarray(bitsets).view(np.uint8)]
+    return per_byte.sum(axis=1, dtype=np.int64)
+
+
+def added_labels(bitsets_x, bitsets_y):
+    """
+    Returns the labels present in prediction_y but not in prediction_x.
+    """
+    return bitsets_y & ~bitsets_x
+
+
+def removed_labels(bitsets_x, bitsets_y):
+    """
+    Returns the labels present in prediction_x but not in prediction_y.
+    """
+    return bitsets_x & ~bitsets_y
+
+
+def changed_labels(bitsets_x, bitsets_y):
+    """
+    Returns the labels present in only one of prediction_x and prediction_y.
+    """
+    return bitsets_x ^ bitsets_y
+
+
+def encode_label_bitsets(*prediction_columns, lowercase=False):
+    """
+    Encodes each row's label set as a bitmask over a vocabulary shared by all columns.
+
+    Each distinct prediction string is parsed once. With up to 64 labels a row costs one 8-byte word; larger
+    vocabularies use one extra word per 64 labels.
+
+    Args:
+        *prediction_columns (pd.Series): Columns of cleaned, comma-joined prediction strings.
+        lowercase (bool): Whether labels are lower-cased before being added to the vocabulary.
+
+    Returns:
+        tuple: (vocabulary, bitsets) where bitsets holds one uint64 array of shape (rows, words) per column.
+    """
+    values = [column.fillna('').to_numpy(dtype=object) for column in prediction_columns]
+    sizes = np.cumsum([len(column) for column in values])[:-1]
+
+    # Parse each distinct string once, then look every row's bitmask up by its string code
+    string_codes, strings = pd.factorize(np.concatenate(values) if values else np.array([], dtype=object))
+    vocabulary, offsets, codes = encode_label_strings(np.asarray(strings, dtype=object), lowercase=lowercase)
+    string_bitsets = pack_label_sets(offsets, codes, len(vocabulary))
+
+    return vocabulary, [string_bitsets[column_codes] for column_codes in np.split(string_codes, sizes)]
+
+
+def decode_label_bitsets(bitsets, vocabulary):
+    """
+    Turns bitmasks back into lists of labels.
+
+    Args:
+        bitsets (np.ndarray): uint64 array of shape (rows, words).
+        vocabulary (np.ndarray): Labels returned by encode_label_bitsets.
+
+    Returns:
+        list: One list of labels per row, in vocabulary order.
+    """
+    bits = np.unpackbits(np.ascontiguousarray(bitsets, dtype='<u8').view(np.uint8), axis=1, bitorder='little')
+    rows, labels = np.nonzero(bits[:, :len(vocabulary)])
+    decoded = [[] for _ in range(len(bitsets))]
+    for row, label in zip(rows.tolist(), vocabulary[labels].tolist()):
+        decoded[row].append(label)
+    return decoded
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+from level_agreement.merging.label_vocabulary import encode_label_strings, gather_labels
+from level_agreement.merging.label_bitsets import bitset_words, pack_label_sets, has_labels
+
+# Largest bitmask table, in bytes, used to look labels up; bigger vocabularies fall back to a hash join
+BITSET_MEMORY_LIMIT = 256 * 1024 * 1024
+
+
+def _set_membership(offsets, codes, vocabulary_size, pair_x, pair_y):
+    """
+    Checks, for every distinct pair of strings, which labels of one side are present on the other side.
+    """
+    owner_x, labels_x = gather_labels(offsets, codes, pair_x)
+    owner_y, labels_y = gather_labels(offsets, codes, pair_y)
+
+    if len(offsets) * bitset_words(vocabulary_size) * 8 <= BITSET_MEMORY_LIMIT:
+        # Pack each distinct string into a bitmask once, then membership is a single bit test per label
+        bitsets = pack_label_sets(offsets, codes, vocabulary_size)
+        x_in_y = has_labels(bitsets, pair_y[owner_x], labels_x)
+        y_in_x = has_labels(bitsets, pair_x[owner_y], labels_y)
+    else:
+        # A (pair, label) key is unique per pair, so membership is a single isin over all pairs at once
+        keys_x = owner_x * vocabulary_size + labels_x
+        keys_y = owner_y * vocabulary_size + labels_y
+        x_in_y = pd.Series(keys_x).isin(keys_y).to_numpy()
+        y_in_x = pd.Series(keys_y).isin(keys_x).to_numpy()
+
+    return owner_x, labels_x, x_in_y, owner_y, labels_y, y_in_x
+
+
+def _join_labels(vocabulary, owner, labels, size):
+    """
+    Joins the selected labels of each owner with ', ', returning None for owners without labels.
+
+    Owners must be sorted, which is how gather_labels returns them.
+    """
+    joined = np.full(size, None, dtype=object)
+    if len(owner):
+        # Every label except the first of its owner is prefixed with the separator, then each run is summed
+        starts = np.flatnonzero(np.concatenate([[True], owner[1:] != owner[:-1]]))
+        separated = np.array([', ' + label for label in vocabulary], dtype=object)
+        pieces = separated[labels]
+        pieces[starts] = vocabulary[labels[starts]]
+        joined[owner[starts]] = np.add.reduceat(pieces, starts)
+    return joined
+
+
+def compare_label_sets(prediction_x, prediction_y):
+    """
+    Compares two columns of cleaned prediction strings in one batch.
+
+    Produces the same values as running get_label_differences and determine_change on every row, but each
+    distinct string is parsed once and each distinct (prediction_x, prediction_y) pair is compared once using
+    columnar operations. Labels listed in 'prediction_differences' follow the order they appear in the
+    prediction string.
+
+    Args:
+        prediction_x (pd.Series): First column of predictions.
+        prediction_y (pd.Series): Second column of predictions.
+
+    Returns:
+        pd.DataFrame: DataFrame with 'differences', 'prediction_differences' and 'type' columns, aligned to
+        the index of prediction_x.
+    """
+    size = len(prediction_x)
+    values_x = prediction_x.fillna('').to_numpy(dtype=object)
+    values_y = prediction_y.fillna('').to_numpy(dtype=object)
+
+    # Step 1: Distinct strings across both columns share one code space
+    string_codes, strings = pd.factorize(np.concatenate([values_x, values_y]))
+    strings = np.asarray(strings, dtype=object)
+    string_count = max(len(strings), 1)
+
+    # Step 2: Rows holding the same pair of strings compare the same way, so only distinct pairs are compared
+    pair_codes, pairs = pd.factorize(string_codes[:size].astype(np.int64) * string_count + string_codes[size:])
+    pair_x = pairs // string_count
+    pair_y = pairs % string_count
+    pair_count = len(pairs)
+
+    empty = strings == ''
+    differences = strings[pair_x] != strings[pair_y]
+
+    # Step 3: Case-sensitive labels decide the type of change
+    vocabulary, offsets, codes = encode_label_strings(strings)
+    owner_x, _, x_in_y, owner_y, _, y_in_x = _set_membership(offsets, codes, len(vocabulary), pair_x, pair_y)
+    x_only = np.bincount(owner_x[~x_in_y], minlength=pair_count) > 0
+    y_only = np.bincount(owner_y[~y_in_x], minlength=pair_count) > 0
+
+    change_type = np.select(
+        [
+            empty[pair_x] & empty[pair_y],
+            empty[pair_x],
+            empty[pair_y],
+            ~differences,
+            ~x_only & ~y_only,
+            ~y_only,
+            ~x_only,
+        ],
+        [
+            "Both Predictions are Empty",
+            "Missing Labels in Prediction_X",
+            "Missing Labels in Prediction_Y",
+            "No Change",
+            "No Change",
+            "Theme(s) Removed",
+            "Themes(s) Added",
+        ],
+        default="Sentiment Changed",
+    ).astype(object)
+
+    # Step 4: Lower-cased labels describe which labels differ
+    vocabulary, offsets, codes = encode_label_strings(strings, lowercase=True)
+    owner_x, labels_x, x_in_y, owner_y, labels_y, y_in_x = _set_membership(
+        offsets, codes, len(vocabulary), pair_x, pair_y)
+    added = _join_labels(vocabulary, owner_y[~y_in_x], labels_y[~y_in_x], pair_count)
+    removed = _join_labels(vocabulary, owner_x[~x_in_y], labels_x[~x_in_y], pair_count)
+
+    label_differences = np.where(added != None, added, removed)  # noqa: E711
+    label_differences = np.where(label_differences != None, label_differences, 'NaN')  # noqa: E711
+    label_differences = np.where(differences, label_differences, "'NaN'").astype(object)
+
+    # Step 5: Broadcast the per-pair results back to every row
+    return pd.DataFrame({
+        'differences': differences[pair_codes],
+        'prediction_differences': label_differences[pair_codes],
+        'type': change_type[pair_codes],
+    }, index=prediction_x.index)
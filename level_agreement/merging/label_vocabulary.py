@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+
+def encode_label_strings(strings, lowercase=False):
+    """
+    Parses distinct prediction strings into a shared label vocabulary.
+
+    Every string is split on commas and stripped exactly once. The labels of string ``i`` are stored in
+    compressed sparse row form as ``vocabulary[codes[offsets[i]:offsets[i + 1]]]``, de-duplicated and kept
+    in the order they first appear in the string.
+
+    Args:
+        strings (np.ndarray): Distinct prediction strings.
+        lowercase (bool): Whether labels are lower-cased before being added to the vocabulary.
+
+    Returns:
+        tuple: (vocabulary, offsets, codes) arrays.
+    """
+    # Step 1: Split every string into stripped labels, remembering which string each label came from
+    tokens = pd.Series(strings, dtype=object).str.split(',').explode().str.strip()
+    if lowercase:
+        tokens = tokens.str.lower()
+
+    # Step 2: Give every distinct label an integer code
+    label_codes, vocabulary = pd.factorize(tokens.to_numpy(dtype=object))
+
+    # Step 3: Drop repeated labels within the same string so each string holds a set
+    pairs = pd.DataFrame({'owner': tokens.index.to_numpy(), 'label': label_codes}).drop_duplicates()
+    counts = np.bincount(pairs['owner'].to_numpy(), minlength=len(strings))
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    return np.asarray(vocabulary, dtype=object), offsets, pairs['label'].to_numpy()
+
+
+def gather_labels(offsets, codes, string_index):
+    """
+    Looks up the label codes of the selected strings.
+
+    Args:
+        offsets (np.ndarray): Row offsets returned by encode_label_strings.
+        codes (np.ndarray): Label codes returned by encode_label_strings.
+        string_index (np.ndarray): Index of the string to look up for each output row.
+
+    Returns:
+        tuple: (owner, labels) arrays where owner is the position in string_index each label belongs to.
+    """
+    starts = offsets[string_index]
+    lengths = offsets[string_index + 1] - starts
+    owner = np.repeat(np.arange(len(string_index)), lengths)
+
+    # Position of every label within its own string, shifted to where that string starts in codes
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owner, codes[np.repeat(starts, lengths) + within]
@@ -1,21 +1,50 @@
 import pandas as pd
 from level_agreement.validation.file_validation import validate_ids
+from level_agreement.merging.label_engine import compare_label_sets
+from level_agreement.merging.comment_fingerprint import join_on_fingerprint
+from level_agreement.monitoring.stages import instrumented
 
 
-def merge_df(file_path_1, file_path_2):
+def merge_df(file_path_1, file_path_2, comment_fingerprint=None):
     """
     This function merges 2 DataFrames using pandas and returns a new DataFrame
+
+    Passing comment_fingerprint=64 or 128 joins on a fingerprint of the comment instead of its full text
     """
 
     df1, df2 = validate_ids(file_path_1, file_path_2)
 
     # Use pandas to merge df1 and df2 on id and comment
-    merged_df = df1.merge(df2, on=["id", "comment"], how='inner')
+    merged_df = join_predictions(df1, df2, comment_fingerprint)
 
     # Check to see if merge was successful
     if merged_df.empty:
         raise ValueError("Merge Not Successful, please check your input files")
 
+    return merged_df
+
+
+@instrumented("join_predictions")
+def join_predictions(df1, df2, comment_fingerprint=None):
+    """
+    Inner joins two DataFrames on id and comment and cleans the prediction columns.
+
+    Unlike merge_df this does not validate IDs or raise on an empty result, so it can be used on parts of
+    the input files.
+
+    Args:
+        df1 (pd.DataFrame): Ground-truth DataFrame.
+        df2 (pd.DataFrame): Comparison DataFrame.
+        comment_fingerprint (int): Join on a 64 or 128-bit fingerprint of the comment instead of its text.
+
+    Returns:
+        pd.DataFrame: Merged DataFrame with 'prediction_x' and 'prediction_y' columns.
+    """
+    if comment_fingerprint:
+        merged_df = join_on_fingerprint(df1, df2, comment_fingerprint)
+    else:
+        merged_df = df1.merge(df2, on=["id", "comment"], how='inner')
+
     # Remove square brackets from prediction_x and prediction_y b
     merged_df['prediction_x'] = merged_df['prediction_x'].str.strip('[]').str.replace("'", "")
     merged_df['prediction_y'] = merged_df['prediction_y'].str.strip('[]').str.replace("'", "")
@@ -23,12 +52,13 @@ def merge_df(file_path_1, file_path_2):
     return merged_df
 
 
-def compare_prediction_columns(file_path_1, file_path_2):
+def compare_prediction_columns(file_path_1, file_path_2, comment_fingerprint=None):
     """
         Compares prediction columns between two data files and identifies differences.
         Args:
             file_path_1 (str): Path to the first data file.
             file_path_2 (str): Path to the second data file.
+            comment_fingerprint (int): Join on a 64 or 128-bit fingerprint of the comment instead of its text.
 
         Returns:
             pd.DataFrame: DataFrame with differences identified in the 'prediction_differences' column and
@@ -36,21 +66,7 @@ def compare_prediction_columns(file_path_1, file_path_2):
         """
 
     # Merge the DataFrames using merge_df function
-    merged_file = merge_df(file_path_1, file_path_2)
-
-    # Calculate the differences and store them in a 'differences' column
-    merged_file['differences'] = (merged_file["prediction_x"] != merged_file["prediction_y"])
-
-    # Apply get_label_differences function to get the differences for each row
-    merged_file['prediction_differences'] = merged_file.apply(
-        lambda row: get_label_differences(row['prediction_x'], row['prediction_y']) if row['differences'] else "'NaN'",
-        axis=1)
-
-    # Apply determine_change function to create a new 'type' column
-    merged_file['type'] = merged_file.apply(
-        lambda row: determine_change(row['differences'], row['prediction_x'], row['prediction_y']),
-        axis=1
-    )
+    merged_file = compare_merged_predictions(merge_df(file_path_1, file_path_2, comment_fingerprint))
 
     # Logic to check if there are any differences
     if merged_file['differences'].any():
@@ -60,6 +76,24 @@ def compare_prediction_columns(file_path_1, file_path_2):
         print("Great, Columns match!")
 
 
+@instrumented("compare_merged_predictions")
+def compare_merged_predictions(merged_file):
+    """
+    Adds the 'differences', 'prediction_differences' and 'type' columns to a merged DataFrame.
+
+    Args:
+        merged_file (pd.DataFrame): DataFrame returned by merge_df or join_predictions.
+
+    Returns:
+        pd.DataFrame: The same DataFrame with the comparison columns added.
+    """
+    # Compare every row's label sets in one batch - producing 'differences', 'prediction_differences' and 'type'
+    comparison = compare_label_sets(merged_file['prediction_x'], merged_file['prediction_y'])
+    merged_file[comparison.columns] = comparison
+
+    return merged_file
+
+
 def get_label_differences(prediction_x, prediction_y):
     """
     Cleans and formats the label differences between two prediction strings.
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+from level_agreement.monitoring.stages import instrumented
+from level_agreement.validation.duplicate_keys import JOIN_KEYS, join_key_codes
+
+# How join_annotators keeps comments not every annotator labelled
+JOIN_HOWS = ["inner", "outer"]
+
+
+class AnnotatorMatrix:
+    """
+    The predictions of several annotators on the same comments, one row per comment and one column per annotator.
+
+    Every prediction is stored as the code of its cleaned prediction string in categories, so the agreement
+    statistics never compare strings. Predictions are compared whole, as in the two-file metrics, so 'a, b' and
+    'b, a' are different categories.
+
+    Attributes:
+        keys (pd.DataFrame): The id and comment of every row.
+        names (list): The name of every annotator.
+        codes (np.ndarray): Category code of every row and annotator, -1 where the annotator has no prediction.
+        categories (np.ndarray): Every distinct cleaned prediction.
+    """
+
+    def __init__(self, keys, names, codes, categories):
+        self.keys = keys
+        self.names = names
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.codes)
+
+    def frame(self):
+        """
+        Returns the matrix as a DataFrame, the keys followed by every annotator's cleaned prediction.
+        """
+        frame = self.keys.copy()
+        for number, name in enumerate(self.names):
+            codes = self.codes[:, number]
+            frame[name] = pd.Series(self.categories[codes], dtype=object).where(codes >= 0)
+        return frame
+
+
+def _prediction_codes(predictions):
+    """
+    Gives every prediction the code of its cleaned prediction string, cleaning each distinct string once.
+
+    Predictions are cleaned the way join_predictions cleans them and compared as whole strings, as
+    MetricsAccumulator compares them, so the kappa of two annotators matches the Kappas Score of comparing
+    their two files.
+
+    Returns:
+        tuple: (codes, categories) with one code per prediction and the cleaned prediction of every code.
+    """
+    string_codes, strings = pd.factorize(pd.Series(predictions, dtype=object).fillna(''))
+    cleaned = pd.Series(np.asarray(strings, dtype=object)).str.strip('[]').str.replace("'", "")
+    category_codes, categories = pd.factorize(cleaned)
+    return category_codes[string_codes], np.asarray(categories, dtype=object)
+
+
+@instrumented("join_annotators")
+def join_annotators(dataframes, names=None, how="inner", keys=JOIN_KEYS, prediction_column='prediction'):
+    """
+    Joins the predictions of any number of annotators on the same comments in one pass.
+
+    The keys of all DataFrames are factorized together, so every comment gets one row whatever the number of
+    annotators, and every prediction string of every annotator is cleaned once into a shared set of categories.
+
+    Args:
+        dataframes (list): One DataFrame per annotator, with the key and prediction columns, without repeated keys.
+        names (list): Annotator names. Defaults to 'Annotator 1', 'Annotator 2' and so on.
+        how (str): 'inner' keeps the comments every annotator labelled, 'outer' keeps every comment, leaving
+            missing predictions as -1 codes.
+        keys (list): Columns the DataFrames are joined on.
+        prediction_column (str): The column holding the predictions.
+
+    Returns:
+        AnnotatorMatrix: The joined predictions.
+    """
+    if how not in JOIN_HOWS:
+        raise ValueError(f"Unknown join '{how}', expected one of {JOIN_HOWS}")
+    if len(dataframes) < 2:
+        raise ValueError("At least two files are needed to measure agreement")
+    names = list(names) if names is not None else [f"Annotator {number + 1}" for number in range(len(dataframes))]
+
+    # Step 1: One row code per distinct key across every file
+    row_codes = join_key_codes(*dataframes, keys=keys)
+    rows = max(codes.max(initial=-1) for codes in row_codes) + 1
+
+    # Step 2: One category code per prediction across every file
+    category_codes, categories = _prediction_codes(
+        np.concatenate([df[prediction_column].to_numpy(dtype=object) for df in dataframes]))
+
+    # Step 3: Scatter every file's categories into its column of the matrix
+    codes = np.full((rows, len(dataframes)), -1, dtype=np.int64)
+    start = 0
+    for number, (df, df_codes) in enumerate(zip(dataframes, row_codes)):
+        if len(np.unique(df_codes)) != len(df_codes):
+            raise ValueError(f"{names[number]} has rows sharing an id and comment, please check your input files")
+        codes[df_codes, number] = category_codes[start:start + len(df)]
+        start += len(df)
+
+    # Step 4: The key of every row, from the first file that has it
+    all_keys = pd.concat([df[keys] for df in dataframes], ignore_index=True)
+    first_rows = pd.Series(np.concatenate(row_codes)).drop_duplicates()
+    row_keys = all_keys.iloc[first_rows.index].set_index(first_rows.to_numpy()).sort_index()
+
+    keep = (codes >= 0).all(axis=1) if how == "inner" else np.ones(rows, dtype=bool)
+    if not keep.any():
+        raise ValueError("Merge Not Successful, please check your input files")
+
+    return AnnotatorMatrix(row_keys[keep].reset_index(drop=True), names, codes[keep], categories)
@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from level_agreement.validation.file_validation import validate_ids
+from level_agreement.merging.merging_df import join_predictions, compare_merged_predictions
+from level_agreement.merging.chunked_merge import partition_by_id
+from level_agreement.output.metrics_accumulator import MetricsAccumulator
+
+# Columns carrying each row's original position, used to put shards back in serial order
+POSITION_COLUMNS = ['_position_x', '_position_y']
+
+# Shards of the pool a worker process belongs to, set once by _inherit_shards when the worker starts
+_worker_shards = None
+
+
+def _compare_shard(shard):
+    """
+    Joins and compares one shard of both inputs, returning the comparison and its metric counts.
+    """
+    df1, df2, comment_fingerprint = shard
+    merged_file = join_predictions(df1, df2, comment_fingerprint)
+    if merged_file.empty:
+        return None, MetricsAccumulator()
+
+    merged_file = compare_merged_predictions(merged_file)
+    metrics = MetricsAccumulator().update(merged_file)
+    return merged_file, metrics
+
+
+def _inherit_shards(shards):
+    """
+    Keeps the shards of the pool in the worker process, forked workers inherit them without pickling.
+    """
+    global _worker_shards
+    _worker_shards = shards
+
+
+def _compare_worker_shard(shard_number):
+    """
+    Compares one of the shards the worker process was started with.
+    """
+    return _compare_shard(_worker_shards[shard_number])
+
+
+def parallel_compare(df1, df2, workers=None, comment_fingerprint=None):
+    """
+    Merges and compares two DataFrames across a pool of worker processes.
+
+    Both inputs are partitioned by a hash of the id, so every shard can be joined and compared on its own.
+    The per-shard comparisons are put back in the order the serial path gives, and the per-shard metric
+    counts are merged into one metrics table.
+
+    Args:
+        df1 (pd.DataFrame): Ground-truth DataFrame.
+        df2 (pd.DataFrame): Comparison DataFrame.
+        workers (int): Number of worker processes. Defaults to the number of CPU cores.
+        comment_fingerprint (int): Join on a 64 or 128-bit fingerprint of the comment instead of its text.
+
+    Returns:
+        tuple: (comparison DataFrame, metrics DataFrame) matching compare_merged_predictions and
+        predictions_metrics on the serial merge.
+    """
+    workers = workers or os.cpu_count() or 1
+
+    # Step 1: Drop unmatched IDs once, then remember where every row came from
+    df1, df2 = validate_ids(df1, df2)
+    df1 = df1.assign(**{POSITION_COLUMNS[0]: np.arange(len(df1))})
+    df2 = df2.assign(**{POSITION_COLUMNS[1]: np.arange(len(df2))})
+
+    # Step 2: Split both inputs into the same id shards
+    shard_1 = partition_by_id(df1, workers)
+    shard_2 = partition_by_id(df2, workers)
+    shards = [(df1[shard_1 == shard], df2[shard_2 == shard], comment_fingerprint) for shard in range(workers)]
+
+    # Step 3: Compare every shard, in this process when there is a single worker
+    if workers == 1:
+        results = [_compare_shard(shard) for shard in shards]
+    elif multiprocessing.get_start_method() == 'fork':
+        # Forked workers inherit the shards of their own pool, so only the shard number has to be sent and
+        # concurrent callers do not share them
+        with ProcessPoolExecutor(max_workers=workers, initializer=_inherit_shards, initargs=(shards,)) as pool:
+            results = list(pool.map(_compare_worker_shard, range(workers)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_compare_shard, shards))
+
+    # Step 4: Reduce the shards into one comparison and one set of metric counts
+    frames = [frame for frame, _ in results if frame is not None]
+    if not frames:
+        raise ValueError("Merge Not Successful, please check your input files")
+
+    merged_file = pd.concat(frames).sort_values(POSITION_COLUMNS, kind='stable')
+    merged_file = merged_file.drop(columns=POSITION_COLUMNS).reset_index(drop=True)
+
+    metrics = MetricsAccumulator()
+    for _, shard_metrics in results:
+        metrics.merge(shard_metrics)
+
+    return merged_file, metrics.metrics()
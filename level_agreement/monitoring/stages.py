@@ -0,0 +1,198 @@
+import functools
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # The resource module is Unix only
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Columns of every stage record, in display order. The CPU time is the stage's own thread, while memory can only
+# be measured for the whole process: its peak so far when the stage ends, and how much the stage raised it. The
+# depth is 0 for a stage run directly, 1 for a stage run inside another one and so on
+RECORD_COLUMNS = ["stage", "depth", "wall_seconds", "cpu_seconds", "rows", "process_peak_rss_mb",
+                  "process_peak_growth_mb"]
+
+# Functions called with every finished stage record
+_sinks = []
+
+# Recorder collecting the stages of the current session or thread, if any
+_current_recorder = ContextVar("stage_recorder", default=None)
+
+# Number of stages the current code runs inside of, in this thread or task
+_stage_depth = ContextVar("stage_depth", default=0)
+
+
+def add_sink(sink):
+    """
+    Registers a function to call with every finished stage record, to forward them to a metrics system.
+
+    Args:
+        sink (callable): Called with the record dict, see RECORD_COLUMNS. Errors it raises are logged and ignored.
+    """
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    """
+    Unregisters a function registered with add_sink.
+    """
+    _sinks.remove(sink)
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of the process so far, in megabytes, or None where it is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class StageRecorder:
+    """
+    Collects the stage records of one comparison, see recording.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def frame(self):
+        """
+        Returns the records as a DataFrame, one row per stage in the order the stages finished.
+        """
+        return pd.DataFrame(self.records, columns=RECORD_COLUMNS)
+
+
+@contextmanager
+def recording(recorder=None):
+    """
+    Collects every stage finished inside the block, in this thread or task only.
+
+    Args:
+        recorder (StageRecorder): Recorder to add the records to. Defaults to a new one.
+
+    Yields:
+        StageRecorder: The recorder.
+    """
+    recorder = recorder or StageRecorder()
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+        if recorder.records:
+            _log_summary(recorder.records)
+
+
+def _log_summary(records):
+    """
+    Logs one line for all the stages of a recording, the stages themselves are logged at debug level.
+    """
+    # Stages run inside another one are already part of its time
+    outermost = min(record["depth"] for record in records)
+    top_level = [record for record in records if record["depth"] == outermost]
+    slowest = max(top_level, key=lambda record: record["wall_seconds"])
+    peaks = [record["process_peak_rss_mb"] for record in records if record["process_peak_rss_mb"] is not None]
+    logger.info(f"Recorded {len(records)} stages taking {sum(record['wall_seconds'] for record in top_level):.3f}s "
+                f"({sum(record['cpu_seconds'] for record in top_level):.3f}s CPU), the slowest {slowest['stage']} "
+                f"taking {slowest['wall_seconds']:.3f}s" + (f", process peak {max(peaks):.1f} MB" if peaks else ""),
+                extra={"stage_records": records})
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Measures a block's wall time, the CPU time of its thread and the peak resident memory of the process.
+
+    Sessions of the app run in threads of one process, so the CPU time is taken for the calling thread only, and
+    work the block hands to worker processes is not included. The peak memory is the process' peak so far, shared
+    with every other thread. The record is logged, passed to the sinks and added to the active recorder. The
+    number of rows can be set on the yielded record once the block knows it.
+
+    Args:
+        name (str): Name of the stage.
+        rows (int): Number of rows the stage processes.
+
+    Yields:
+        dict: The stage record, filled in when the block ends.
+    """
+    depth = _stage_depth.get()
+    record = {"stage": name, "depth": depth, "rows": rows}
+    depth_token = _stage_depth.set(depth + 1)
+    peak_before = peak_rss_mb()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield record
+    finally:
+        _stage_depth.reset(depth_token)
+        record["wall_seconds"] = time.perf_counter() - wall_start
+        record["cpu_seconds"] = time.thread_time() - cpu_start
+        record["process_peak_rss_mb"] = peak_rss_mb()
+        record["process_peak_growth_mb"] = record["process_peak_rss_mb"] - peak_before \
+            if peak_before is not None else None
+        _finish(record)
+
+
+def _finish(record):
+    """
+    Logs a finished stage record, passes it to the sinks and adds it to the active recorder.
+    """
+    logger.debug(f"Stage {record['stage']} took {record['wall_seconds']:.3f}s ({record['cpu_seconds']:.3f}s CPU) "
+                f"for {record['rows']} rows", extra={"stage_record": record})
+
+    for sink in list(_sinks):
+        try:
+            sink(record)
+        except Exception as e:
+            logger.warning(f"Stage metrics sink {sink!r} failed: {e}")
+
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.records.append(record)
+
+
+def _count_rows(value):
+    """
+    Returns the number of rows of a DataFrame, or of all DataFrames in a tuple or list, or None.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        counts = [_count_rows(item) for item in value]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+def instrumented(name):
+    """
+    Decorates a function so every call is measured as a stage.
+
+    The rows are counted from the DataFrames the function receives, or from the DataFrames it returns when it
+    receives none, such as load_file.
+
+    Args:
+        name (str): Name of the stage.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name, rows=_count_rows(list(args) + list(kwargs.values()))) as record:
+                result = function(*args, **kwargs)
+                if record["rows"] is None:
+                    record["rows"] = _count_rows(result)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,108 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from level_agreement.merging.label_vocabulary import encode_label_strings, gather_labels
+from level_agreement.monitoring.stages import instrumented
+
+# Columns holding the parsed labels of prediction_x and prediction_y
+LABEL_COLUMNS = ['labels_x', 'labels_y']
+
+
+def label_list_array(predictions):
+    """
+    Parses a column of cleaned prediction strings into an Arrow list array of labels.
+
+    Each distinct string is parsed once, and the list array is built directly from the parsed offsets rather
+    than from one Python list per row. Empty labels are dropped.
+
+    Args:
+        predictions (pd.Series): Cleaned, comma-joined prediction strings.
+
+    Returns:
+        pa.ListArray: The de-duplicated labels of every row, in the order they appear.
+    """
+    import pyarrow as pa
+
+    string_codes, strings = pd.factorize(predictions.fillna('').to_numpy(dtype=object))
+    vocabulary, offsets, codes = encode_label_strings(np.asarray(strings, dtype=object))
+
+    # Step 1: Expand every row to its labels, without the empty label
+    owner, labels = gather_labels(offsets, codes, string_codes)
+    keep = vocabulary[labels] != ''
+    owner, labels = owner[keep], labels[keep]
+
+    # Step 2: Row offsets into the flat label array
+    row_offsets = np.concatenate([[0], np.cumsum(np.bincount(owner, minlength=len(predictions)))])
+    values = pa.DictionaryArray.from_arrays(pa.array(labels, type=pa.int32()), pa.array(vocabulary, pa.string()))
+    if row_offsets[-1] > np.iinfo(np.int32).max:
+        return pa.LargeListArray.from_arrays(pa.array(row_offsets, type=pa.int64()), values.cast(pa.string()))
+    return pa.ListArray.from_arrays(pa.array(row_offsets, type=pa.int32()), values.cast(pa.string()))
+
+
+@instrumented("save_comparison")
+def save_comparison(df, file_path, prediction_column_x='prediction_x', prediction_column_y='prediction_y',
+                    include_labels=True, file_format=None):
+    """
+    Writes a merged or compared DataFrame to a Parquet or Arrow (Feather) file.
+
+    Arrow files are written uncompressed so load_comparison can memory-map them without copying. The parsed
+    labels of both prediction columns are stored next to them, so re-opening a comparison needs no parsing.
+
+    Args:
+        df (pd.DataFrame): DataFrame returned by merge_df or compare_prediction_columns.
+        file_path (str): Path or writable buffer.
+        prediction_column_x (str): The column for the first set of predictions.
+        prediction_column_y (str): The column for the second set of predictions.
+        include_labels (bool): Whether to add the 'labels_x' and 'labels_y' columns.
+        file_format (str): 'parquet' or 'arrow'. Defaults to Parquet for paths ending in '.parquet' and Arrow
+            otherwise.
+
+    Returns:
+        pa.Table: The table that was written.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    # Column names can be file paths after rename_columns, Arrow needs strings
+    table = pa.Table.from_pandas(df.rename(columns=str), preserve_index=False)
+    if include_labels:
+        for column, prediction_column in zip(LABEL_COLUMNS, [prediction_column_x, prediction_column_y]):
+            table = table.append_column(column, label_list_array(df[prediction_column]))
+
+    if file_format is None:
+        file_format = "parquet" if Path(str(getattr(file_path, "name", file_path))).suffix.lower() == ".parquet" \
+            else "arrow"
+
+    if file_format == "parquet":
+        pq.write_table(table, file_path)
+    else:
+        feather.write_feather(table, file_path, compression='uncompressed')
+
+    return table
+
+
+def load_comparison(file_path):
+    """
+    Re-opens a comparison written by save_comparison.
+
+    Arrow files are memory-mapped and the columns stay backed by Arrow memory, so nothing is copied or parsed.
+    Parquet files are decoded column by column.
+
+    Args:
+        file_path (str): Path to a '.parquet', '.feather' or '.arrow' file.
+
+    Returns:
+        pd.DataFrame: The saved DataFrame, with Arrow-backed columns.
+    """
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    if Path(str(file_path)).suffix.lower() == ".parquet":
+        table = pq.read_table(file_path, memory_map=True)
+    else:
+        table = feather.read_table(file_path, memory_map=True)
+
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
@@ -0,0 +1,152 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from level_agreement.output.label_metrics import label_indicator_matrices
+
+# Filter results kept by a ComparisonIndex, so paging through one filter does not recompute it
+FILTER_CACHE_SIZE = 8
+
+
+class ComparisonIndex:
+    """
+    Precomputed index over a comparison, to filter and page through it without scanning every row again.
+
+    The change types are factorized into codes, every label gets the sorted list of rows containing it on either
+    side, and the comments are lower-cased once for searching. Filters return row positions, and only the rows
+    of the requested page are ever taken from the frame.
+
+    Args:
+        df (pd.DataFrame): DataFrame returned by compare_prediction_columns.
+        prediction_column_x (str): The column for the first set of predictions.
+        prediction_column_y (str): The column for the second set of predictions.
+        type_column (str): The column holding the type of change.
+        comment_column (str): The column holding the comments.
+        indicators (tuple): The result of label_indicator_matrices on df, computed when not given.
+    """
+
+    def __init__(self, df, prediction_column_x='prediction_x', prediction_column_y='prediction_y',
+                 type_column='type', comment_column='comment', indicators=None):
+        self.df = df
+
+        # Step 1: One code per change type
+        self.type_codes, types = pd.factorize(df[type_column])
+        self.types = list(types)
+
+        # Step 2: Rows of every label, as the columns of a sparse rows-by-labels matrix
+        vocabulary, matrix_x, matrix_y = indicators or label_indicator_matrices(df, prediction_column_x,
+                                                                                prediction_column_y)
+        postings = (matrix_x + matrix_y).tocsc()
+        postings.sort_indices()
+        self.labels = list(vocabulary)
+        self._label_codes = {label: code for code, label in enumerate(self.labels)}
+        self._label_offsets = postings.indptr
+        self._label_rows = postings.indices
+
+        # Step 3: Comments lower-cased once, so searches are case-insensitive without lower-casing every time
+        self._comments = df[comment_column].fillna('').astype(str).str.lower()
+
+        # The index is shared through the result cache by every session, each running in its own thread
+        self._filters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, and kept filter results are cheap to recompute
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_filters'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the index and its kept filter results, without the indexed frame, which is kept by its caller.
+        """
+        with self._lock:
+            arrays = [self.type_codes, self._label_offsets, self._label_rows] + list(self._filters.values())
+        label_bytes = sum(sys.getsizeof(label) for label in self.labels)
+        return sum(array.nbytes for array in arrays) + label_bytes + int(self._comments.memory_usage(deep=True))
+
+    def label_rows(self, label):
+        """
+        Returns the sorted positions of the rows containing a label in either prediction.
+        """
+        code = self._label_codes.get(label)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return self._label_rows[self._label_offsets[code]:self._label_offsets[code + 1]]
+
+    def filter(self, types=None, labels=None, search=None):
+        """
+        Returns the positions of the rows matching every given filter.
+
+        Args:
+            types (list): Change types to keep, any of self.types.
+            labels (list): Labels to keep, rows containing any of them in either prediction match.
+            search (str): Text the comment has to contain, ignoring case.
+
+        Returns:
+            np.ndarray: Sorted row positions.
+        """
+        key = (tuple(types or ()), tuple(labels or ()), search or '')
+        with self._lock:
+            rows = self._filters.get(key)
+        if rows is not None:
+            return rows
+
+        keep = np.ones(len(self.df), dtype=bool)
+        if types:
+            codes = [code for code, change_type in enumerate(self.types) if change_type in set(types)]
+            keep &= np.isin(self.type_codes, codes)
+        if labels:
+            label_mask = np.zeros(len(self.df), dtype=bool)
+            for label in labels:
+                label_mask[self.label_rows(label)] = True
+            keep &= label_mask
+        if search:
+            # Only the rows still matching are searched
+            candidates = np.flatnonzero(keep)
+            keep[candidates] = self._comments.iloc[candidates].str.contains(search.lower(), regex=False).to_numpy()
+
+        # Filters are computed outside the lock, so one session's search does not hold up the others
+        rows = np.flatnonzero(keep)
+        with self._lock:
+            self._filters[key] = rows
+            while len(self._filters) > FILTER_CACHE_SIZE:
+                self._filters.popitem(last=False)
+        return rows
+
+    @staticmethod
+    def page_count(rows, page_size):
+        """
+        Returns the number of pages needed for the filtered rows, at least 1.
+        """
+        return max(1, -(-len(rows) // page_size))
+
+    def page(self, rows, page, page_size=50, frame=None):
+        """
+        Returns one page of filtered rows.
+
+        Args:
+            rows (np.ndarray): Row positions returned by filter.
+            page (int): Page number, starting at 1.
+            page_size (int): Rows per page.
+            frame (pd.DataFrame): Frame to take the rows from, in the same row order as the indexed one, such as a
+                copy with renamed columns. Defaults to the indexed frame.
+
+        Returns:
+            pd.DataFrame: The rows of the page.
+        """
+        frame = self.df if frame is None else frame
+        start = (page - 1) * page_size
+        return frame.iloc[rows[start:start + page_size]]
@@ -0,0 +1,296 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from level_agreement.monitoring.stages import instrumented
+
+# Metrics of predictions_metrics that get an interval
+INTERVAL_METRICS = ["Overall Accuracy", "Kappas Score"]
+
+# Columns of the interval tables
+INTERVAL_COLUMNS = ["Metric", "Method", "Estimate", "Lower", "Upper", "Standard Error"]
+
+# Resamples of a batch, the unit of work sent to the worker pool
+BATCH_RESAMPLES = 50
+
+# Batches are also capped so their (resamples, cells) count matrix stays around this many values
+BATCH_CELLS = 2 ** 22
+
+# Cell counts are drawn from one multinomial per resample while there are fewer cells than this share of the
+# rows, above it drawing the rows and summing them into cells is cheaper
+MULTINOMIAL_CELL_SHARE = 0.25
+
+# Cells of the pool a worker process belongs to, set once by _inherit_cells when the worker starts
+_worker_cells = None
+
+
+def _segment_sums(values, ends):
+    """
+    Sums consecutive runs of values along the last axis, every run ending at one of the ends positions.
+    """
+    totals = np.cumsum(values, axis=-1)[..., ends]
+    return np.diff(totals, axis=-1, prepend=0)
+
+
+def _scores(rows, correct, expected):
+    """
+    Computes accuracy and kappa the way MetricsAccumulator does, from the rows, agreeing rows and expected
+    agreement of every resample.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kappa = np.where(rows != expected, 1 - (rows - correct) / (rows - expected), np.nan)
+    return correct / rows, kappa
+
+
+class ConfusionCells:
+    """
+    The confusion counts of a MetricsAccumulator as integer arrays, one entry per (prediction_x, prediction_y)
+    pair or cell, which is all accuracy and kappa depend on.
+
+    Attributes:
+        counts (np.ndarray): Rows of every cell.
+        agree (np.ndarray): Whether the cell's predictions agree.
+        shared_x (np.ndarray): Position of the cell's X prediction among the predictions used on both sides,
+            -1 when Y never uses it.
+        shared_y (np.ndarray): The same for the cell's Y prediction.
+        shared (int): Number of predictions used on both sides.
+    """
+
+    def __init__(self, metrics):
+        index = metrics.confusion.index
+        self.counts = metrics.confusion.to_numpy(dtype='int64')
+        self.agree = np.zeros(0, dtype=bool)
+        self.shared_x = self.shared_y = np.zeros(0, dtype=np.int64)
+        self.shared = 0
+        if self.counts.size == 0:
+            return
+
+        # Step 1: Predictions are matched across the two sides the way MetricsAccumulator.kappa matches them
+        level_x, level_y = index.levels
+        matches = level_y.get_indexer(level_x)
+        positions_x = np.full(len(level_x), -1, dtype=np.int64)
+        positions_y = np.full(len(level_y), -1, dtype=np.int64)
+        used = matches >= 0
+        self.shared = int(used.sum())
+        positions_x[used] = np.arange(self.shared)
+        positions_y[matches[used]] = np.arange(self.shared)
+
+        # Step 2: Order the cells by their shared X prediction, so every X margin is a run of cells
+        codes_x, codes_y = index.codes
+        order = np.argsort(positions_x[codes_x], kind='stable')
+        codes_x, codes_y, self.counts = codes_x[order], codes_y[order], self.counts[order]
+        self.shared_x, self.shared_y = positions_x[codes_x], positions_y[codes_y]
+        self.agree = (matches[codes_x] == codes_y) & level_x.notna()[codes_x]
+
+        # Step 3: Where every shared prediction's run of cells ends, the Y cells taken in shared order
+        self._first_x = int(np.searchsorted(self.shared_x, 0))
+        self._ends_x = np.flatnonzero(np.diff(self.shared_x[self._first_x:], append=self.shared))
+        order_y = np.flatnonzero(self.shared_y >= 0)
+        self._order_y = order_y[np.argsort(self.shared_y[order_y], kind='stable')]
+        self._ends_y = np.flatnonzero(np.diff(self.shared_y[self._order_y], append=self.shared))
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def rows(self):
+        return int(self.counts.sum())
+
+    @property
+    def multinomial(self):
+        """
+        Whether resamples are drawn as multinomial cell counts, rather than row by row.
+        """
+        return len(self) < MULTINOMIAL_CELL_SHARE * self.rows
+
+    def statistics(self, counts):
+        """
+        Computes accuracy and kappa from cell counts, one set of counts per row of a (resamples, cells) matrix.
+
+        Returns:
+            tuple: (accuracy, kappa), arrays of one value per resample for a matrix, floats for one set of counts.
+        """
+        rows = counts.sum(axis=-1)
+        correct = counts @ self.agree.astype(np.int64)
+        if self.shared == 0:
+            return _scores(rows, correct, np.zeros_like(rows, dtype=float))
+
+        # Expected agreement comes from how often each shared prediction is used on each side
+        margin_x = _segment_sums(counts[..., self._first_x:], self._ends_x)
+        margin_y = _segment_sums(counts[..., self._order_y], self._ends_y)
+        return _scores(rows, correct, (margin_x * margin_y).sum(axis=-1) / rows)
+
+    def resample(self, rng, resamples):
+        """
+        Draws bootstrap resamples of the rows behind the cells and scores them.
+
+        Resampling rows with replacement gives the cells multinomial counts. With few cells the counts of the
+        whole batch are drawn at once and scored as one matrix. With about one row per cell, a multinomial
+        over every cell costs more than drawing the rows, so rows are drawn and summed into cell counts one
+        resample at a time.
+
+        Returns:
+            tuple: (accuracy, kappa) arrays, one value per resample.
+        """
+        rows = self.rows
+        if self.multinomial:
+            return self.statistics(rng.multinomial(rows, self.counts / rows, size=resamples))
+
+        # The rows of every cell are contiguous, so the rows drawn are summed into cell counts in one pass
+        starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+        scores = [self.statistics(np.add.reduceat(np.bincount(rng.integers(0, rows, rows), minlength=rows), starts))
+                  for _ in range(resamples)]
+        return np.array([accuracy for accuracy, _ in scores]), np.array([kappa for _, kappa in scores])
+
+
+def _bootstrap_batches(cells, batches):
+    """
+    Draws and scores a list of (resamples, seed) batches, returning accuracy and kappa of every resample.
+    """
+    results = [cells.resample(np.random.default_rng(seed), resamples) for resamples, seed in batches]
+    return np.concatenate([accuracy for accuracy, _ in results]), np.concatenate([kappa for _, kappa in results])
+
+
+def _inherit_cells(cells):
+    """
+    Keeps the cells of the pool in the worker process, forked workers inherit them without pickling.
+    """
+    global _worker_cells
+    _worker_cells = cells
+
+
+def _bootstrap_worker_batches(batches):
+    """
+    Draws batches of the cells the worker process was started with.
+    """
+    return _bootstrap_batches(_worker_cells, batches)
+
+
+def _interval_table(method, estimates, lower, upper, errors):
+    """
+    Builds one row per metric in INTERVAL_METRICS, with INTERVAL_COLUMNS.
+    """
+    columns = [np.asarray(values, dtype=float) for values in (estimates, lower, upper, errors)]
+    return pd.DataFrame(dict(zip(INTERVAL_COLUMNS, [INTERVAL_METRICS, method] + columns)), columns=INTERVAL_COLUMNS)
+
+
+def bootstrap_intervals(metrics, resamples=1000, confidence=0.95, seed=0, workers=None):
+    """
+    Computes percentile bootstrap intervals of accuracy and kappa from the confusion counts.
+
+    Accuracy and kappa only depend on how many rows fall in every (prediction_x, prediction_y) cell, so a
+    resample of the rows is a multinomial draw of the cell counts, scored with array operations on the counts
+    instead of the rows. Resamples are drawn in batches spread over a pool of worker processes, each batch
+    seeded from its own child of one SeedSequence, so the result depends on the seed but not on the number of
+    workers.
+
+    Args:
+        metrics (MetricsAccumulator): Confusion counts of the comparison.
+        resamples (int): Number of bootstrap resamples.
+        confidence (float): Confidence level of the intervals.
+        seed (int): Seed of the resamples.
+        workers (int): Number of worker processes. Defaults to the number of CPU cores.
+
+    Returns:
+        pd.DataFrame: One row per metric in INTERVAL_METRICS, with INTERVAL_COLUMNS.
+    """
+    cells = ConfusionCells(metrics)
+    if cells.rows == 0:
+        raise ValueError("No predictions to resample, please check your input files")
+
+    # Step 1: Split the resamples into batches, every batch with its own seed
+    batch_size = max(1, min(BATCH_RESAMPLES, BATCH_CELLS // len(cells)))
+    sizes = [min(batch_size, resamples - start) for start in range(0, resamples, batch_size)]
+    batches = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+    # Step 2: Give every worker an equal share of the batches, so the cells are sent once per worker
+    workers = max(1, min(workers or os.cpu_count() or 1, len(batches)))
+    tasks = [batches[number::workers] for number in range(workers)]
+    if workers == 1:
+        results = [_bootstrap_batches(cells, batches)]
+    else:
+        # Every pool gives its own cells to its workers as they start, so concurrent callers do not share them
+        with ProcessPoolExecutor(max_workers=workers, initializer=_inherit_cells, initargs=(cells,)) as pool:
+            results = list(pool.map(_bootstrap_worker_batches, tasks))
+
+    # Step 3: Percentile intervals of every metric over all resamples
+    estimates = cells.statistics(cells.counts)
+    tail = (1 - confidence) / 2 * 100
+    lower, upper, errors = [], [], []
+    for number in range(len(INTERVAL_METRICS)):
+        values = np.concatenate([result[number] for result in results])
+        values = values[~np.isnan(values)]
+        low, high = np.percentile(values, [tail, 100 - tail]) if len(values) else (np.nan, np.nan)
+        lower.append(low)
+        upper.append(high)
+        errors.append(values.std(ddof=1) if len(values) > 1 else np.nan)
+
+    return _interval_table("Bootstrap", estimates, lower, upper, errors)
+
+
+def jackknife_intervals(metrics, confidence=0.95):
+    """
+    Computes delete-one jackknife intervals of accuracy and kappa from the confusion counts.
+
+    Leaving out any row of a cell gives the same estimate, so the estimates of all rows come from one closed
+    form per cell rather than one recount per row. The interval is the estimate plus and minus the normal
+    quantile times the jackknife standard error.
+
+    Args:
+        metrics (MetricsAccumulator): Confusion counts of the comparison.
+        confidence (float): Confidence level of the intervals.
+
+    Returns:
+        pd.DataFrame: One row per metric in INTERVAL_METRICS, with INTERVAL_COLUMNS.
+    """
+    cells = ConfusionCells(metrics)
+    rows = cells.rows
+    if rows < 2:
+        raise ValueError("At least two predictions are needed for jackknife intervals")
+
+    # Step 1: Agreeing rows and label margins of the full comparison, a trailing zero standing for unshared
+    counts = cells.counts
+    correct = counts[cells.agree].sum()
+    margin_x = np.append(np.bincount(cells.shared_x[cells.shared_x >= 0], weights=counts[cells.shared_x >= 0],
+                                     minlength=cells.shared), 0)
+    margin_y = np.append(np.bincount(cells.shared_y[cells.shared_y >= 0], weights=counts[cells.shared_y >= 0],
+                                     minlength=cells.shared), 0)
+
+    # Step 2: Leaving one row of a cell out lowers its X and Y margins by one
+    products_left = np.dot(margin_x, margin_y) - margin_y[cells.shared_x] - margin_x[cells.shared_y] + cells.agree
+    replicates = _scores(rows - 1, correct - cells.agree, products_left / (rows - 1))
+
+    # Step 3: Jackknife standard errors, every cell's estimate weighted by its rows
+    estimates = cells.statistics(counts)
+    quantile = NormalDist().inv_cdf((1 + confidence) / 2)
+    errors = []
+    for values in replicates:
+        mean = np.dot(counts, values) / rows
+        errors.append(np.sqrt((rows - 1) / rows * np.dot(counts, (values - mean) ** 2)))
+
+    lower = [estimate - quantile * error for estimate, error in zip(estimates, errors)]
+    upper = [estimate + quantile * error for estimate, error in zip(estimates, errors)]
+    return _interval_table("Jackknife", estimates, lower, upper, errors)
+
+
+@instrumented("confidence_intervals")
+def confidence_intervals(metrics, resamples=1000, confidence=0.95, seed=0, workers=None):
+    """
+    Computes bootstrap and jackknife intervals of accuracy and kappa, see bootstrap_intervals and
+    jackknife_intervals.
+
+    Args:
+        metrics (MetricsAccumulator): Confusion counts of the comparison.
+        resamples (int): Number of bootstrap resamples.
+        confidence (float): Confidence level of the intervals.
+        seed (int): Seed of the bootstrap resamples.
+        workers (int): Number of worker processes for the bootstrap. Defaults to the number of CPU cores.
+
+    Returns:
+        pd.DataFrame: The bootstrap rows followed by the jackknife rows, with INTERVAL_COLUMNS.
+    """
+    return pd.concat([bootstrap_intervals(metrics, resamples, confidence, seed, workers),
+                      jackknife_intervals(metrics, confidence)], ignore_index=True)
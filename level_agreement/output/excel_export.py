@@ -0,0 +1,97 @@
+import importlib.util
+import io
+
+import pandas as pd
+
+from level_agreement.monitoring.stages import instrumented
+
+# Rows of an Excel sheet, the header row included
+EXCEL_MAX_ROWS = 1_048_576
+
+# Rows converted to Python values at a time while streaming
+CHUNK_ROWS = 10_000
+
+# Excel limits sheet names to 31 characters
+SHEET_NAME_LENGTH = 31
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def sheet_names(rows, sheet_name="Prediction Differences", max_rows=EXCEL_MAX_ROWS - 1):
+    """
+    Returns the name of every sheet needed for a number of rows, 'Prediction Differences', then
+    'Prediction Differences 2' and so on.
+    """
+    sheets = max(1, -(-rows // max_rows))
+    names = [sheet_name[:SHEET_NAME_LENGTH]]
+    for number in range(2, sheets + 1):
+        suffix = f" {number}"
+        names.append(sheet_name[:SHEET_NAME_LENGTH - len(suffix)] + suffix)
+    return names
+
+
+def _python_rows(df):
+    """
+    Yields the rows of a DataFrame as lists of Python values, missing values as None, a chunk at a time.
+    """
+    for start in range(0, len(df), CHUNK_ROWS):
+        values = df.iloc[start:start + CHUNK_ROWS].to_numpy(dtype=object)
+        values[pd.isna(values)] = None
+        yield from values.tolist()
+
+
+@instrumented("write_excel")
+def write_excel(df, file_path=None, sheet_name="Prediction Differences", max_rows=EXCEL_MAX_ROWS - 1):
+    """
+    Writes a DataFrame to an .xlsx workbook, streaming rows so the workbook is never held in memory.
+
+    Rows past Excel's sheet limit continue on further sheets, each with the header row. XlsxWriter's
+    constant-memory mode flushes every row once written; without XlsxWriter the rows go through pandas'
+    ExcelWriter, which keeps the workbook in memory. Cells are always written as values, never as formulas or
+    links, so comments starting with '=' stay text.
+
+    Args:
+        df (pd.DataFrame): DataFrame to write.
+        file_path (str): Path or writable buffer. Defaults to a new in-memory buffer.
+        sheet_name (str): Name of the first sheet.
+        max_rows (int): Data rows per sheet.
+
+    Returns:
+        The path or buffer written to, rewound when it is a buffer.
+    """
+    file_path = io.BytesIO() if file_path is None else file_path
+    header = [str(column) for column in df.columns]
+    names = sheet_names(len(df), sheet_name, max_rows)
+
+    if importlib.util.find_spec("xlsxwriter") is None:
+        with pd.ExcelWriter(file_path) as writer:
+            for number, name in enumerate(names):
+                sheet = df.iloc[number * max_rows:(number + 1) * max_rows]
+                sheet.rename(columns=str).to_excel(writer, sheet_name=name, index=False)
+    else:
+        import xlsxwriter
+
+        workbook = xlsxwriter.Workbook(file_path, {
+            "constant_memory": True,
+            "strings_to_formulas": False,
+            "strings_to_urls": False,
+            "nan_inf_to_errors": True,
+        })
+        rows = _python_rows(df)
+        for number, name in enumerate(names):
+            worksheet = workbook.add_worksheet(name)
+            worksheet.write_row(0, 0, header)
+            for row_number in range(1, min(max_rows, len(df) - number * max_rows) + 1):
+                worksheet.write_row(row_number, 0, next(rows))
+        workbook.close()
+
+    if hasattr(file_path, "seek"):
+        file_path.seek(0)
+    return file_path
+
+
+def excel_bytes(df, sheet_name="Prediction Differences"):
+    """
+    Returns a DataFrame as the bytes of an .xlsx workbook, built in memory for a download.
+    """
+    return write_excel(df, sheet_name=sheet_name).getvalue()
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from level_agreement.monitoring.stages import instrumented
+
+# Metric columns of every group, the same as the single row of predictions_metrics
+METRIC_COLUMNS = ["Total Predictions", "Total Correct Predictions", "Total Prediction Differences",
+                  "Overall Accuracy", "Kappas Score"]
+
+
+def _group_totals(group_codes, groups, values):
+    """
+    Sums a value per group, values being one number per row.
+    """
+    return np.bincount(group_codes, weights=values, minlength=groups)
+
+
+@instrumented("grouped_metrics")
+def grouped_metrics(df, group_columns, prediction_column_x='prediction_x', prediction_column_y='prediction_y'):
+    """
+    Calculates the metrics of predictions_metrics for every group of rows sharing the values of some columns.
+
+    Every group's confusion counts are taken at once: rows are factorized into group codes and prediction codes,
+    and the counts, agreements and label margins of all groups come from a few bincounts and one grouped count
+    of (group, prediction) keys. There is no loop over groups, so tens of thousands of groups cost about as much
+    as one.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the comment, prediction and group columns.
+        group_columns (list): Columns to group the rows by, such as a source channel, language or annotator.
+        prediction_column_x (str): The column for the first set of predictions.
+        prediction_column_y (str): The column for the second set of predictions.
+
+    Returns:
+        pd.DataFrame: One row per group, sorted by the group columns, with the group columns and METRIC_COLUMNS.
+    """
+    group_columns = list(group_columns)
+    missing = [column for column in group_columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"DataFrame does not contain the {', '.join(missing)} column(s) to group by")
+
+    # Step 1: One code per group, missing values forming groups of their own
+    grouped = df.groupby(group_columns, dropna=False, sort=True)
+    group_codes = grouped.ngroup().to_numpy()
+    groups = grouped.ngroups
+
+    # Step 2: One shared code per prediction string, so both sides can be counted against each other
+    size = len(df)
+    prediction_codes, predictions = pd.factorize(np.concatenate([
+        df[prediction_column_x].to_numpy(dtype=object), df[prediction_column_y].to_numpy(dtype=object)]),
+        use_na_sentinel=False)
+    codes_x, codes_y = prediction_codes[:size], prediction_codes[size:]
+
+    # Step 3: Rows, comments and agreeing rows per group, agreeing the way predictions_metrics compares them
+    rows = _group_totals(group_codes, groups, None)
+    comments = _group_totals(group_codes, groups, df['comment'].notna().to_numpy())
+    agreeing = (df[prediction_column_x] == df[prediction_column_y]).fillna(False).to_numpy(dtype=bool)
+    correct = _group_totals(group_codes, groups, agreeing)
+
+    # Step 4: Expected agreement per group, from how often each prediction is used on each side of the group
+    keys_x = pd.Series(group_codes * len(predictions) + codes_x).value_counts()
+    keys_y = pd.Series(group_codes * len(predictions) + codes_y).value_counts()
+    shared = keys_x.index.intersection(keys_y.index)
+    expected = _group_totals(shared.to_numpy() // max(len(predictions), 1), groups,
+                             keys_x[shared].to_numpy() * keys_y[shared].to_numpy())
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected_disagreement = rows - expected / rows
+        kappa = np.where(expected_disagreement != 0, 1 - (rows - correct) / expected_disagreement, np.nan)
+
+    metrics = grouped.size().index.to_frame(index=False)
+    metrics["Total Predictions"] = comments.astype(np.int64)
+    metrics["Total Correct Predictions"] = correct.astype(np.int64)
+    metrics["Total Prediction Differences"] = (rows - correct).astype(np.int64)
+    metrics["Overall Accuracy"] = correct / rows
+    metrics["Kappas Score"] = kappa
+    return metrics
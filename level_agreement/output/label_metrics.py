@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+
+from level_agreement.merging.label_vocabulary import encode_label_strings
+from level_agreement.monitoring.stages import instrumented
+
+
+@instrumented("label_indicator_matrices")
+def label_indicator_matrices(df, prediction_column_x='prediction_x', prediction_column_y='prediction_y'):
+    """
+    Encodes both prediction columns as sparse binary indicator matrices over one shared label vocabulary.
+
+    Each distinct prediction string is parsed once. The result can be passed as indicators to label_metrics,
+    label_transition_table and ComparisonIndex, so the predictions are parsed once for all of them. Empty labels, left behind by empty predictions, are not
+    part of the vocabulary.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the cleaned prediction columns.
+        prediction_column_x (str): The column for the first set of predictions.
+        prediction_column_y (str): The column for the second set of predictions.
+
+    Returns:
+        tuple: (vocabulary, matrix_x, matrix_y) where both matrices are CSR matrices of shape (rows, labels).
+    """
+    from scipy import sparse
+
+    size = len(df)
+    values = np.concatenate([
+        df[prediction_column_x].fillna('').to_numpy(dtype=object),
+        df[prediction_column_y].fillna('').to_numpy(dtype=object),
+    ])
+
+    # Step 1: Parse every distinct string once into a shared vocabulary
+    string_codes, strings = pd.factorize(values)
+    vocabulary, offsets, codes = encode_label_strings(np.asarray(strings, dtype=object))
+
+    # Step 2: Move the empty label to the end so it can be sliced off
+    keep = vocabulary != ''
+    order = np.concatenate([np.flatnonzero(keep), np.flatnonzero(~keep)])
+    new_codes = np.empty(len(vocabulary), dtype=np.int64)
+    new_codes[order] = np.arange(len(vocabulary))
+    label_count = int(keep.sum())
+
+    # Step 3: One indicator row per distinct string, then pick the row of every prediction
+    string_matrix = sparse.csr_matrix(
+        (np.ones(len(codes), dtype=np.int8), new_codes[codes], offsets),
+        shape=(len(strings), len(vocabulary)),
+    )[:, :label_count].tocsr()
+
+    return vocabulary[keep], string_matrix[string_codes[:size]], string_matrix[string_codes[size:]]
+
+
+def _divide(numerator, denominator):
+    """
+    Divides element-wise, returning 0 where the denominator is 0.
+    """
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+
+def _binary_kappa(true_positives, false_positives, false_negatives, total):
+    """
+    Computes Cohen's kappa of 2x2 agreement tables, NaN where the expected agreement is perfect.
+    """
+    support_x = true_positives + false_negatives
+    support_y = true_positives + false_positives
+    true_negatives = total - true_positives - false_positives - false_negatives
+
+    observed = (true_positives + true_negatives) / total
+    expected = (support_x * support_y + (total - support_x) * (total - support_y)) / total ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(expected != 1, (observed - expected) / (1 - expected), np.nan)
+
+
+@instrumented("label_metrics")
+def label_metrics(df, prediction_column_x='prediction_x', prediction_column_y='prediction_y', indicators=None):
+    """
+    Calculates agreement metrics for every label, treating prediction_x as the ground truth.
+
+    A row counts as a true positive for a label when both sides contain it. Everything is computed in one pass
+    over sparse indicator matrices, so no dense rows-by-labels matrix is ever built.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the cleaned prediction columns.
+        prediction_column_x (str): The column for the first set of predictions.
+        prediction_column_y (str): The column for the second set of predictions.
+        indicators (tuple): The result of label_indicator_matrices on df, computed when not given.
+
+    Returns:
+        pd.DataFrame: One row per label followed by 'Micro Average' and 'Macro Average' rows.
+    """
+    total = len(df)
+    vocabulary, matrix_x, matrix_y = indicators or label_indicator_matrices(df, prediction_column_x,
+                                                                            prediction_column_y)
+
+    # Per-label counts are column sums of the indicator matrices and of their element-wise product
+    support_x = np.asarray(matrix_x.sum(axis=0)).ravel().astype(np.int64)
+    support_y = np.asarray(matrix_y.sum(axis=0)).ravel().astype(np.int64)
+    true_positives = np.asarray(matrix_x.multiply(matrix_y).sum(axis=0)).ravel().astype(np.int64)
+    false_positives = support_y - true_positives
+    false_negatives = support_x - true_positives
+
+    per_label = pd.DataFrame({
+        "Label": vocabulary,
+        "Support X": support_x,
+        "Support Y": support_y,
+        "True Positives": true_positives,
+        "False Positives": false_positives,
+        "False Negatives": false_negatives,
+        "Precision": _divide(true_positives, support_y),
+        "Recall": _divide(true_positives, support_x),
+        "F1 Score": _divide(2 * true_positives, support_x + support_y),
+        "Kappas Score": _binary_kappa(true_positives, false_positives, false_negatives, total),
+    }).sort_values("Label", ignore_index=True)
+
+    # Micro average pools every (row, label) decision into one table
+    micro_true_positives = true_positives.sum()
+    micro_support_x = support_x.sum()
+    micro_support_y = support_y.sum()
+    micro = {
+        "Label": "Micro Average",
+        "Support X": micro_support_x,
+        "Support Y": micro_support_y,
+        "True Positives": micro_true_positives,
+        "False Positives": micro_support_y - micro_true_positives,
+        "False Negatives": micro_support_x - micro_true_positives,
+        "Precision": float(_divide(micro_true_positives, micro_support_y)),
+        "Recall": float(_divide(micro_true_positives, micro_support_x)),
+        "F1 Score": float(_divide(2 * micro_true_positives, micro_support_x + micro_support_y)),
+        "Kappas Score": float(_binary_kappa(micro_true_positives, micro_support_y - micro_true_positives,
+                                            micro_support_x - micro_true_positives,
+                                            total * len(vocabulary))) if len(vocabulary) else np.nan,
+    }
+
+    # Macro average weighs every label equally
+    macro = per_label.drop(columns="Label").mean().to_dict()
+    macro["Label"] = "Macro Average"
+
+    return pd.concat([per_label, pd.DataFrame([micro, macro])], ignore_index=True)
+
+
+def label_transitions(df, prediction_column_x='prediction_x', prediction_column_y='prediction_y', substitutions=False,
+                      indicators=None):
+    """
+    Counts, for every pair of labels, the rows with the first label in prediction_x and the second in prediction_y.
+
+    The counts are one sparse product of the indicator matrices, X transposed times Y, so only label pairs that
+    occur together are ever stored. With substitutions=True, only the labels a row lost are paired with the
+    labels it gained, which tells which X label became which Y label in changed rows.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the cleaned prediction columns.
+        prediction_column_x (str): The column for the first set of predictions.
+        prediction_column_y (str): The column for the second set of predictions.
+        substitutions (bool): Pair removed labels with added labels only, leaving out the labels both sides share.
+        indicators (tuple): The result of label_indicator_matrices on df, computed when not given.
+
+    Returns:
+        tuple: (vocabulary, transitions) where transitions is a CSR matrix of shape (labels, labels).
+    """
+    vocabulary, matrix_x, matrix_y = indicators or label_indicator_matrices(df, prediction_column_x,
+                                                                            prediction_column_y)
+
+    # The indicators are int8, the counts are not
+    matrix_x, matrix_y = matrix_x.astype(np.int64), matrix_y.astype(np.int64)
+    if substitutions:
+        shared = matrix_x.multiply(matrix_y)
+        matrix_x, matrix_y = matrix_x - shared, matrix_y - shared
+        matrix_x.eliminate_zeros()
+        matrix_y.eliminate_zeros()
+
+    return vocabulary, (matrix_x.T @ matrix_y).tocsr()
+
+
+@instrumented("label_transition_table")
+def label_transition_table(df, prediction_column_x='prediction_x', prediction_column_y='prediction_y', top=None,
+                           substitutions=True, indicators=None):
+    """
+    Lists the most frequent label transitions, one row per pair of different labels.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the cleaned prediction columns.
+        prediction_column_x (str): The column for the first set of predictions.
+        prediction_column_y (str): The column for the second set of predictions.
+        top (int): Number of pairs to keep. Defaults to every pair that occurs.
+        substitutions (bool): Count substitutions only, see label_transitions.
+        indicators (tuple): The result of label_indicator_matrices on df, computed when not given.
+
+    Returns:
+        pd.DataFrame: 'Label X', 'Label Y' and 'Rows' columns, the most frequent pairs first.
+    """
+    vocabulary, transitions = label_transitions(df, prediction_column_x, prediction_column_y, substitutions,
+                                                indicators)
+    transitions = transitions.tocoo()
+
+    # A label staying the same is not a transition
+    different = transitions.row != transitions.col
+    rows, columns, counts = transitions.row[different], transitions.col[different], transitions.data[different]
+
+    # Only the top pairs are sorted, so thousands of labels stay cheap. Pairs tied with the last one kept are taken
+    # in label order, as in the table, so the same pairs are kept on every run
+    if top is not None and top < len(counts):
+        top = max(top, 0)
+        threshold = -np.partition(-counts, top - 1)[top - 1] if top else np.inf
+        above = np.flatnonzero(counts > threshold)
+        tied = np.flatnonzero(counts == threshold)
+        tied = tied[np.lexsort((vocabulary[columns[tied]], vocabulary[rows[tied]]))][:top - len(above)]
+        keep = np.concatenate([above, tied])
+        rows, columns, counts = rows[keep], columns[keep], counts[keep]
+    order = np.lexsort((vocabulary[columns], vocabulary[rows], -counts))
+
+    return pd.DataFrame({
+        "Label X": vocabulary[rows[order]],
+        "Label Y": vocabulary[columns[order]],
+        "Rows": counts[order],
+    })
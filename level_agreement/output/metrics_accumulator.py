@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+
+class MetricsAccumulator:
+    """
+    Keeps the counts behind predictions_metrics so metrics can be built up chunk by chunk.
+
+    Only the number of comments and the confusion counts of (prediction_x, prediction_y) pairs are kept, so
+    memory depends on the number of distinct predictions rather than the number of rows. Accumulators filled
+    from different chunks, threads or processes can be combined with merge(), and rows can be taken away again
+    with remove().
+
+    Args:
+        prediction_column_x (str): The column for the first set of predictions.
+        prediction_column_y (str): The column for the second set of predictions.
+    """
+
+    def __init__(self, prediction_column_x='prediction_x', prediction_column_y='prediction_y'):
+        self.prediction_column_x = prediction_column_x
+        self.prediction_column_y = prediction_column_y
+        self.total_comments = 0
+        self.confusion = pd.Series(dtype='int64')
+
+    def update(self, df):
+        """
+        Adds the rows of a chunk of the merged DataFrame.
+
+        Args:
+            df (pd.DataFrame): Chunk containing the comment and prediction columns.
+
+        Returns:
+            MetricsAccumulator: This accumulator.
+        """
+        self.total_comments += int(df['comment'].count())
+        counts = df.groupby([self.prediction_column_x, self.prediction_column_y], dropna=False, sort=False).size()
+        return self._add_counts(counts)
+
+    def remove(self, df):
+        """
+        Takes away the rows of a chunk added earlier, such as rows that changed since the counts were built.
+
+        Args:
+            df (pd.DataFrame): Chunk containing the comment and prediction columns.
+
+        Returns:
+            MetricsAccumulator: This accumulator.
+        """
+        self.total_comments -= int(df['comment'].count())
+        counts = df.groupby([self.prediction_column_x, self.prediction_column_y], dropna=False, sort=False).size()
+        return self._add_counts(-counts)
+
+    def update_counts(self, confusion, total_comments=None):
+        """
+        Adds precomputed confusion counts.
+
+        Args:
+            confusion (pd.Series): Counts indexed by (prediction_x, prediction_y) pairs.
+            total_comments (int): Number of comments behind the counts. Defaults to the sum of the counts.
+
+        Returns:
+            MetricsAccumulator: This accumulator.
+        """
+        self.total_comments += int(confusion.sum() if total_comments is None else total_comments)
+        return self._add_counts(confusion)
+
+    def merge(self, other):
+        """
+        Adds the counts of another accumulator to this one.
+
+        Args:
+            other (MetricsAccumulator): Accumulator filled from other rows.
+
+        Returns:
+            MetricsAccumulator: This accumulator.
+        """
+        self.total_comments += other.total_comments
+        return self._add_counts(other.confusion)
+
+    def _add_counts(self, counts):
+        if self.confusion.empty:
+            self.confusion = counts.astype('int64')
+            return self
+        if counts.empty:
+            return self
+
+        # Pairs are matched on the codes of their predictions, aligning or appending the pair indexes would
+        # recode every distinct prediction even when only a few pairs are added
+        index = self.confusion.index
+        levels, added_codes = [], []
+        for number in range(2):
+            level = index.levels[number]
+            values = counts.index.get_level_values(number)
+            codes = level.get_indexer(values)
+            missing = codes < 0
+            if missing.any():
+                new_values = values[missing].unique()
+                codes[missing] = len(level) + new_values.get_indexer(values[missing])
+                level = level.append(new_values)
+            levels.append(level)
+            added_codes.append(codes.astype('int64'))
+
+        width = len(levels[1])
+        positions = pd.Index(index.codes[0].astype('int64') * width + index.codes[1]).get_indexer(
+            added_codes[0] * width + added_codes[1])
+        found = positions >= 0
+
+        added = counts.to_numpy(dtype='int64')
+        values = self.confusion.to_numpy(dtype='int64', copy=True)
+        np.add.at(values, positions[found], added[found])
+        codes = [np.concatenate([index.codes[number], added_codes[number][~found]]) for number in range(2)]
+        confusion = pd.Series(np.concatenate([values, added[~found]]),
+                              index=pd.MultiIndex(levels=levels, codes=codes, names=index.names))
+
+        # Pairs whose rows were all removed would otherwise stay around as zero counts
+        self.confusion = confusion[confusion != 0]
+        return self
+
+    @property
+    def total_rows(self):
+        return int(self.confusion.sum())
+
+    @property
+    def total_correct(self):
+        if self.confusion.empty:
+            return 0
+        # A pair agrees when both codes point at the same prediction, missing predictions never agree
+        index = self.confusion.index
+        level_x, level_y = index.levels
+        same = level_y.get_indexer(level_x)[index.codes[0]] == index.codes[1]
+        same &= level_x.notna()[index.codes[0]]
+        return int(self.confusion.to_numpy(dtype='int64')[same].sum())
+
+    def kappa(self):
+        """
+        Computes Cohen's kappa from the confusion counts.
+
+        Returns:
+            float: Kappa score, NaN when the expected agreement is perfect.
+        """
+        total = self.total_rows
+        if total == 0:
+            return float('nan')
+
+        # Expected agreement comes from how often each label is used on each side
+        index = self.confusion.index
+        values = self.confusion.to_numpy(dtype='int64')
+        counts_x, counts_y = [np.bincount(index.codes[number], weights=values, minlength=len(index.levels[number]))
+                              for number in range(2)]
+        level_x, level_y = index.levels
+        matches = level_y.get_indexer(level_x)
+        used = matches >= 0
+        expected_agreement = (counts_x[used] * counts_y[matches[used]]).sum() / total
+
+        expected_disagreement = total - expected_agreement
+        if expected_disagreement == 0:
+            return float('nan')
+        return 1 - (total - self.total_correct) / expected_disagreement
+
+    def metrics(self):
+        """
+        Returns the same metrics table as predictions_metrics for all rows added so far.
+
+        Returns:
+            pd.DataFrame: One row of overall metrics.
+        """
+        total_rows = self.total_rows
+        total_correct_predictions = self.total_correct
+
+        metrics = {
+            "Total Predictions": self.total_comments,
+            "Total Correct Predictions": total_correct_predictions,
+            "Total Prediction Differences": total_rows - total_correct_predictions,
+            "Overall Accuracy": total_correct_predictions / total_rows if total_rows else float('nan'),
+            "Kappas Score": self.kappa(),
+        }
+
+        return pd.DataFrame([metrics])
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+
+from level_agreement.monitoring.stages import instrumented
+
+
+def _category_counts(codes):
+    """
+    Counts how many annotators gave every category to every row, skipping missing predictions.
+
+    Only the (row, category) pairs that occur are returned, so the counts stay small with many categories.
+
+    Returns:
+        tuple: (rows, categories, counts) arrays, one entry per (row, category) pair that occurs.
+    """
+    rows, _ = np.nonzero(codes >= 0)
+    width = int(codes.max(initial=0)) + 1
+    pairs, counts = np.unique(rows * width + codes[codes >= 0], return_counts=True)
+    return pairs // width, pairs % width, counts
+
+
+def fleiss_kappa(codes):
+    """
+    Computes Fleiss' kappa over the rows every annotator labelled.
+
+    Args:
+        codes (np.ndarray): Category codes of shape (rows, annotators), -1 for missing predictions.
+
+    Returns:
+        float: Fleiss' kappa, NaN when there are no complete rows or the expected agreement is perfect.
+    """
+    codes = codes[(codes >= 0).all(axis=1)]
+    rows, annotators = codes.shape
+    if rows == 0 or annotators < 2:
+        return float('nan')
+
+    row_of, category_of, counts = _category_counts(codes)
+
+    # Agreement of every row is the share of annotator pairs that agree on it
+    squares = np.bincount(row_of, weights=counts.astype(float) ** 2, minlength=rows)
+    observed = ((squares - annotators) / (annotators * (annotators - 1))).mean()
+
+    shares = np.bincount(category_of, weights=counts) / (rows * annotators)
+    expected = (shares ** 2).sum()
+
+    if expected == 1:
+        return float('nan')
+    return float((observed - expected) / (1 - expected))
+
+
+def krippendorff_alpha(codes):
+    """
+    Computes Krippendorff's alpha for nominal data, using every row at least two annotators labelled.
+
+    Args:
+        codes (np.ndarray): Category codes of shape (rows, annotators), -1 for missing predictions.
+
+    Returns:
+        float: Krippendorff's alpha, NaN when there are no pairable values or every value is the same.
+    """
+    # Only rows with two or more predictions can be paired
+    codes = codes[(codes >= 0).sum(axis=1) >= 2]
+    if len(codes) == 0:
+        return float('nan')
+
+    row_of, category_of, counts = _category_counts(codes)
+    values = (codes >= 0).sum(axis=1).astype(float)
+    total = values.sum()
+
+    # Disagreeing pairs within rows, each row weighted by 1 / (values - 1) as in the coincidence matrix
+    squares = np.bincount(row_of, weights=counts.astype(float) ** 2, minlength=len(codes))
+    observed = ((values ** 2 - squares) / (values - 1)).sum()
+
+    category_totals = np.bincount(category_of, weights=counts)
+    expected = (total ** 2 - (category_totals ** 2).sum()) / (total - 1)
+
+    if expected == 0:
+        return float('nan')
+    return float(1 - observed / expected)
+
+
+def _cohen_kappa(codes_a, codes_b, categories):
+    """
+    Computes Cohen's kappa of two annotators from their category codes.
+    """
+    size = len(codes_a)
+    if size == 0:
+        return float('nan')
+    observed = np.count_nonzero(codes_a == codes_b) / size
+    counts_a, counts_b = np.bincount(codes_a, minlength=categories), np.bincount(codes_b, minlength=categories)
+    expected = np.dot(counts_a, counts_b) / size ** 2
+    if expected == 1:
+        return float('nan')
+    return float((observed - expected) / (1 - expected))
+
+
+def pairwise_kappa(codes, names):
+    """
+    Computes Cohen's kappa of every pair of annotators, over the rows both of them labelled.
+
+    Args:
+        codes (np.ndarray): Category codes of shape (rows, annotators), -1 for missing predictions.
+        names (list): The name of every annotator.
+
+    Returns:
+        pd.DataFrame: Symmetric annotators-by-annotators kappa matrix, 1 on the diagonal.
+    """
+    categories = int(codes.max(initial=-1)) + 1
+    matrix = np.eye(len(names))
+    for a in range(len(names)):
+        for b in range(a + 1, len(names)):
+            both = (codes[:, a] >= 0) & (codes[:, b] >= 0)
+            matrix[a, b] = matrix[b, a] = _cohen_kappa(codes[both, a], codes[both, b], categories)
+    return pd.DataFrame(matrix, index=names, columns=names)
+
+
+@instrumented("agreement_metrics")
+def agreement_metrics(annotations):
+    """
+    Calculates the multi-annotator agreement metrics of joined predictions.
+
+    Args:
+        annotations (AnnotatorMatrix): Predictions joined by join_annotators.
+
+    Returns:
+        pd.DataFrame: One row of overall metrics.
+    """
+    codes = annotations.codes
+    complete = (codes >= 0).all(axis=1)
+    pairwise = pairwise_kappa(codes, annotations.names).to_numpy()
+    pairs = pairwise[np.triu_indices(len(pairwise), k=1)]
+
+    metrics = {
+        "Annotators": len(annotations.names),
+        "Total Comments": len(codes),
+        "Complete Comments": int(complete.sum()),
+        "Unanimous Comments": int((complete & (codes == codes[:, :1]).all(axis=1)).sum()),
+        "Fleiss Kappa": fleiss_kappa(codes),
+        "Krippendorff Alpha": krippendorff_alpha(codes),
+        "Mean Pairwise Kappa": float(np.nanmean(pairs)) if not np.isnan(pairs).all() else float('nan'),
+    }
+
+    return pd.DataFrame([metrics])
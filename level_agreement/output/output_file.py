@@ -1,8 +1,10 @@
 import pandas as pd
-from sklearn.metrics import cohen_kappa_score
 from pathlib import Path
+from level_agreement.monitoring.stages import instrumented
+from level_agreement.output.metrics_accumulator import MetricsAccumulator
 
 
+@instrumented("predictions_metrics")
 def predictions_metrics(df, prediction_column_x='prediction_x', prediction_column_y='prediction_y'):
     """
     Analyze predictions and calculate overall metrics.
@@ -36,8 +38,8 @@ def predictions_metrics(df, prediction_column_x='prediction_x', prediction_colum
     # matching predictions from total predictions
     overall_accuracy = total_correct_predictions / len(df)
 
-    # Calculate Kappas Sore
-    kappa_score = cohen_kappa_score(df[prediction_column_y], df[prediction_column_x])
+    # Calculate Kappas Score from the counts of every (prediction_x, prediction_y) pair
+    kappa_score = MetricsAccumulator(prediction_column_x, prediction_column_y).update(df).kappa()
 
     # Dictionary to store the overall metrics
     metrics = {
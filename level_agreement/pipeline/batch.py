@@ -0,0 +1,159 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from level_agreement.pipeline.comparison import Comparison
+from level_agreement.merging.incremental_compare import ComparisonSnapshot
+from level_agreement.output.columnar_file import save_comparison
+from level_agreement.output.confidence_intervals import bootstrap_intervals
+
+logger = logging.getLogger(__name__)
+
+# Manifest columns holding the ground-truth and comparison file of every pair
+MANIFEST_COLUMNS = ["x", "y"]
+
+# Diff file formats run_batch can write
+DIFF_FORMATS = ["csv", "parquet", "arrow"]
+
+
+def read_manifest(manifest_path):
+    """
+    Reads a CSV manifest of file pairs, with 'x' and 'y' columns and an optional 'name' column.
+
+    Relative file paths are resolved against the manifest's directory, and pairs without a name are named
+    after their files.
+
+    Args:
+        manifest_path (str): Path to the manifest CSV.
+
+    Returns:
+        pd.DataFrame: One row per pair with 'name', 'x' and 'y' columns.
+    """
+    manifest = pd.read_csv(manifest_path, dtype=str)
+    for column in MANIFEST_COLUMNS:
+        if column not in manifest.columns:
+            raise ValueError(f'Manifest is missing the {column} column')
+    if manifest.empty:
+        raise ValueError('Manifest lists no pairs of files to compare')
+
+    base = Path(manifest_path).parent
+    for column in MANIFEST_COLUMNS:
+        manifest[column] = [str(base / path) for path in manifest[column]]
+
+    names = [f"{Path(x).stem}_vs_{Path(y).stem}" for x, y in zip(manifest["x"], manifest["y"])]
+    if "name" in manifest.columns:
+        names = manifest["name"].fillna(pd.Series(names, index=manifest.index))
+
+    # Repeated names would overwrite each other's diff files
+    names = pd.Series(names, index=manifest.index)
+    repeats = names.groupby(names).cumcount()
+    manifest["name"] = names.where(repeats == 0, names + "_" + repeats.astype(str))
+
+    return manifest[["name"] + MANIFEST_COLUMNS].reset_index(drop=True)
+
+
+def compare_pair(name, file_path_1, file_path_2, output_dir, duplicate_policy="error", diff_format="csv",
+                 incremental=False, resamples=0):
+    """
+    Compares one pair of files and writes its diff file.
+
+    Errors are reported in the returned row instead of raised, so one bad pair does not stop a batch. In
+    incremental mode the pair's snapshot is kept as '<name>.snapshot.pkl', and the next run only compares the
+    rows changed since. With resamples, bootstrap intervals of the accuracy and kappa are added to the row.
+
+    Returns:
+        dict: The pair's metrics, with its name, files, diff file, status and elapsed seconds.
+    """
+    start = time.perf_counter()
+    row = {"Pair": name, "Prediction X": file_path_1, "Prediction Y": file_path_2}
+
+    try:
+        snapshot_path = os.path.join(output_dir, f"{name}.snapshot.pkl")
+        previous = ComparisonSnapshot.load(snapshot_path) if incremental and os.path.exists(snapshot_path) else None
+        comparison = Comparison(file_path_1, file_path_2, duplicate_policy=duplicate_policy, incremental=incremental,
+                                previous=previous)
+        diff_path = os.path.join(output_dir, f"{name}.{diff_format}")
+        if diff_format == "csv":
+            comparison.compared.to_csv(diff_path, index=False)
+        else:
+            save_comparison(comparison.compared, diff_path, file_format=diff_format)
+
+        row.update(comparison.metrics.iloc[0].to_dict())
+        if incremental:
+            comparison.snapshot.save(snapshot_path)
+            row["Recomputed Rows"] = comparison.snapshot.recomputed_rows
+        if resamples:
+            # Pairs already run in parallel, so every pair resamples in its own process
+            intervals = bootstrap_intervals(comparison.metric_counts, resamples, workers=1)
+            for interval in intervals.to_dict("records"):
+                row.update({f"{interval['Metric']} Lower": interval["Lower"],
+                            f"{interval['Metric']} Upper": interval["Upper"]})
+        row.update({"Diff File": diff_path, "Status": "OK"})
+    except Exception as e:
+        logger.error(f"Comparing {name} failed: {e}")
+        row.update({"Status": f"Error: {e}"})
+
+    row["Seconds"] = time.perf_counter() - start
+    return row
+
+
+def run_batch(manifest, output_dir, workers=None, duplicate_policy="error", diff_format="csv", incremental=False,
+              resamples=0):
+    """
+    Compares every pair of a manifest across a pool of worker processes.
+
+    Every pair's diff file is written to the output directory as '<name>.<format>', and the metrics of all pairs
+    are written to 'metrics.csv' next to them.
+
+    Args:
+        manifest (pd.DataFrame): Pairs returned by read_manifest.
+        output_dir (str): Directory for the diff files and the metrics table.
+        workers (int): Number of worker processes. Defaults to the number of CPU cores.
+        duplicate_policy (str): How rows sharing an id and comment are resolved, one of DUPLICATE_POLICIES.
+        diff_format (str): One of DIFF_FORMATS.
+        incremental (bool): Keep a snapshot of every pair, and only compare the rows changed since the last run.
+        resamples (int): Number of bootstrap resamples for the 95% intervals of every pair's accuracy and kappa,
+            none when 0.
+
+    Returns:
+        tuple: (metrics DataFrame with one row per pair, summary dict with the throughput of the batch)
+    """
+    if diff_format not in DIFF_FORMATS:
+        raise ValueError(f"Unknown diff format '{diff_format}', expected one of {DIFF_FORMATS}")
+    if manifest.empty:
+        raise ValueError("Manifest lists no pairs of files to compare")
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, max(len(manifest), 1))
+    arguments = [manifest["name"], manifest["x"], manifest["y"]] + \
+        [[value] * len(manifest) for value in [output_dir, duplicate_policy, diff_format, incremental, resamples]]
+
+    start = time.perf_counter()
+    if workers == 1:
+        rows = list(map(compare_pair, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(compare_pair, *arguments))
+    elapsed = time.perf_counter() - start
+
+    # Failed pairs leave their counts missing, keep the counts integers anyway
+    metrics = pd.DataFrame(rows)
+    count_columns = ["Total Predictions", "Total Correct Predictions", "Total Prediction Differences"]
+    metrics = metrics.astype({column: "Int64" for column in count_columns if column in metrics.columns})
+    metrics.to_csv(os.path.join(output_dir, "metrics.csv"), index=False)
+
+    succeeded = metrics["Status"] == "OK"
+    total_rows = int(metrics.loc[succeeded, "Total Predictions"].sum()) if succeeded.any() else 0
+    summary = {
+        "Pairs": len(metrics),
+        "Failed Pairs": int((~succeeded).sum()),
+        "Total Rows": total_rows,
+        "Seconds": elapsed,
+        "Pairs per Second": len(metrics) / max(elapsed, 1e-9),
+        "Rows per Second": total_rows / max(elapsed, 1e-9),
+    }
+    return metrics, summary
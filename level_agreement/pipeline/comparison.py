@@ -0,0 +1,250 @@
+from functools import cached_property
+
+import pandas as pd
+
+from level_agreement.validation.file_validation import reconcile_ids
+from level_agreement.validation.schema import FileSchema
+from level_agreement.validation.duplicate_keys import resolve_duplicate_keys, estimate_merge_size
+from level_agreement.merging.merging_df import join_predictions, compare_merged_predictions
+from level_agreement.merging.incremental_compare import incremental_compare
+from level_agreement.output.output_file import predictions_metrics
+from level_agreement.output.label_metrics import label_indicator_matrices, label_metrics, label_transition_table
+from level_agreement.output.grouped_metrics import grouped_metrics
+from level_agreement.output.metrics_accumulator import MetricsAccumulator
+from level_agreement.output.confidence_intervals import confidence_intervals
+from level_agreement.output.comparison_index import ComparisonIndex
+from level_agreement.upload.file_upload import load_file, REQUIRED_COLUMNS
+
+
+class Comparison:
+    """
+    Compares a ground-truth file with a comparison file, running every stage at most once.
+
+    Each stage is computed the first time it is used and kept, so the UI, the exports and any headless caller
+    can share the same validated frames, merge, comparison and metrics:
+
+        comparison = Comparison("human.csv", "model.csv")
+        comparison.differences.to_csv("prediction_differences.csv", index=False)
+        comparison.metrics
+
+    Args:
+        file_1: Ground-truth DataFrame, file path or uploaded file.
+        file_2: Comparison DataFrame, file path or uploaded file.
+        comment_fingerprint (int): Join on a 64 or 128-bit fingerprint of the comment instead of its text.
+        duplicate_policy (str): How rows sharing an id and comment are resolved before the join, one of
+            DUPLICATE_POLICIES. Defaults to raising a ValueError, where earlier versions joined every such row with
+            every matching row of the other file.
+        incremental (bool): Compare through incremental_compare, keeping a snapshot for the next run.
+        previous (ComparisonSnapshot): Snapshot of an earlier run, only the rows changed since are compared.
+            Implies incremental.
+        group_columns (list): Columns of the ground-truth file to break the metrics down by, see grouped_metrics.
+        resamples (int): Number of bootstrap resamples behind the confidence intervals.
+        workers (int): Number of worker processes drawing the bootstrap resamples. Defaults to 1, drawing them in
+            this process, None uses every CPU core.
+        max_merge_rows (int): Largest merge allowed, counted with merge_size before joining. Repeated keys are
+            already resolved, which keeps the merge within the smaller file, so by default it is not counted.
+    """
+
+    def __init__(self, file_1, file_2, comment_fingerprint=None, duplicate_policy="error", incremental=False,
+                 previous=None, group_columns=None, resamples=1000,
+                 workers=1, max_merge_rows=None):
+        self.file_1 = file_1
+        self.file_2 = file_2
+        self.comment_fingerprint = comment_fingerprint
+        self.duplicate_policy = duplicate_policy
+        self.incremental = incremental or previous is not None
+        self.previous = previous
+        self.group_columns = list(group_columns or [])
+        self.resamples = resamples
+        self.workers = workers
+        self.max_merge_rows = max_merge_rows
+
+    @cached_property
+    def dataframes(self):
+        """
+        Both inputs as DataFrames, reading only the columns the comparison uses from files.
+
+        The group columns are read from the ground-truth file only, so the join does not suffix them.
+        """
+        df1, df2 = [file if isinstance(file, pd.DataFrame) else load_file(file, columns=REQUIRED_COLUMNS + columns)
+                    for file, columns in [(self.file_1, self.group_columns), (self.file_2, [])]]
+        if self.group_columns:
+            df2 = df2.drop(columns=self.group_columns, errors="ignore")
+        return [df1, df2]
+
+    @cached_property
+    def checked(self):
+        """
+        Both DataFrames checked against the file schema, with empty cells filled, and their error reports.
+        """
+        schema = FileSchema()
+        return [schema.check(df) for df in self.dataframes]
+
+    @cached_property
+    def validation_report(self):
+        """
+        The problems found in both DataFrames, with the file they were found in.
+        """
+        return pd.concat([report.assign(file=name) for name, (_, report)
+                          in zip(["Prediction X", "Prediction Y"], self.checked)], ignore_index=True)
+
+    @cached_property
+    def deduplicated(self):
+        """
+        Both checked DataFrames, with repeated keys resolved.
+        """
+        return [resolve_duplicate_keys(df, self.duplicate_policy) for df, _ in self.checked]
+
+    @cached_property
+    def duplicate_rows(self):
+        """
+        The number of rows of each DataFrame that shared their id and comment with another row.
+        """
+        return [affected for _, affected in self.deduplicated]
+
+    @cached_property
+    def reconciled(self):
+        """
+        Both deduplicated DataFrames with the report from reconcile_ids.
+        """
+        return reconcile_ids(*[df for df, _ in self.deduplicated])
+
+    @cached_property
+    def validated(self):
+        """
+        Both validated DataFrames, without the IDs missing from the other.
+        """
+        return self.reconciled[:2]
+
+    @cached_property
+    def dropped_ids(self):
+        """
+        The IDs dropped from either DataFrame because the other one does not contain them.
+        """
+        return self.reconciled[2]
+
+    @cached_property
+    def merge_size(self):
+        """
+        The number of rows the merge will produce, counted before joining.
+        """
+        return estimate_merge_size(*self.validated)
+
+    @cached_property
+    def merged(self):
+        """
+        The inner join of both DataFrames, with 'prediction_x' and 'prediction_y' columns.
+        """
+        # Refuse a merge larger than the limit before joining
+        if self.max_merge_rows is not None and self.merge_size > self.max_merge_rows:
+            raise ValueError(f"The merge would produce {self.merge_size} rows, more than the limit of "
+                             f"{self.max_merge_rows}, please check your input files")
+
+        merged_df = join_predictions(*self.validated, self.comment_fingerprint)
+
+        # Check to see if merge was successful
+        if merged_df.empty:
+            raise ValueError("Merge Not Successful, please check your input files")
+
+        return merged_df
+
+    @cached_property
+    def snapshot(self):
+        """
+        The comparison and its confusion counts from incremental_compare, to pass as previous to the next run.
+        """
+        # An inner join drops the IDs missing from the other file anyway, so reconciling them first is not needed
+        snapshot = incremental_compare(*[df for df, _ in self.deduplicated], self.previous, self.comment_fingerprint)
+
+        # Check to see if merge was successful
+        if snapshot.compared.empty:
+            raise ValueError("Merge Not Successful, please check your input files")
+
+        return snapshot
+
+    @cached_property
+    def compared(self):
+        """
+        The merged DataFrame with the 'differences', 'prediction_differences' and 'type' columns.
+        """
+        if self.incremental:
+            return self.snapshot.compared
+
+        # Shallow copy so the merged stage keeps its own columns
+        return compare_merged_predictions(self.merged.copy(deep=False))
+
+    @cached_property
+    def differences(self):
+        """
+        The compared DataFrame when any row differs, None when every prediction matches.
+        """
+        if self.compared['differences'].any():
+            return self.compared
+
+        print("Great, Columns match!")
+        return None
+
+    @cached_property
+    def metrics(self):
+        """
+        The overall metrics table returned by predictions_metrics.
+        """
+        if self.incremental:
+            # Updated from the stored confusion counts instead of counting every row again
+            return self.snapshot.metrics.metrics()
+
+        return predictions_metrics(self.compared)
+
+    @cached_property
+    def metric_counts(self):
+        """
+        The confusion counts behind the metrics, as a MetricsAccumulator.
+        """
+        if self.incremental:
+            return self.snapshot.metrics
+
+        return MetricsAccumulator().update(self.compared)
+
+    @cached_property
+    def confidence_intervals(self):
+        """
+        Bootstrap and jackknife intervals of the accuracy and kappa, see confidence_intervals.
+        """
+        return confidence_intervals(self.metric_counts, resamples=self.resamples, workers=self.workers)
+
+    @cached_property
+    def label_indicators(self):
+        """
+        The label vocabulary and the sparse label indicator matrices of both predictions, shared by the per-label
+        metrics, the label substitutions and the index. See label_indicator_matrices.
+        """
+        return label_indicator_matrices(self.compared)
+
+    @cached_property
+    def label_metrics(self):
+        """
+        The per-label metrics table returned by label_metrics.
+        """
+        return label_metrics(self.compared, indicators=self.label_indicators)
+
+    @cached_property
+    def label_substitutions(self):
+        """
+        Every pair of a label removed from X and a label added in Y, with the rows it happened in, most frequent
+        first. See label_transition_table.
+        """
+        return label_transition_table(self.compared, indicators=self.label_indicators)
+
+    @cached_property
+    def index(self):
+        """
+        The ComparisonIndex of the compared rows, to filter and page through them.
+        """
+        return ComparisonIndex(self.compared, indicators=self.label_indicators)
+
+    @cached_property
+    def grouped_metrics(self):
+        """
+        The metrics of every group of rows sharing the values of the group columns, see grouped_metrics.
+        """
+        return grouped_metrics(self.compared, self.group_columns)
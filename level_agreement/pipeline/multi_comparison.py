@@ -0,0 +1,110 @@
+from functools import cached_property
+from pathlib import Path
+
+import pandas as pd
+
+from level_agreement.validation.schema import FileSchema
+from level_agreement.validation.duplicate_keys import resolve_duplicate_keys
+from level_agreement.merging.multi_annotator import join_annotators
+from level_agreement.output.multi_rater_metrics import agreement_metrics, pairwise_kappa
+from level_agreement.upload.file_upload import load_file, REQUIRED_COLUMNS
+
+
+def annotator_name(file, number):
+    """
+    Names an annotator after its file, or by its position for DataFrames.
+    """
+    name = getattr(file, "name", file)
+    return Path(name).stem if isinstance(name, (str, Path)) else f"Annotator {number + 1}"
+
+
+class MultiComparison:
+    """
+    Measures the agreement of any number of files labelling the same comments, running every stage at most once.
+
+    All files are checked, joined and parsed together, and every statistic is computed from the one joined
+    matrix rather than from a two-file comparison per pair. Predictions are compared as whole strings, like
+    Comparison, so the kappa of any two annotators equals the Kappas Score of comparing their files:
+
+        comparison = MultiComparison(["annotator_1.csv", "annotator_2.csv", "model.csv"])
+        comparison.metrics
+        comparison.pairwise_kappa
+
+    Args:
+        files (list): DataFrames, file paths or uploaded files, one per annotator.
+        names (list): Annotator names. Defaults to the file names.
+        duplicate_policy (str): How rows sharing an id and comment are resolved before the join, one of
+            DUPLICATE_POLICIES. Defaults to raising a ValueError.
+        how (str): 'inner' keeps the comments every annotator labelled, 'outer' keeps every comment.
+    """
+
+    def __init__(self, files, names=None, duplicate_policy="error", how="inner"):
+        self.files = list(files)
+        self.names = list(names) if names is not None else \
+            [annotator_name(file, number) for number, file in enumerate(self.files)]
+        self.duplicate_policy = duplicate_policy
+        self.how = how
+
+        # Repeated names would make the columns of the joined frame ambiguous
+        names = pd.Series(self.names)
+        repeats = names.groupby(names).cumcount()
+        self.names = names.where(repeats == 0, names + " (" + (repeats + 1).astype(str) + ")").tolist()
+
+    @cached_property
+    def dataframes(self):
+        """
+        Every input as a DataFrame, reading only the columns the comparison uses from files.
+        """
+        return [file if isinstance(file, pd.DataFrame) else load_file(file, columns=REQUIRED_COLUMNS)
+                for file in self.files]
+
+    @cached_property
+    def checked(self):
+        """
+        Every DataFrame checked against the file schema, with empty cells filled, and its error report.
+        """
+        schema = FileSchema()
+        return [schema.check(df) for df in self.dataframes]
+
+    @cached_property
+    def validation_report(self):
+        """
+        The problems found in every DataFrame, with the annotator they were found in.
+        """
+        return pd.concat([report.assign(file=name) for name, (_, report) in zip(self.names, self.checked)],
+                         ignore_index=True)
+
+    @cached_property
+    def deduplicated(self):
+        """
+        Every checked DataFrame, with repeated keys resolved.
+        """
+        return [resolve_duplicate_keys(df, self.duplicate_policy)[0] for df, _ in self.checked]
+
+    @cached_property
+    def annotations(self):
+        """
+        The predictions of every annotator joined on id and comment, see join_annotators.
+        """
+        return join_annotators(self.deduplicated, self.names, how=self.how)
+
+    @cached_property
+    def joined(self):
+        """
+        The joined predictions as a DataFrame, one cleaned prediction column per annotator.
+        """
+        return self.annotations.frame()
+
+    @cached_property
+    def metrics(self):
+        """
+        The multi-annotator metrics table returned by agreement_metrics.
+        """
+        return agreement_metrics(self.annotations)
+
+    @cached_property
+    def pairwise_kappa(self):
+        """
+        Cohen's kappa of every pair of annotators, as an annotators-by-annotators table.
+        """
+        return pairwise_kappa(self.annotations.codes, self.names)
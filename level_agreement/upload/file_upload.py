@@ -1,21 +1,145 @@
+import importlib.util
+import logging
+import time
+from pathlib import Path
+
 import pandas as pd
 
+from level_agreement.monitoring.stages import instrumented
+
+logger = logging.getLogger(__name__)
+
+# Columns the comparison uses from every uploaded file
+REQUIRED_COLUMNS = ["id", "comment", "prediction"]
+
+# Text columns are read as strings instead of being type-inferred
+COLUMN_DTYPES = {"comment": str, "prediction": str}
+
+# Columnar file extensions load_file reads with pyarrow instead of the CSV parser
+COLUMNAR_EXTENSIONS = (".parquet", ".feather", ".arrow")
+
+
+def csv_engine():
+    """
+    Returns the fastest CSV parser available: pyarrow's multi-threaded reader when installed, otherwise pandas' C parser.
+    """
+    return "pyarrow" if importlib.util.find_spec("pyarrow") is not None else "c"
+
+
+def _rewind(file_path):
+    # Uploaded files are file objects that have to be rewound before being read again
+    if hasattr(file_path, "seek"):
+        file_path.seek(0)
+
+
+def file_extension(file_path):
+    """
+    Returns the lower-case extension of a file path or of an uploaded file's name.
+    """
+    return Path(str(getattr(file_path, "name", file_path))).suffix.lower()
+
+
+def _read_columnar(file_path, columns):
+    """
+    Reads a Parquet or Arrow IPC (Feather) file, memory-mapping it when it is on disk.
+    """
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    memory_map = isinstance(file_path, (str, Path))
+    if file_extension(file_path) == ".parquet":
+        # Parquet stores columns separately, so only the requested ones are decoded
+        if columns is not None:
+            names = pq.read_schema(file_path, memory_map=memory_map).names
+            columns = [column for column in names if column in columns]
+            _rewind(file_path)
+        table = pq.read_table(file_path, columns=columns, memory_map=memory_map)
+    else:
+        table = feather.read_table(file_path, memory_map=memory_map)
+        if columns is not None:
+            table = table.select([column for column in table.column_names if column in columns])
+
+    return table.to_pandas()
+
+
+def file_columns(file_path):
+    """
+    Returns the column names of a CSV, Parquet or Arrow file without reading its rows.
+    """
+    if file_extension(file_path) == ".parquet":
+        import pyarrow.parquet as pq
+        columns = pq.read_schema(file_path).names
+    elif file_extension(file_path) in COLUMNAR_EXTENSIONS:
+        import pyarrow as pa
+        try:
+            # Arrow IPC files, which Feather V2 files are, keep their schema in the footer
+            columns = pa.ipc.open_file(file_path).schema.names
+        except pa.ArrowInvalid:
+            # Only older Feather V1 files have to be read in full
+            import pyarrow.feather as feather
+            _rewind(file_path)
+            columns = feather.read_table(file_path, memory_map=isinstance(file_path, (str, Path))).column_names
+    else:
+        columns = list(pd.read_csv(file_path, nrows=0).columns)
+    _rewind(file_path)
+    return columns
 
-def load_file(file_path):
+
+@instrumented("load_file")
+def load_file(file_path, columns=None, engine=None):
     """
-    This function reads a CSV file.
+    This function reads a CSV file, or a Parquet or Arrow (Feather) file.
     Args:
-        file_path (str): A file path for the CSV file.
+        file_path (str): A file path for the CSV, Parquet or Arrow file.
+        columns (list): Columns to read, any other column is skipped. Columns missing from the file are ignored
+            so validation can report them. Defaults to every column.
+        engine (str): CSV parser to use. Defaults to csv_engine().
     Returns:
         Returns a DataFrame.
     """
-    df = pd.read_csv(file_path)
+    start = time.perf_counter()
+
+    if file_extension(file_path) in COLUMNAR_EXTENSIONS:
+        df = _read_columnar(file_path, columns)
+    else:
+        df = _read_csv(file_path, columns, engine)
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Loaded {len(df)} rows and {len(df.columns)} columns in {elapsed:.2f}s "
+                f"({len(df) / max(elapsed, 1e-9):,.0f} rows/s)")
+
     if not df.empty:
         return df
     else:
         raise AssertionError("DataFrame is empty")
 
 
+def _read_csv(file_path, columns, engine):
+    """
+    Reads a CSV file with the fastest available parser, projecting onto the requested columns.
+    """
+    # Read the header only, to project onto the requested columns that are present
+    usecols = None
+    if columns is not None:
+        header = pd.read_csv(file_path, nrows=0).columns
+        usecols = [column for column in header if column in columns]
+        _rewind(file_path)
+
+    dtype = {column: dtype for column, dtype in COLUMN_DTYPES.items() if usecols is None or column in usecols}
+    engine = engine or csv_engine()
+    try:
+        df = pd.read_csv(file_path, usecols=usecols, dtype=dtype, engine=engine)
+    except Exception as e:
+        if engine == "c":
+            raise
+        # pyarrow rejects a few files pandas accepts, such as missing values in an integer id column
+        logger.warning(f"The {engine} CSV parser could not read the file, using the C parser instead: {e}")
+        _rewind(file_path)
+        df = pd.read_csv(file_path, usecols=usecols, dtype=dtype, engine="c")
+
+    return df
+
+
 def check_file_path_string(file_path):
     """
     This function checks if the loaded file ends with csv
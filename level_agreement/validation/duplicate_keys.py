@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+from level_agreement.monitoring.stages import instrumented
+
+# Columns the files are joined on
+JOIN_KEYS = ["id", "comment"]
+
+# What resolve_duplicate_keys can do with rows sharing a key
+DUPLICATE_POLICIES = ["error", "first", "last", "union"]
+
+
+def join_key_codes(*dataframes, keys=JOIN_KEYS):
+    """
+    Returns one integer code per distinct key across all DataFrames, split back per DataFrame.
+
+    Missing values get a code too, as the join matches them with each other.
+    """
+    sizes = np.cumsum([0] + [len(df) for df in dataframes])
+    codes = np.zeros(sizes[-1], dtype=np.int64)
+    for key in keys:
+        column_codes, uniques = pd.factorize(pd.concat([df[key] for df in dataframes], ignore_index=True),
+                                             use_na_sentinel=False)
+        # Combine the column codes, re-factorizing so the combined codes stay small
+        codes, _ = pd.factorize(codes * len(uniques) + column_codes)
+
+    return [codes[start:end] for start, end in zip(sizes[:-1], sizes[1:])]
+
+
+def duplicate_keys(dataframe, keys=JOIN_KEYS):
+    """
+    Flags the rows whose id and comment appear on another row of the same DataFrame.
+
+    Args:
+        dataframe (pd.DataFrame): DataFrame to check.
+        keys (list): Columns the DataFrame is joined on.
+
+    Returns:
+        np.ndarray: Boolean mask, True for every row that shares its key.
+    """
+    return dataframe.duplicated(keys, keep=False).to_numpy()
+
+
+def estimate_merge_size(dataframe1, dataframe2, keys=JOIN_KEYS):
+    """
+    Counts the rows the inner join of two DataFrames will produce, without joining them.
+
+    Every key contributes the product of its row counts on both sides, so repeated keys show up here before
+    they multiply the merged frame.
+
+    Args:
+        dataframe1 (pd.DataFrame): Ground-truth DataFrame.
+        dataframe2 (pd.DataFrame): Comparison DataFrame.
+        keys (list): Columns the DataFrames are joined on.
+
+    Returns:
+        int: Number of rows in the merged DataFrame.
+    """
+    codes_1, codes_2 = join_key_codes(dataframe1, dataframe2, keys=keys)
+    size = max(codes_1.max(initial=-1), codes_2.max(initial=-1)) + 1
+
+    return int(np.dot(np.bincount(codes_1, minlength=size), np.bincount(codes_2, minlength=size)))
+
+
+def _label_union(dataframe, keys, prediction_column):
+    """
+    Returns the union of the labels of the rows sharing every key, formatted like an uploaded prediction.
+
+    Returns:
+        np.ndarray: One prediction per distinct key, in the order the keys first appear.
+    """
+    key_codes = join_key_codes(dataframe, keys=keys)[0]
+
+    # Step 1: One row per label, cleaned the same way join_predictions cleans predictions
+    predictions = dataframe[prediction_column].fillna('').reset_index(drop=True)
+    labels = predictions.str.strip('[]').str.replace("'", "").str.split(',').explode().str.strip()
+    labels = pd.DataFrame({'key': key_codes[labels.index], 'label': labels.to_numpy()})
+
+    # Step 2: Drop empty and repeated labels within every key, keeping the order they first appear
+    labels = labels[labels['label'] != ''].drop_duplicates()
+
+    # Step 3: Join every key's labels, keys without any label get an empty prediction
+    union = "['" + labels.groupby('key')['label'].agg("', '".join) + "']"
+    first_codes = key_codes[~pd.Series(key_codes).duplicated().to_numpy()]
+    return union.reindex(first_codes).fillna('[]').to_numpy()
+
+
+@instrumented("resolve_duplicate_keys")
+def resolve_duplicate_keys(dataframe, policy="error", keys=JOIN_KEYS, prediction_column='prediction'):
+    """
+    Resolves rows sharing an id and comment, so joining the DataFrame cannot multiply rows.
+
+    Only the rows sharing a key are touched, the others keep their order and values.
+
+    Args:
+        dataframe (pd.DataFrame): DataFrame to check.
+        policy (str): One of DUPLICATE_POLICIES:
+            'error' raises a ValueError when any key is repeated,
+            'first' and 'last' keep the first or last row of every key,
+            'union' keeps the first row of every key with the union of the labels of all its rows.
+        keys (list): Columns the DataFrame is joined on.
+        prediction_column (str): The column holding the predictions, used by 'union'.
+
+    Returns:
+        tuple: (dataframe, affected) where affected is the number of rows that shared their key.
+    """
+    if policy not in DUPLICATE_POLICIES:
+        raise ValueError(f"Unknown duplicate policy '{policy}', expected one of {DUPLICATE_POLICIES}")
+
+    duplicates = duplicate_keys(dataframe, keys)
+    affected = int(duplicates.sum())
+    if not affected:
+        return dataframe, affected
+
+    if policy == "error":
+        raise ValueError(f"{affected} rows share an id and comment with another row, please check your input files")
+
+    if policy in ("first", "last"):
+        return dataframe.drop_duplicates(keys, keep=policy), affected
+
+    # Only the duplicated rows are regrouped, their union replaces the prediction of the first row of every key
+    first = ~dataframe.duplicated(keys, keep='first').to_numpy()
+    resolved = dataframe[first].copy()
+    rows = np.flatnonzero(duplicates[first])
+    resolved.iloc[rows, resolved.columns.get_loc(prediction_column)] = _label_union(dataframe[duplicates], keys,
+                                                                                    prediction_column)
+    return resolved, affected
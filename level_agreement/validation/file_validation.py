@@ -1,6 +1,13 @@
+import logging
+
+import numpy as np
 import pandas as pd
+from level_agreement.monitoring.stages import instrumented
+
+logger = logging.getLogger(__name__)
 
 
+@instrumented("validate_file_column")
 def validate_file_column(dataframe):
     """
     This function checks to see if columns are present
@@ -16,6 +23,7 @@ def validate_file_column(dataframe):
     return dataframe
 
 
+@instrumented("validate_empty_file")
 def validate_empty_file(dataframe):
     """
     This function validates whether a DataFrame
@@ -29,6 +37,7 @@ def validate_empty_file(dataframe):
         raise AssertionError("DataFrame is empty")
 
 
+@instrumented("validate_empty_rows")
 def validate_empty_rows(dataframe):
     """
     This function validates whether a DataFrame
@@ -48,18 +57,59 @@ def validate_empty_rows(dataframe):
         return dataframe
 
 
+@instrumented("reconcile_ids")
+def reconcile_ids(dataframe1, dataframe2):
+    """
+    Drops the rows whose ID is missing from the other DataFrame, and reports which IDs were dropped.
+
+    The ID columns of both DataFrames are factorized together into one shared index, and every row is kept when
+    its ID code also occurs on the other side, so the IDs are hashed once for both directions and the whole
+    pass stays linear in the number of rows.
+
+    Args:
+        dataframe1 (pd.DataFrame): Ground-truth DataFrame.
+        dataframe2 (pd.DataFrame): Comparison DataFrame.
+
+    Returns:
+        tuple: (dataframe1, dataframe2, report) where report has one row per dropped ID with the 'id', the file
+        it was 'Dropped From' ('Prediction X' or 'Prediction Y') and the number of 'Rows' removed.
+    """
+    # Step 1: One code per distinct ID across both DataFrames, missing IDs included as they match each other
+    codes, uniques = pd.factorize(pd.concat([dataframe1['id'], dataframe2['id']], ignore_index=True),
+                                  use_na_sentinel=False)
+    codes_1, codes_2 = codes[:len(dataframe1)], codes[len(dataframe1):]
+
+    # Step 2: Keep the rows whose ID code the other DataFrame uses
+    present_1 = np.bincount(codes_1, minlength=len(uniques)) > 0
+    present_2 = np.bincount(codes_2, minlength=len(uniques)) > 0
+    keep_1 = present_2[codes_1]
+    keep_2 = present_1[codes_2]
+
+    # Step 3: Count the dropped rows of every dropped ID, in the order the IDs first appear
+    report = []
+    for name, dataframe, side_codes, keep in [('Prediction X', dataframe1, codes_1, keep_1),
+                                              ('Prediction Y', dataframe2, codes_2, keep_2)]:
+        dropped = np.flatnonzero(~keep)
+        dropped_codes, first, rows = np.unique(side_codes[dropped], return_index=True, return_counts=True)
+        order = np.argsort(first, kind='stable')
+        ids = dataframe['id'].to_numpy()[dropped[first[order]]]
+        report.append(pd.DataFrame({'id': ids, 'Dropped From': name, 'Rows': rows[order]}))
+    report = pd.concat(report, ignore_index=True)
+
+    if report.empty:
+        return dataframe1, dataframe2, report
+
+    return dataframe1[keep_1], dataframe2[keep_2], report
+
+
 def validate_ids(dataframe1, dataframe2):
-    # to test both ways to ensure that there are no ids unique to one specific df, all to check that all ids match
-    if not dataframe1['id'].isin(dataframe2['id']).all() or not dataframe2['id'].isin(dataframe1['id']).all():
-        # Stores the unique ids
-        unique_ids_df1 = dataframe1[~dataframe1['id'].isin(dataframe2['id'])]
-        unique_ids_df2 = dataframe2[~dataframe2['id'].isin(dataframe1['id'])]
-
-        # Drop the unique IDs from each dataframe
-        dataframe1 = dataframe1[~dataframe1['id'].isin(unique_ids_df1['id'])]
-        dataframe2 = dataframe2[~dataframe2['id'].isin(unique_ids_df2['id'])]
-
-        count_unique = len(unique_ids_df1) + len(unique_ids_df2)
-        print(f"{count_unique} unique IDs were found in the files, these have been removed.")
+    """
+    Drops the rows whose ID is missing from the other DataFrame, see reconcile_ids for the report of what was
+    dropped. The number of dropped rows is logged.
+    """
+    dataframe1, dataframe2, report = reconcile_ids(dataframe1, dataframe2)
+
+    if not report.empty:
+        logger.info(f"{report['Rows'].sum()} rows of {len(report)} IDs missing from the other file were removed")
 
     return dataframe1, dataframe2
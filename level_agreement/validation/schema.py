@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+from level_agreement.monitoring.stages import instrumented
+
+# One label of a prediction list, optionally quoted. Spaces around a label are part of its text unless they are
+# outside the quotes, so there is one way to match every label and malformed strings fail in linear time
+LABEL_FORMAT = r"(?:\s*')?[^,'\[\]]+(?:'\s*)?"
+
+# A prediction list string such as "['a', 'b']", with or without the brackets and outer quotes
+PREDICTION_FORMAT = rf"\[?(?:{LABEL_FORMAT}(?:,{LABEL_FORMAT})*)?\]?"
+
+# Columns of the error report returned by FileSchema.validate
+REPORT_COLUMNS = ["row", "column", "error"]
+
+
+class FileSchema:
+    """
+    Checks an uploaded DataFrame for missing columns, emptiness, empty cells and malformed predictions.
+
+    Every check is one vectorized pass over a column, and all problems are collected into one report instead of
+    raising on the first one.
+
+    Args:
+        columns (list): Columns every file must contain.
+        prediction_column (str): The column holding the prediction list strings.
+    """
+
+    def __init__(self, columns=("id", "comment", "prediction"), prediction_column="prediction"):
+        self.columns = list(columns)
+        self.prediction_column = prediction_column
+
+    @instrumented("FileSchema.validate")
+    def validate(self, dataframe):
+        """
+        Returns every problem found in a DataFrame.
+
+        Args:
+            dataframe (pd.DataFrame): DataFrame to check.
+
+        Returns:
+            pd.DataFrame: One row per problem, with the 0-based 'row' position (missing for problems with the
+            whole file), the 'column' and the 'error'. Empty when the DataFrame is valid.
+        """
+        problems = []
+
+        # Step 1: Problems with the whole file
+        missing_columns = [column for column in self.columns if column not in dataframe.columns]
+        for column in missing_columns:
+            problems.append(pd.DataFrame({"row": [pd.NA], "column": [column],
+                                          "error": [f"File is missing the {column} column"]}))
+        if dataframe.empty:
+            problems.append(pd.DataFrame({"row": [pd.NA], "column": [pd.NA], "error": ["DataFrame is empty"]}))
+
+        # Step 2: Empty cells and malformed predictions, one pass per column
+        for column in self.columns:
+            if column in missing_columns:
+                continue
+            values = dataframe[column]
+            empty = values.isna().to_numpy()
+            problems.append(self._problems(empty, column, "Empty cell"))
+
+            if column == self.prediction_column:
+                # Predictions repeat a lot, so every distinct string is matched once
+                codes, strings = pd.factorize(values)
+                valid = pd.Series(strings, dtype=str).str.fullmatch(PREDICTION_FORMAT).to_numpy(dtype=bool)
+                malformed = ~empty & ~np.append(valid, True)[codes]
+                problems.append(self._problems(malformed, column, "Malformed prediction"))
+
+        report = pd.concat(problems, ignore_index=True) if problems else pd.DataFrame(columns=REPORT_COLUMNS)
+        report = report.astype({"row": "Int64"})
+        return report.sort_values("row", kind="stable", na_position="first", ignore_index=True)
+
+    @staticmethod
+    def _problems(rows, column, error):
+        """
+        Builds report rows for a boolean mask or an array of row positions.
+        """
+        rows = np.flatnonzero(rows) if rows.dtype == bool else rows
+        return pd.DataFrame({"row": rows, "column": column, "error": error})
+
+    def check(self, dataframe):
+        """
+        Validates a DataFrame, raising on problems that stop the comparison and filling empty cells.
+
+        Only the columns that contain empty cells are filled, with "[]" as validate_empty_rows does. Malformed
+        predictions are only reported.
+
+        Args:
+            dataframe (pd.DataFrame): DataFrame to check.
+
+        Returns:
+            tuple: (dataframe, report) with the report returned by validate.
+        """
+        report = self.validate(dataframe)
+
+        # Missing columns and empty files raise the same errors as the individual validators
+        fatal = report[report["row"].isna()]
+        if not fatal.empty:
+            error = fatal["error"].iloc[0]
+            raise AssertionError(error) if error == "DataFrame is empty" else ValueError(error)
+
+        for column in report.loc[report["error"] == "Empty cell", "column"].unique():
+            dataframe[column] = dataframe[column].fillna("[]")
+
+        return dataframe, report
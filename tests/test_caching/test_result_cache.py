@@ -0,0 +1,125 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from level_agreement.caching.result_cache import ResultCache, result_key, file_digest
+from level_agreement.merging.merging_df import compare_prediction_columns
+from level_agreement.output.comparison_index import ComparisonIndex
+from level_agreement.upload.file_upload import load_file
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [('./latest_human.csv', './latest_model.csv')])
+def test_result_key_follows_content(file_path_1, file_path_2):
+    """
+    This test function checks the key depends on the file contents and their order, not on how they are passed
+    """
+    with open(file_path_1, 'rb') as file_1, open(file_path_2, 'rb') as file_2:
+        content_1, content_2 = file_1.read(), file_2.read()
+
+    assert file_digest(file_path_1) == file_digest(content_1) == file_digest(io.BytesIO(content_1))
+    assert result_key(file_path_1, file_path_2) == result_key(io.BytesIO(content_1), content_2)
+    assert result_key(file_path_1, file_path_2) != result_key(file_path_2, file_path_1)
+    assert result_key(file_path_1, file_path_2) != result_key(content_1 + b'\n', content_2)
+    assert result_key(file_path_1, file_path_2) != result_key(file_path_1, file_path_2, options={'workers': 2})
+
+
+def test_result_key_follows_version(monkeypatch):
+    """
+    This test function checks results of an older version of the tool are not reused
+    """
+    key = result_key(b'id,comment,prediction\n')
+    monkeypatch.setattr('level_agreement.caching.result_cache.__version__', '0.0.0')
+    assert result_key(b'id,comment,prediction\n') != key
+
+
+@pytest.mark.parametrize('directory', [False, True])
+def test_result_cache_evicts_least_recently_used(directory, tmp_path):
+    """
+    This test function checks the least recently used entries are evicted once the budget is exceeded
+    """
+    value = {'frame': pd.DataFrame({'prediction': ['a'] * 1000}), 'bytes': b'x' * 50000}
+    cache = ResultCache(max_mb=0.12, directory=str(tmp_path) if directory else None)
+
+    cache.put('first', value)
+    cache.put('second', value)
+    assert cache.get('first') is not None
+    cache.put('third', value)
+
+    assert cache.get('second') is None
+    pd.testing.assert_frame_equal(cache.get('first')['frame'], value['frame'])
+    assert cache.get('third')['bytes'] == value['bytes']
+    assert cache.size <= cache.max_bytes
+
+
+def test_result_cache_keeps_oversized_newest_entry():
+    cache = ResultCache(max_mb=0.01)
+    cache.put('small', b'x')
+    cache.put('large', b'x' * 100000)
+
+    assert cache.get('small') is None
+    assert cache.get('large') == b'x' * 100000
+
+
+def test_result_cache_shared_on_disk(tmp_path):
+    """
+    This test function checks entries on disk are found by another cache using the same directory
+    """
+    writer = ResultCache(directory=str(tmp_path))
+    reader = ResultCache(directory=str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return pd.DataFrame({'id': [1, 2]})
+
+    first = writer.get_or_compute('key', compute)
+    second = reader.get_or_compute('key', compute)
+
+    pd.testing.assert_frame_equal(first, second)
+    assert len(calls) == 1
+    assert ResultCache(directory=str(tmp_path)).size == reader.size > 0
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [('./latest_human.csv', './latest_model.csv')])
+def test_result_cache_counts_comparison_index(file_path_1, file_path_2):
+    """
+    This test function checks the arrays of a cached ComparisonIndex count towards the budget
+    """
+    compared = compare_prediction_columns(load_file(file_path_1), load_file(file_path_2))
+    index = ComparisonIndex(compared)
+    cache = ResultCache()
+
+    cache.put('index', {'index': index})
+
+    assert cache.size == index.nbytes
+    assert index.nbytes >= index._label_rows.nbytes + index._comments.memory_usage(deep=True)
+
+
+def test_result_cache_concurrent_puts(tmp_path):
+    """
+    This test function checks sessions storing the same key at once on disk all succeed and leave one entry
+    """
+    cache = ResultCache(directory=str(tmp_path))
+    value = {'frame': pd.DataFrame({'prediction': ['a'] * 20000}), 'bytes': b'x' * 200000}
+
+    with ThreadPoolExecutor(max_workers=8) as threads:
+        list(threads.map(lambda _: cache.put('key', value), range(32)))
+
+    pd.testing.assert_frame_equal(cache.get('key')['frame'], value['frame'])
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['key.pkl']
+
+
+def test_result_cache_corrupt_entry_is_a_miss(tmp_path):
+    """
+    This test function checks a truncated entry on disk is removed and treated as a miss
+    """
+    cache = ResultCache(directory=str(tmp_path))
+    cache.put('key', {'bytes': b'x' * 1000})
+    content = (tmp_path / 'key.pkl').read_bytes()
+    (tmp_path / 'key.pkl').write_bytes(content[:len(content) // 2])
+
+    assert cache.get('key') is None
+    assert not (tmp_path / 'key.pkl').exists()
+    assert cache.size == 0
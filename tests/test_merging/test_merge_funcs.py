@@ -1,6 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 import pytest
-from level_agreement.merging.merging_df import merge_df, compare_prediction_columns, determine_change
+from level_agreement.merging.merging_df import merge_df, compare_prediction_columns, determine_change, \
+    get_label_differences
+from level_agreement.merging.label_engine import compare_label_sets
+from level_agreement.merging.chunked_merge import chunked_compare
+from level_agreement.merging.comment_fingerprint import add_comment_fingerprint
+from level_agreement.merging.parallel_compare import parallel_compare
+from level_agreement.merging.incremental_compare import incremental_compare, ComparisonSnapshot
+from level_agreement.merging.merging_df import join_predictions, compare_merged_predictions
+from level_agreement.output.metrics_accumulator import MetricsAccumulator
+from level_agreement.merging.label_bitsets import encode_label_bitsets, decode_label_bitsets, added_labels, \
+    removed_labels, changed_labels, popcount
+from level_agreement.merging.multi_annotator import join_annotators
 from level_agreement.upload.file_upload import load_file
 
 
@@ -215,3 +229,302 @@ def test_determine_change_sentiment(file_path_1, expected_result):
     # Call the determine_change function with the extracted data
     result = determine_change(differences, prediction_x, prediction_y)
     assert result == expected_result
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv'),
+    ('./human_predictions_latest.csv', './model_prediction_testing.csv'),
+])
+def test_compare_label_sets_matches_row_functions(file_path_1, file_path_2):
+    """
+    This test function checks that the batch comparison gives the same values as the row-wise functions
+    """
+    df1 = load_file(file_path_1)
+    df2 = load_file(file_path_2)
+    merged_df = merge_df(df1, df2)
+
+    comparison = compare_label_sets(merged_df['prediction_x'], merged_df['prediction_y'])
+
+    for row, result in zip(merged_df.itertuples(), comparison.itertuples()):
+        differences = row.prediction_x != row.prediction_y
+        label_differences = get_label_differences(row.prediction_x, row.prediction_y) if differences else "'NaN'"
+
+        assert result.differences == differences
+        assert result.type == determine_change(differences, row.prediction_x, row.prediction_y)
+        # Labels are listed in order of appearance, where the row-wise function lists them in set order
+        assert sorted(result.prediction_differences.split(', ')) == sorted(label_differences.split(', '))
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_label_bitsets_match_label_sets(file_path_1, file_path_2):
+    """
+    This test function checks that bitmask set operations agree with Python set operations
+    """
+    merged_df = merge_df(load_file(file_path_1), load_file(file_path_2))
+
+    vocabulary, (bitsets_x, bitsets_y) = encode_label_bitsets(merged_df['prediction_x'], merged_df['prediction_y'])
+    added = decode_label_bitsets(added_labels(bitsets_x, bitsets_y), vocabulary)
+    removed = decode_label_bitsets(removed_labels(bitsets_x, bitsets_y), vocabulary)
+    changed = popcount(changed_labels(bitsets_x, bitsets_y))
+
+    for row, row_added, row_removed, row_changed in zip(merged_df.itertuples(), added, removed, changed):
+        labels_x = set(label.strip() for label in row.prediction_x.split(','))
+        labels_y = set(label.strip() for label in row.prediction_y.split(','))
+
+        assert set(row_added) == labels_y - labels_x
+        assert set(row_removed) == labels_x - labels_y
+        assert row_changed == len(labels_x ^ labels_y)
+
+
+def test_label_bitsets_multi_word():
+    """
+    This test function checks that vocabularies larger than 64 labels spill into extra words
+    """
+    prediction_x = pd.Series([", ".join(f"label.{index}" for index in range(100)), "label.1"])
+    prediction_y = pd.Series(["label.99", "label.1, label.70"])
+
+    vocabulary, (bitsets_x, bitsets_y) = encode_label_bitsets(prediction_x, prediction_y)
+
+    assert bitsets_x.shape == (2, 2)
+    assert list(popcount(bitsets_x)) == [100, 1]
+    assert decode_label_bitsets(added_labels(bitsets_x, bitsets_y), vocabulary) == [[], ["label.70"]]
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_chunked_compare_matches_in_memory(file_path_1, file_path_2, tmp_path):
+    """
+    This test function checks that the partitioned, on-disk comparison gives the same rows as the in-memory one
+    """
+    output_path = tmp_path / 'prediction_differences.csv'
+
+    # A tiny budget forces the inputs to be split over many partitions and chunks
+    summary = chunked_compare(file_path_1, file_path_2, output_path, memory_limit_mb=0.05, chunk_rows=25)
+
+    expected = compare_prediction_columns(load_file(file_path_1), load_file(file_path_2))
+    result = pd.read_csv(output_path, keep_default_na=False)
+
+    assert summary['Partitions'] > 1
+    assert summary['Total Rows'] == len(expected)
+    assert summary['Total Differences'] == expected['differences'].sum()
+
+    columns = ['id', 'differences', 'prediction_differences', 'type']
+    pd.testing.assert_frame_equal(
+        result[columns].sort_values('id').reset_index(drop=True),
+        expected[columns].sort_values('id').reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_chunked_compare_mixed_ids(file_path_1, file_path_2, tmp_path):
+    """
+    This test function checks chunks of numeric, text and missing ids land in the same partitions of both files
+    """
+    paths = []
+    for number, file_path in enumerate([file_path_1, file_path_2]):
+        df = load_file(file_path)
+        ids = df['id'].astype(str).where(df.index < len(df) // 2, 'A' + df['id'].astype(str))
+        df['id'] = ids.mask(df.index % 40 == 39)
+        # Only predictions of one file are blanked, so every row of a chunk can be missing its prediction
+        if number == 1:
+            df.loc[:24, 'prediction'] = None
+        paths.append(tmp_path / f'mixed_{number}.csv')
+        df.to_csv(paths[-1], index=False)
+
+    output_path = tmp_path / 'prediction_differences.csv'
+    summary = chunked_compare(paths[0], paths[1], output_path, memory_limit_mb=0.05, chunk_rows=25)
+
+    df1, df2 = [pd.read_csv(path, dtype=str) for path in paths]
+    expected = compare_merged_predictions(join_predictions(df1, df2))
+    result = pd.read_csv(output_path, dtype=str, keep_default_na=False)
+
+    assert summary['Partitions'] > 1
+    assert summary['Total Rows'] == len(expected)
+    assert summary['Total Differences'] == expected['differences'].sum()
+    assert sorted(result['id']) == sorted(expected['id'].fillna(''))
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2, bits', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv', 64),
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv', 128),
+])
+def test_merge_on_comment_fingerprint(file_path_1, file_path_2, bits):
+    """
+    This test function checks that joining on comment fingerprints gives the same frame as joining on the text
+    """
+    df1 = load_file(file_path_1)
+    df2 = load_file(file_path_2)
+
+    expected = merge_df(df1, df2)
+    result = merge_df(df1, df2, comment_fingerprint=bits)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_merge_on_comment_fingerprint_collisions(monkeypatch):
+    """
+    This test function checks that comments sharing a fingerprint are not joined together
+    """
+    df1 = pd.DataFrame({'id': [1, 1], 'comment': ['first', 'second'], 'prediction': ['a', 'b']})
+    df2 = pd.DataFrame({'id': [1, 1], 'comment': ['second', 'first'], 'prediction': ['c', 'd']})
+
+    # Give every comment the same fingerprint
+    monkeypatch.setattr(pd.util, 'hash_array', lambda values, **kwargs: np.zeros(len(values), dtype='uint64'))
+    result = merge_df(df1, df2, comment_fingerprint=64)
+
+    assert list(result['comment']) == ['first', 'second']
+    assert list(result['prediction_y']) == ['d', 'c']
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_merge_on_precomputed_comment_fingerprint(file_path_1, file_path_2):
+    """
+    This test function checks that fingerprints added at load time are reused and dropped from the merge
+    """
+    df1 = load_file(file_path_1)
+    df2 = load_file(file_path_2)
+    expected = merge_df(df1, df2)
+
+    result = merge_df(add_comment_fingerprint(df1, 128), add_comment_fingerprint(df2, 128), comment_fingerprint=128)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2, workers', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv', 1),
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv', 3),
+])
+def test_parallel_compare_matches_serial(file_path_1, file_path_2, workers):
+    """
+    This test function checks that the sharded comparison reduces to the same frame and metrics as the serial path
+    """
+    df1 = load_file(file_path_1)
+    df2 = load_file(file_path_2)
+    expected = compare_prediction_columns(df1, df2)
+    expected_metrics = MetricsAccumulator().update(expected).metrics()
+
+    merged_file, metrics_df = parallel_compare(df1, df2, workers=workers)
+
+    pd.testing.assert_frame_equal(merged_file, expected)
+    pd.testing.assert_frame_equal(metrics_df, expected_metrics)
+
+
+def test_parallel_compare_concurrent_callers():
+    """
+    This test function checks that concurrent sharded comparisons each compare their own inputs
+    """
+    df1 = load_file('./human_predictions_latest.csv')
+    df2 = load_file('./model_predictions_latest.csv')
+    pairs = [(df1, df2), (df2, df1)]
+    expected = [compare_prediction_columns(*pair) for pair in pairs]
+
+    with ThreadPoolExecutor(max_workers=2) as threads:
+        results = list(threads.map(lambda pair: parallel_compare(*pair, workers=2)[0], pairs * 3))
+
+    for number, merged_file in enumerate(results):
+        pd.testing.assert_frame_equal(merged_file, expected[number % 2])
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2, revised_rows', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv', 3),
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv', 40),
+])
+def test_incremental_compare_matches_full(file_path_1, file_path_2, revised_rows, tmp_path):
+    """
+    This test function checks that an incremental re-comparison after revising, dropping and duplicating rows
+    gives the same rows and metrics as comparing everything again
+    """
+    df1 = load_file(file_path_1)
+    df2 = load_file(file_path_2)
+    snapshot = incremental_compare(df1, df2)
+    snapshot.save(tmp_path / "snapshot.pkl")
+
+    # Revise some predictions, drop a row and duplicate another
+    revised = df2.copy()
+    rows = np.random.default_rng(0).choice(len(revised), revised_rows, replace=False)
+    revised.loc[rows, 'prediction'] = revised.loc[rows[::-1], 'prediction'].to_numpy()
+    revised = pd.concat([revised.drop(index=revised.index[-1]), revised.iloc[[0]]], ignore_index=True)
+
+    result = incremental_compare(df1, revised, ComparisonSnapshot.load(tmp_path / "snapshot.pkl"))
+    expected = compare_merged_predictions(join_predictions(df1, revised))
+
+    columns = ['id', 'comment', 'prediction_x', 'prediction_y']
+    pd.testing.assert_frame_equal(result.compared.sort_values(columns).reset_index(drop=True),
+                                  expected.sort_values(columns).reset_index(drop=True))
+    pd.testing.assert_frame_equal(result.metrics.metrics(), MetricsAccumulator().update(expected).metrics())
+    assert result.recomputed_rows < len(df1) + len(revised)
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv'),
+])
+def test_incremental_compare_unchanged(file_path_1, file_path_2):
+    """
+    This test function checks that nothing is recomputed when neither file changed
+    """
+    df1 = load_file(file_path_1)
+    df2 = load_file(file_path_2)
+    snapshot = incremental_compare(df1, df2)
+
+    result = incremental_compare(df1, df2, snapshot)
+
+    assert result.recomputed_rows == 0
+    pd.testing.assert_frame_equal(result.compared, snapshot.compared)
+    pd.testing.assert_frame_equal(result.metrics.metrics(), snapshot.metrics.metrics())
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_join_annotators(file_path_1, file_path_2):
+    """
+    This test function checks N files are joined on id and comment, comparing whole predictions like the two-file
+    metrics
+    """
+    df1 = load_file(file_path_1)
+    df2 = load_file(file_path_2)
+    # A third annotator agreeing with the first in another row order, and a fourth listing its labels reversed
+    df3 = df1.iloc[::-1].copy()
+    df4 = df1.copy()
+    df4['prediction'] = df4['prediction'].str.strip('[]').str.split(', ').map(lambda labels: ', '.join(labels[::-1]))
+
+    annotations = join_annotators([df1, df2, df3, df4], ['human', 'model', 'copy', 'reversed'])
+    merged = join_predictions(df1, df2)
+    reversed_merged = join_predictions(df1, df4)
+
+    assert len(annotations) == len(merged)
+    assert (annotations.codes >= 0).all()
+    assert (annotations.codes[:, 0] == annotations.codes[:, 2]).all()
+    assert (annotations.codes[:, 0] != annotations.codes[:, 3]).any()
+    assert ((annotations.codes[:, 0] == annotations.codes[:, 3]) ==
+            (reversed_merged['prediction_x'] == reversed_merged['prediction_y'])).all()
+    assert annotations.frame().columns.tolist() == ['id', 'comment', 'human', 'model', 'copy', 'reversed']
+
+
+def test_join_annotators_outer_and_duplicates():
+    """
+    This test function checks an outer join keeps missing predictions as -1 and repeated keys raise
+    """
+    df1 = pd.DataFrame({'id': [1, 2], 'comment': ['a', 'b'], 'prediction': ["['x.1']", "['y.1']"]})
+    df2 = pd.DataFrame({'id': [2, 3], 'comment': ['b', 'c'], 'prediction': ["['y.1']", "['x.1']"]})
+
+    inner = join_annotators([df1, df2])
+    outer = join_annotators([df1, df2], how='outer')
+
+    assert inner.keys['id'].tolist() == [2]
+    assert outer.keys['id'].tolist() == [1, 2, 3]
+    assert (outer.codes == -1).sum() == 2
+    assert outer.frame()['Annotator 2'].isna().tolist() == [True, False, False]
+
+    with pytest.raises(ValueError):
+        join_annotators([df1, pd.concat([df2, df2])])
+    with pytest.raises(ValueError):
+        join_annotators([df1])
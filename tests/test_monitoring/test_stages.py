@@ -0,0 +1,93 @@
+import logging
+import threading
+
+import pytest
+
+from level_agreement.monitoring.stages import recording, stage, add_sink, remove_sink, RECORD_COLUMNS
+from level_agreement.pipeline.comparison import Comparison
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_recording_pipeline_stages(file_path_1, file_path_2):
+    """
+    This test function checks every instrumented stage of a comparison is recorded with its rows
+    """
+    with recording() as recorder:
+        comparison = Comparison(file_path_1, file_path_2)
+        comparison.metrics
+
+    records = recorder.frame()
+    assert list(records.columns) == RECORD_COLUMNS
+    assert records['stage'].tolist() == ['load_file', 'load_file', 'FileSchema.validate', 'FileSchema.validate',
+                                         'resolve_duplicate_keys', 'resolve_duplicate_keys', 'reconcile_ids',
+                                         'join_predictions', 'compare_merged_predictions', 'predictions_metrics']
+    assert records.loc[records['stage'] == 'load_file', 'rows'].tolist() == [164, 164]
+    assert records.loc[records['stage'] == 'compare_merged_predictions', 'rows'].item() == len(comparison.compared)
+    assert (records['wall_seconds'] >= 0).all() and (records['cpu_seconds'] >= 0).all()
+    assert (records['process_peak_rss_mb'] > 0).all()
+
+
+def test_stage_sinks_and_logs(caplog):
+    """
+    This test function checks sinks get every record, a failing sink is ignored and the record is logged
+    """
+    received = []
+
+    def failing_sink(record):
+        raise RuntimeError("sink down")
+
+    add_sink(received.append)
+    add_sink(failing_sink)
+    try:
+        with caplog.at_level(logging.DEBUG, logger='level_agreement.monitoring.stages'):
+            with recording():
+                with stage('custom') as record:
+                    record['rows'] = 10
+    finally:
+        remove_sink(received.append)
+        remove_sink(failing_sink)
+
+    assert [record['stage'] for record in received] == ['custom']
+    assert received[0]['rows'] == 10
+    assert any(getattr(log, 'stage_record', None) is received[0] for log in caplog.records)
+    assert any('sink down' in log.getMessage() for log in caplog.records)
+    assert [log.levelno for log in caplog.records if hasattr(log, 'stage_record')] == [logging.DEBUG]
+    assert [log.levelno for log in caplog.records if hasattr(log, 'stage_records')] == [logging.INFO]
+
+
+def test_recording_is_per_thread():
+    with recording() as recorder:
+        with stage('this thread'):
+            pass
+
+        def other_thread():
+            with stage('other thread'):
+                pass
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+
+    assert recorder.frame()['stage'].tolist() == ['this thread']
+
+
+def test_summary_counts_nested_stages_once(caplog, monkeypatch):
+    """
+    This test function checks the time of a stage run inside another one is not added to the total twice
+    """
+    times = iter([0.0, 1.0, 3.0, 4.0])
+    monkeypatch.setattr('level_agreement.monitoring.stages.time.perf_counter', lambda: next(times))
+
+    with caplog.at_level(logging.INFO, logger='level_agreement.monitoring.stages'):
+        with recording() as recorder:
+            with stage('outer'):
+                with stage('inner'):
+                    pass
+
+    records = recorder.frame()
+    assert records['stage'].tolist() == ['inner', 'outer']
+    assert records['depth'].tolist() == [1, 0]
+    assert records['wall_seconds'].tolist() == [2.0, 4.0]
+    summary = [log.getMessage() for log in caplog.records if hasattr(log, 'stage_records')]
+    assert summary[0].startswith('Recorded 2 stages taking 4.000s')
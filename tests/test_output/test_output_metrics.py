@@ -0,0 +1,430 @@
+import io
+import pickle
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics import cohen_kappa_score, f1_score, precision_score, recall_score
+from level_agreement.upload.file_upload import load_file
+from level_agreement.output.output_file import predictions_metrics
+from level_agreement.output.metrics_accumulator import MetricsAccumulator
+from level_agreement.output.label_metrics import label_metrics, label_transitions, label_transition_table
+from level_agreement.output.columnar_file import save_comparison, load_comparison, LABEL_COLUMNS
+from level_agreement.output.excel_export import write_excel, excel_bytes, sheet_names
+from level_agreement.output.comparison_index import ComparisonIndex
+from level_agreement.output.grouped_metrics import grouped_metrics, METRIC_COLUMNS
+from level_agreement.output.multi_rater_metrics import fleiss_kappa, krippendorff_alpha, pairwise_kappa
+import level_agreement.output.confidence_intervals as confidence_intervals_module
+from level_agreement.output.confidence_intervals import bootstrap_intervals, jackknife_intervals, confidence_intervals
+from level_agreement.merging.merging_df import compare_prediction_columns
+
+
+@pytest.mark.parametrize('file_path_1, chunk_size', [
+    ('./prediction_differences (1).csv', 25),
+    ('./prediction_differences (1).csv', 1000),
+])
+def test_metrics_accumulator_matches_predictions_metrics(file_path_1, chunk_size):
+    """
+    Test function to validate that metrics accumulated chunk by chunk match predictions_metrics
+    """
+    df = load_file(file_path_1)
+    expected = predictions_metrics(df)
+
+    # Fill one accumulator per chunk, send each through pickle as a worker process would, then merge them
+    accumulator = MetricsAccumulator()
+    for start in range(0, len(df), chunk_size):
+        chunk_accumulator = MetricsAccumulator().update(df.iloc[start:start + chunk_size])
+        accumulator.merge(pickle.loads(pickle.dumps(chunk_accumulator)))
+
+    result = accumulator.metrics()
+
+    for column in ["Total Predictions", "Total Correct Predictions", "Total Prediction Differences"]:
+        assert result[column].iloc[0] == expected[column].iloc[0]
+    assert result['Overall Accuracy'].iloc[0] == pytest.approx(expected['Overall Accuracy'].iloc[0])
+    assert result['Kappas Score'].iloc[0] == pytest.approx(expected['Kappas Score'].iloc[0])
+
+
+@pytest.mark.parametrize('file_path_1', ['./prediction_differences (1).csv'])
+def test_metrics_accumulator_remove(file_path_1):
+    """
+    Test function to validate that removing rows gives the metrics of the remaining rows
+    """
+    df = load_file(file_path_1)
+    expected = MetricsAccumulator().update(df.iloc[100:]).metrics()
+
+    result = MetricsAccumulator().update(df).remove(df.iloc[:100]).metrics()
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize('file_path_1', ['./prediction_differences (1).csv'])
+def test_predictions_metrics_kappa_matches_sklearn(file_path_1):
+    """
+    Test function to validate the built-in kappa against scikit-learn's
+    """
+    df = load_file(file_path_1)
+
+    result = predictions_metrics(df)
+
+    assert result['Kappas Score'].iloc[0] == pytest.approx(cohen_kappa_score(df['prediction_y'], df['prediction_x']))
+
+
+def test_metrics_accumulator_perfect_expected_agreement():
+    """
+    Test function to validate that kappa is undefined when both sides only ever use the same label
+    """
+    df = pd.DataFrame({'comment': ['a', 'b'], 'prediction_x': ['label.1', 'label.1'],
+                       'prediction_y': ['label.1', 'label.1']})
+
+    metrics = MetricsAccumulator().update(df).metrics()
+
+    assert metrics['Overall Accuracy'].iloc[0] == 1
+    assert pd.isna(metrics['Kappas Score'].iloc[0])
+
+
+@pytest.mark.parametrize('file_path_1', ['./prediction_differences (1).csv'])
+def test_label_metrics_match_sklearn(file_path_1):
+    """
+    Test function to validate per-label precision, recall, F1 and kappa against scikit-learn
+    """
+    df = load_file(file_path_1)
+    label_metrics_df = label_metrics(df)
+    per_label = label_metrics_df.iloc[:-2]
+
+    # Build dense indicator columns the slow way for scikit-learn
+    labels_x = [set(label.strip() for label in labels.split(',')) - {''} for labels in df['prediction_x']]
+    labels_y = [set(label.strip() for label in labels.split(',')) - {''} for labels in df['prediction_y']]
+
+    assert list(per_label['Label']) == sorted(set().union(*labels_x, *labels_y))
+    for row in per_label.to_dict('records'):
+        indicator_x = [row['Label'] in labels for labels in labels_x]
+        indicator_y = [row['Label'] in labels for labels in labels_y]
+
+        assert row['Precision'] == pytest.approx(precision_score(indicator_x, indicator_y, zero_division=0))
+        assert row['Recall'] == pytest.approx(recall_score(indicator_x, indicator_y, zero_division=0))
+        assert row['F1 Score'] == pytest.approx(f1_score(indicator_x, indicator_y, zero_division=0))
+        if indicator_x != indicator_y or len(set(indicator_x)) > 1:
+            assert row['Kappas Score'] == pytest.approx(cohen_kappa_score(indicator_x, indicator_y))
+
+    assert list(label_metrics_df['Label'].iloc[-2:]) == ['Micro Average', 'Macro Average']
+    assert label_metrics_df['Precision'].iloc[-1] == pytest.approx(per_label['Precision'].mean())
+
+
+@pytest.mark.parametrize('file_path_1', ['./prediction_differences (1).csv'])
+def test_label_transitions_match_counting(file_path_1):
+    """
+    Test function to validate the label transition counts against counting every pair of every row
+    """
+    df = load_file(file_path_1)
+    labels_x = [set(label.strip() for label in labels.split(',')) - {''} for labels in df['prediction_x']]
+    labels_y = [set(label.strip() for label in labels.split(',')) - {''} for labels in df['prediction_y']]
+
+    for substitutions in [False, True]:
+        expected = Counter()
+        for row_x, row_y in zip(labels_x, labels_y):
+            if substitutions:
+                row_x, row_y = row_x - row_y, row_y - row_x
+            expected.update((label_x, label_y) for label_x in row_x for label_y in row_y)
+
+        vocabulary, transitions = label_transitions(df, substitutions=substitutions)
+        transitions = transitions.tocoo()
+        result = {(vocabulary[i], vocabulary[j]): count
+                  for i, j, count in zip(transitions.row, transitions.col, transitions.data)}
+        assert result == dict(expected)
+
+
+def test_label_transition_table_top():
+    """
+    Test function to validate the most frequent substitutions come first, without the labels a row kept
+    """
+    df = pd.DataFrame({
+        'prediction_x': ['food.fries.1, service.speed.1', 'food.fries.1', 'food.fries.1', 'food.burger.1'],
+        'prediction_y': ['food.fries.-1, service.speed.1', 'food.fries.-1', 'food.fries.0', 'food.burger.1'],
+    })
+
+    table = label_transition_table(df, top=2)
+
+    assert table.to_dict('list') == {'Label X': ['food.fries.1', 'food.fries.1'],
+                                     'Label Y': ['food.fries.-1', 'food.fries.0'], 'Rows': [2, 1]}
+    assert len(label_transition_table(df)) == 2
+    assert label_transition_table(df.iloc[[3]]).empty
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_label_transition_table_top_ties(file_path_1, file_path_2):
+    """
+    Test function to validate pairs tied at the cut-off are kept in label order, as the first rows of the full table
+    """
+    df = compare_prediction_columns(load_file(file_path_1), load_file(file_path_2))
+    table = label_transition_table(df, substitutions=False)
+    tied = np.flatnonzero(np.diff(table['Rows'].to_numpy()) == 0) + 1
+    assert len(tied) > 10
+
+    # Cut inside runs of equal counts, where an arbitrary partition would pick any of the tied pairs
+    for top in [1] + tied[:10].tolist() + [len(table)]:
+        pd.testing.assert_frame_equal(label_transition_table(df, top=top, substitutions=False), table.head(top))
+    assert label_transition_table(df, top=0, substitutions=False).empty
+
+
+@pytest.mark.parametrize('file_path_1, extension', [
+    ('./prediction_differences (1).csv', '.parquet'),
+    ('./prediction_differences (1).csv', '.arrow'),
+])
+def test_save_and_load_comparison(file_path_1, extension, tmp_path):
+    """
+    Test function to validate that a saved comparison re-opens unchanged, with its parsed label columns
+    """
+    df = load_file(file_path_1)
+    file_path = str(tmp_path / f"comparison{extension}")
+
+    save_comparison(df, file_path)
+    loaded_df = load_comparison(file_path)
+
+    assert list(loaded_df.columns) == list(df.columns) + LABEL_COLUMNS
+    assert loaded_df['prediction_x'].tolist() == df['prediction_x'].tolist()
+    for labels, prediction in zip(loaded_df['labels_x'], df['prediction_x']):
+        assert set(labels) == set(label.strip() for label in prediction.split(',')) - {''}
+
+
+@pytest.mark.parametrize('file_path_1, max_rows', [
+    ('./prediction_differences (1).csv', 50),
+    ('./prediction_differences (1).csv', 1000),
+])
+def test_write_excel_splits_sheets(file_path_1, max_rows):
+    """
+    Test function to validate that every row is written once, continuing on new sheets past the row limit
+    """
+    pytest.importorskip('openpyxl')
+    df = pd.read_csv(file_path_1)
+
+    workbook = pd.read_excel(write_excel(df, max_rows=max_rows), sheet_name=None)
+
+    assert list(workbook) == sheet_names(len(df), max_rows=max_rows)
+    assert all(len(sheet) <= max_rows for sheet in workbook.values())
+    pd.testing.assert_frame_equal(pd.concat(workbook.values(), ignore_index=True), df, check_dtype=False)
+
+
+def test_write_excel_keeps_text():
+    """
+    Test function to validate that formulas and links in comments are written as text
+    """
+    pytest.importorskip('openpyxl')
+    df = pd.DataFrame({'id': [1, 2], 'comment': ['=1+1', 'http://example.com'], 'score': [0.5, float('nan')]})
+
+    result = pd.read_excel(io.BytesIO(excel_bytes(df)))
+
+    assert result['comment'].tolist() == ['=1+1', 'http://example.com']
+    assert result['score'].isna().tolist() == [False, True]
+
+
+def test_sheet_names_fit_excel_limit():
+    names = sheet_names(25, 'A Very Long Sheet Name For Differences', max_rows=10)
+
+    assert names == ['A Very Long Sheet Name For Diff', 'A Very Long Sheet Name For Di 2',
+                     'A Very Long Sheet Name For Di 3']
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_comparison_index_filters(file_path_1, file_path_2):
+    """
+    Test function to validate that every filter of the index matches a scan of the frame
+    """
+    df = compare_prediction_columns(load_file(file_path_1), load_file(file_path_2))
+    index = ComparisonIndex(df)
+
+    def has_label(column, label):
+        return df[column].str.split(',').apply(lambda labels: label in [item.strip() for item in labels])
+
+    label = index.labels[0]
+    expected_types = df['type'].isin(['Sentiment Changed', 'Theme(s) Removed'])
+    expected_label = has_label('prediction_x', label) | has_label('prediction_y', label)
+    expected_search = df['comment'].str.lower().str.contains('food', regex=False)
+
+    assert index.filter().tolist() == list(range(len(df)))
+    assert index.filter(types=['Sentiment Changed', 'Theme(s) Removed']).tolist() == \
+        df.index[expected_types].tolist()
+    assert index.filter(labels=[label]).tolist() == df.index[expected_label].tolist()
+    assert index.filter(search='FOOD').tolist() == df.index[expected_search].tolist()
+    assert index.filter(types=['Sentiment Changed', 'Theme(s) Removed'], labels=[label], search='food').tolist() == \
+        df.index[expected_types & expected_label & expected_search].tolist()
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_comparison_index_pages(file_path_1, file_path_2):
+    df = compare_prediction_columns(load_file(file_path_1), load_file(file_path_2))
+    index = ComparisonIndex(df)
+    rows = index.filter(search='a')
+
+    pages = [index.page(rows, page, 20) for page in range(1, index.page_count(rows, 20) + 1)]
+
+    assert all(len(page) <= 20 for page in pages)
+    pd.testing.assert_frame_equal(pd.concat(pages), df.iloc[rows])
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_comparison_index_shared_between_threads(file_path_1, file_path_2):
+    """
+    Test function to validate filters of one index from many threads, evicting kept results as they go
+    """
+    df = compare_prediction_columns(load_file(file_path_1), load_file(file_path_2))
+    index = ComparisonIndex(df)
+    searches = [chr(letter) for letter in range(ord('a'), ord('z') + 1)] * 8
+    expected = {search: ComparisonIndex(df).filter(search=search).tolist() for search in set(searches)}
+
+    with ThreadPoolExecutor(max_workers=8) as threads:
+        results = list(threads.map(lambda search: index.filter(search=search), searches))
+
+    assert [rows.tolist() for rows in results] == [expected[search] for search in searches]
+    assert pickle.loads(pickle.dumps(index)).filter(search='a').tolist() == expected['a']
+
+
+@pytest.mark.parametrize('file_path_1', ['./prediction_differences (1).csv'])
+def test_grouped_metrics_match_predictions_metrics(file_path_1):
+    """
+    Test function to validate every group's metrics against predictions_metrics on the group's rows
+    """
+    df = load_file(file_path_1)
+    df['channel'] = ['app', 'web'] * (len(df) // 2) + ['app'] * (len(df) % 2)
+    df['week'] = [week % 3 for week in range(len(df))]
+    df.loc[df.index[::7], 'channel'] = None
+
+    result = grouped_metrics(df, ['channel', 'week'])
+
+    expected = df.groupby(['channel', 'week'], dropna=False).size()
+    assert len(result) == len(expected)
+    for row in result.to_dict('records'):
+        channel_rows = df['channel'].isna() if pd.isna(row['channel']) else df['channel'] == row['channel']
+        group = predictions_metrics(df[channel_rows & (df['week'] == row['week'])])
+        for column in METRIC_COLUMNS:
+            assert row[column] == pytest.approx(group[column].iloc[0], nan_ok=True)
+
+
+def test_grouped_metrics_missing_column():
+    """
+    Test function to validate grouping by a column the DataFrame does not have raises a ValueError
+    """
+    df = pd.DataFrame({'comment': ['a'], 'prediction_x': ['label.1'], 'prediction_y': ['label.1']})
+
+    with pytest.raises(ValueError):
+        grouped_metrics(df, ['channel'])
+
+
+def test_fleiss_kappa_reference_table():
+    """
+    Test function to validate Fleiss' kappa against the published example of 10 subjects rated by 14 raters
+    """
+    # Raters per category of every subject, expanded to one category code per rater
+    table = [[0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0], [2, 2, 8, 1, 1],
+             [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2], [6, 5, 2, 1, 0], [0, 2, 2, 3, 7]]
+    codes = np.array([np.repeat(np.arange(5), counts) for counts in table])
+
+    assert fleiss_kappa(codes) == pytest.approx(0.210, abs=5e-4)
+
+
+def test_krippendorff_alpha_reference_data():
+    """
+    Test function to validate Krippendorff's alpha against his nominal example with missing values
+    """
+    missing = -1
+    codes = np.array([
+        [0, 0, missing, 0], [1, 1, 2, 1], [2, 2, 2, 2], [2, 2, 2, 2], [1, 1, 1, 1], [0, 1, 2, 3],
+        [3, 3, 3, 3], [0, 0, 1, 0], [1, 1, 1, 1], [missing, 4, 4, 4], [missing, missing, 0, 0],
+        [missing, missing, 2, missing],
+    ])
+
+    assert krippendorff_alpha(codes) == pytest.approx(0.743, abs=5e-4)
+
+
+def test_pairwise_kappa_matches_cohen_kappa():
+    """
+    Test function to validate every pair's kappa against scikit-learn, over the rows both annotators labelled
+    """
+    rng = np.random.default_rng(0)
+    codes = rng.integers(0, 4, size=(300, 3))
+    codes[rng.random(codes.shape) < 0.1] = -1
+
+    result = pairwise_kappa(codes, ['a', 'b', 'c'])
+
+    for a, b in [(0, 1), (0, 2), (1, 2)]:
+        both = (codes[:, a] >= 0) & (codes[:, b] >= 0)
+        assert result.iloc[a, b] == pytest.approx(cohen_kappa_score(codes[both, a], codes[both, b]))
+        assert result.iloc[b, a] == result.iloc[a, b]
+    assert np.diag(result).tolist() == [1, 1, 1]
+
+
+@pytest.mark.parametrize('file_path_1', ['./prediction_differences (1).csv'])
+def test_jackknife_intervals_match_leave_one_out(file_path_1):
+    """
+    Test function to validate the closed-form jackknife against recomputing the metrics without every row
+    """
+    df = load_file(file_path_1)
+    metrics = MetricsAccumulator().update(df)
+
+    result = jackknife_intervals(metrics).set_index('Metric')
+
+    leave_one_out = pd.concat([predictions_metrics(df.drop(index=row)) for row in df.index], ignore_index=True)
+    rows = len(df)
+    for metric in ['Overall Accuracy', 'Kappas Score']:
+        values = leave_one_out[metric]
+        error = np.sqrt((rows - 1) / rows * ((values - values.mean()) ** 2).sum())
+        assert result.loc[metric, 'Standard Error'] == pytest.approx(error)
+        assert result.loc[metric, 'Estimate'] == pytest.approx(predictions_metrics(df)[metric][0])
+        assert result.loc[metric, 'Lower'] < result.loc[metric, 'Estimate'] < result.loc[metric, 'Upper']
+
+
+@pytest.mark.parametrize('file_path_1, cell_share', [
+    ('./prediction_differences (1).csv', 0.25),
+    ('./prediction_differences (1).csv', 0),
+])
+def test_bootstrap_intervals(file_path_1, cell_share, monkeypatch):
+    """
+    Test function to validate bootstrap intervals drawn as cell counts or as rows, with one or more workers
+    """
+    monkeypatch.setattr(confidence_intervals_module, 'MULTINOMIAL_CELL_SHARE', cell_share)
+    df = load_file(file_path_1)
+    # Repeat the rows so there are fewer cells than rows, as in a real comparison
+    metrics = MetricsAccumulator().update(pd.concat([df] * 20, ignore_index=True))
+
+    serial = bootstrap_intervals(metrics, resamples=200, seed=1, workers=1)
+    pooled = bootstrap_intervals(metrics, resamples=200, seed=1, workers=2)
+    jackknife = jackknife_intervals(metrics)
+
+    pd.testing.assert_frame_equal(serial, pooled)
+    assert (serial['Lower'] <= serial['Estimate']).all() and (serial['Estimate'] <= serial['Upper']).all()
+    assert serial['Estimate'].tolist() == pytest.approx(jackknife['Estimate'].tolist())
+    assert serial['Standard Error'].to_numpy() == pytest.approx(jackknife['Standard Error'].to_numpy(), rel=0.25)
+    assert not serial.equals(bootstrap_intervals(metrics, resamples=200, seed=2, workers=1))
+
+
+def test_bootstrap_intervals_concurrent_callers():
+    """
+    Test function to validate concurrent bootstrap pools each resample their own comparison
+    """
+    df = load_file('./prediction_differences (1).csv')
+    agreeing = df.assign(prediction_y=df['prediction_x'])
+    metrics = [MetricsAccumulator().update(pd.concat([frame] * 20, ignore_index=True)) for frame in [df, agreeing]]
+    expected = [bootstrap_intervals(counts, resamples=100, workers=1) for counts in metrics]
+
+    with ThreadPoolExecutor(max_workers=2) as threads:
+        results = list(threads.map(lambda counts: bootstrap_intervals(counts, resamples=100, workers=2), metrics * 3))
+
+    for number, result in enumerate(results):
+        pd.testing.assert_frame_equal(result, expected[number % 2])
+
+
+def test_confidence_intervals_without_predictions():
+    """
+    Test function to validate intervals of empty counts raise a ValueError
+    """
+    with pytest.raises(ValueError):
+        confidence_intervals(MetricsAccumulator())
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from level_agreement.__main__ import main
+from level_agreement.pipeline.batch import read_manifest, run_batch
+from level_agreement.pipeline.comparison import Comparison
+
+
+@pytest.fixture
+def manifest_path(tmp_path):
+    """
+    Manifest in another directory, with absolute file paths
+    """
+    human, model = Path('./human_predictions_latest.csv').resolve(), Path('./model_predictions_latest.csv').resolve()
+    manifest = pd.DataFrame({'x': [human, human, Path('./missing.csv').resolve()], 'y': [model, human, model]})
+    path = tmp_path / 'manifest.csv'
+    manifest.to_csv(path, index=False)
+    return path
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_run_batch(manifest_path, tmp_path, workers):
+    """
+    This test function checks every pair gets a diff file and a metrics row, and failed pairs are reported
+    """
+    metrics, summary = run_batch(read_manifest(manifest_path), str(tmp_path / 'out'), workers=workers)
+
+    expected = Comparison('./human_predictions_latest.csv', './model_predictions_latest.csv')
+    assert metrics['Diff File'][0] == str(tmp_path / 'out' / 'human_predictions_latest_vs_model_predictions_latest.csv')
+    assert len(pd.read_csv(metrics['Diff File'][0])) == len(expected.compared)
+    assert metrics['Total Prediction Differences'][0] == expected.metrics['Total Prediction Differences'][0]
+    assert metrics['Overall Accuracy'][1] == 1
+    assert metrics['Status'].tolist()[:2] == ['OK', 'OK'] and metrics['Status'][2].startswith('Error')
+    assert summary['Pairs'] == 3 and summary['Failed Pairs'] == 1
+    assert summary['Total Rows'] == 2 * len(expected.compared)
+    assert pd.read_csv(tmp_path / 'out' / 'metrics.csv')['Pair'].tolist() == metrics['Pair'].tolist()
+
+
+def test_main_exit_code(manifest_path, tmp_path):
+    assert main([str(manifest_path), '--output', str(tmp_path / 'out'), '--workers', '1', '--format', 'parquet']) == 1
+    assert (tmp_path / 'out' / 'human_predictions_latest_vs_model_predictions_latest.parquet').exists()
+
+
+def test_run_batch_empty_manifest(tmp_path):
+    """
+    This test function checks a manifest without pairs is refused instead of writing an empty metrics table
+    """
+    manifest_path = tmp_path / 'manifest.csv'
+    manifest_path.write_text('x,y\n')
+
+    with pytest.raises(ValueError, match='no pairs'):
+        read_manifest(manifest_path)
+    with pytest.raises(ValueError, match='no pairs'):
+        run_batch(pd.DataFrame(columns=['name', 'x', 'y']), str(tmp_path / 'out'), workers=1)
+    assert main([str(manifest_path), '--output', str(tmp_path / 'out')]) == 2
+    assert not (tmp_path / 'out' / 'metrics.csv').exists()
+
+
+def test_run_batch_incremental(manifest_path, tmp_path):
+    """
+    This test function checks a second incremental run reuses the snapshots and gives the same metrics
+    """
+    manifest = read_manifest(manifest_path)
+    first, _ = run_batch(manifest, str(tmp_path / 'out'), workers=1, incremental=True)
+    second, _ = run_batch(manifest, str(tmp_path / 'out'), workers=1, incremental=True)
+
+    expected = Comparison('./human_predictions_latest.csv', './model_predictions_latest.csv')
+    assert (tmp_path / 'out' / 'human_predictions_latest_vs_model_predictions_latest.snapshot.pkl').exists()
+    assert first['Total Prediction Differences'][0] == expected.metrics['Total Prediction Differences'][0]
+    assert first['Recomputed Rows'][0] > 0 and second['Recomputed Rows'][0] == 0
+    pd.testing.assert_frame_equal(second.drop(columns=['Recomputed Rows', 'Seconds']),
+                                  first.drop(columns=['Recomputed Rows', 'Seconds']))
+
+
+def test_run_batch_bootstrap(manifest_path, tmp_path):
+    """
+    Every successful pair gets bootstrap intervals around its accuracy and kappa
+    """
+    metrics, _ = run_batch(read_manifest(manifest_path), str(tmp_path / 'out'), workers=1, resamples=50)
+
+    succeeded = metrics[metrics['Status'] == 'OK']
+    for metric in ['Overall Accuracy', 'Kappas Score']:
+        assert (succeeded[f'{metric} Lower'] <= succeeded[metric]).all()
+        assert (succeeded[metric] <= succeeded[f'{metric} Upper']).all()
@@ -0,0 +1,153 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+import level_agreement.pipeline.comparison as comparison_module
+from level_agreement.pipeline.comparison import Comparison
+from level_agreement.pipeline.multi_comparison import MultiComparison
+from level_agreement.merging.merging_df import merge_df, compare_prediction_columns
+from level_agreement.output.output_file import predictions_metrics
+from level_agreement.output.label_metrics import label_metrics
+from level_agreement.output.comparison_index import ComparisonIndex
+from level_agreement.monitoring.stages import recording
+from level_agreement.upload.file_upload import load_file
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_comparison_matches_functions(file_path_1, file_path_2):
+    """
+    This test function checks every stage matches the merge, comparison and metrics functions
+    """
+    df1 = load_file(file_path_1)
+    df2 = load_file(file_path_2)
+    expected_merged = merge_df(df1, df2)
+    expected_compared = compare_prediction_columns(df1, df2)
+
+    comparison = Comparison(file_path_1, file_path_2)
+
+    pd.testing.assert_frame_equal(comparison.merged, expected_merged)
+    pd.testing.assert_frame_equal(comparison.differences, expected_compared)
+    pd.testing.assert_frame_equal(comparison.metrics, predictions_metrics(expected_compared))
+    assert 'differences' not in comparison.merged.columns
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_comparison_runs_stages_once(file_path_1, file_path_2, monkeypatch):
+    """
+    This test function checks the IDs are validated and the files joined only once, however many stages are used
+    """
+    calls = {'reconcile_ids': 0, 'join_predictions': 0}
+
+    def counted(name, function):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    for name in calls:
+        monkeypatch.setattr(comparison_module, name, counted(name, getattr(comparison_module, name)))
+
+    comparison = Comparison(load_file(file_path_1), load_file(file_path_2))
+    with recording() as recorder:
+        comparison.differences
+        comparison.metrics
+        comparison.label_metrics
+        comparison.label_substitutions
+        comparison.index
+        comparison.merged
+
+    assert calls == {'reconcile_ids': 1, 'join_predictions': 1}
+    # The predictions are parsed into label indicators once for the label tables and the index
+    assert recorder.frame()['stage'].tolist().count('label_indicator_matrices') == 1
+    pd.testing.assert_frame_equal(comparison.label_metrics, label_metrics(comparison.compared))
+    assert comparison.index.filter(labels=comparison.index.labels[:1]).tolist() == \
+        ComparisonIndex(comparison.compared).filter(labels=comparison.index.labels[:1]).tolist()
+
+
+@pytest.mark.parametrize('file_path_1', ['./human_predictions_latest.csv'])
+def test_comparison_matching_files(file_path_1):
+    comparison = Comparison(file_path_1, file_path_1)
+
+    assert comparison.differences is None
+    assert comparison.metrics["Overall Accuracy"][0] == 1
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_comparison_duplicate_policy(file_path_1, file_path_2):
+    """
+    This test function checks repeated rows are resolved before the join instead of multiplying the merge
+    """
+    df1 = load_file(file_path_1)
+    df2 = load_file(file_path_2)
+    repeated = pd.concat([df2, df2.head(10)], ignore_index=True)
+
+    with pytest.raises(ValueError):
+        Comparison(df1, repeated).merged
+
+    comparison = Comparison(df1, repeated, duplicate_policy='first')
+    assert comparison.duplicate_rows == [0, 20]
+    assert comparison.merge_size == len(comparison.merged) == len(merge_df(df1, df2))
+
+    with pytest.raises(ValueError, match='limit'):
+        Comparison(df1, repeated, duplicate_policy='first', max_merge_rows=comparison.merge_size - 1).merged
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_comparison_group_columns(file_path_1, file_path_2, tmp_path):
+    """
+    This test function checks the group columns are read from the ground-truth file and every group gets metrics
+    """
+    df1 = load_file(file_path_1)
+    df1['channel'] = ['app', 'web'] * (len(df1) // 2) + ['app'] * (len(df1) % 2)
+    df1.to_csv(tmp_path / 'grouped.csv', index=False)
+    df2 = load_file(file_path_2).assign(channel='other')
+    df2.to_csv(tmp_path / 'other.csv', index=False)
+
+    comparison = Comparison(str(tmp_path / 'grouped.csv'), str(tmp_path / 'other.csv'), group_columns=['channel'])
+
+    assert 'channel_x' not in comparison.compared.columns
+    assert comparison.grouped_metrics['channel'].tolist() == ['app', 'web']
+    assert comparison.grouped_metrics['Total Predictions'].sum() == comparison.metrics['Total Predictions'][0]
+
+
+def test_import_skips_optional_dependencies():
+    """
+    This test function checks importing the pipeline leaves scikit-learn and scipy unloaded, for a fast cold start
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(comparison_module.__file__)))
+    script = "import sys, level_agreement.pipeline.batch; print(sorted({'sklearn', 'scipy'} & set(sys.modules)))"
+
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                            env={**os.environ, "PYTHONPATH": os.path.dirname(root)})
+
+    assert result.stdout.strip() == "[]"
+
+
+@pytest.mark.parametrize('file_path_1, file_path_2', [
+    ('./human_predictions_latest.csv', './model_predictions_latest.csv')
+])
+def test_multi_comparison(file_path_1, file_path_2):
+    """
+    This test function checks the agreement of three files, two of them the same, and that names follow the files
+    """
+    comparison = MultiComparison([file_path_1, file_path_2, file_path_1])
+
+    assert comparison.names == ['human_predictions_latest', 'model_predictions_latest',
+                                'human_predictions_latest (2)']
+    metrics = comparison.metrics.iloc[0]
+    assert metrics['Annotators'] == 3
+    assert metrics['Total Comments'] == len(Comparison(file_path_1, file_path_2).merged)
+    assert comparison.pairwise_kappa.iloc[0, 2] == 1
+    assert comparison.pairwise_kappa.iloc[0, 1] == pytest.approx(Comparison(file_path_1, file_path_2)
+                                                                 .metrics['Kappas Score'][0])
@@ -1,7 +1,9 @@
+import io
+
 import pandas as pd
 import pytest
 
-from level_agreement.upload.file_upload import load_file, check_file_path_string
+from level_agreement.upload.file_upload import load_file, file_columns, check_file_path_string, REQUIRED_COLUMNS
 
 
 @pytest.mark.parametrize('file_path', ['./latest_human.csv'])
@@ -64,3 +66,72 @@ def test_file_path_string_error_message(file_path):
 
 
 
+
+
+@pytest.mark.parametrize('file_path, engine', [('./latest_human.csv', 'c'), ('./latest_human.csv', None)])
+def test_load_file_column_projection(file_path, engine, tmp_path):
+    """
+    This test function checks that only the requested columns are read, as strings
+    """
+    df = pd.read_csv(file_path)
+    df['source'] = 'survey'
+    df['score'] = 1.5
+    projected_path = tmp_path / 'extra_columns.csv'
+    df.to_csv(projected_path, index=False)
+
+    projected_df = load_file(str(projected_path), columns=REQUIRED_COLUMNS, engine=engine)
+
+    assert list(projected_df.columns) == REQUIRED_COLUMNS
+    assert len(projected_df) == len(df)
+    assert projected_df['comment'].tolist() == df['comment'].tolist()
+
+
+@pytest.mark.parametrize('file_path', ['./latest_model.csv'])
+def test_load_file_column_projection_missing_column(file_path, tmp_path):
+    """
+    This test function checks that missing columns are left for validation to report
+    """
+    no_id_path = tmp_path / 'no_id_column.csv'
+    pd.read_csv(file_path).drop(columns='id').to_csv(no_id_path, index=False)
+
+    df = load_file(str(no_id_path), columns=REQUIRED_COLUMNS)
+    assert list(df.columns) == ['comment', 'prediction']
+
+
+@pytest.mark.parametrize('file_path, extension', [('./latest_human.csv', '.parquet'), ('./latest_human.csv', '.feather')])
+def test_load_columnar_file(file_path, extension, tmp_path):
+    """
+    This test function checks that Parquet and Arrow files load like the CSV they were written from
+    """
+    df = load_file(file_path)
+    df['source'] = 'survey'
+    columnar_path = str(tmp_path / f"latest_human{extension}")
+    if extension == '.parquet':
+        df.to_parquet(columnar_path)
+    else:
+        df.to_feather(columnar_path)
+
+    columnar_df = load_file(columnar_path, columns=REQUIRED_COLUMNS)
+
+    assert list(columnar_df.columns) == REQUIRED_COLUMNS
+    assert columnar_df['prediction'].tolist() == df['prediction'].tolist()
+
+
+@pytest.mark.parametrize('file_path, extension', [
+    ('./latest_human.csv', '.csv'), ('./latest_human.csv', '.parquet'), ('./latest_human.csv', '.feather'),
+])
+def test_file_columns(file_path, extension, tmp_path):
+    """
+    This test function checks the column names are read from files on disk and from uploaded file objects
+    """
+    df = load_file(file_path).assign(source='survey')
+    path = tmp_path / f"latest_human{extension}"
+    {'.csv': lambda: df.to_csv(path, index=False), '.parquet': lambda: df.to_parquet(path),
+     '.feather': lambda: df.to_feather(path)}[extension]()
+
+    upload = io.BytesIO(path.read_bytes())
+    upload.name = path.name
+
+    assert file_columns(str(path)) == list(df.columns)
+    assert file_columns(upload) == list(df.columns)
+    assert upload.tell() == 0
@@ -1,7 +1,14 @@
+import logging
+import re
+import time
+
+import numpy as np
 import pandas as pd
 import pytest
 from level_agreement.validation.file_validation import validate_file_column, \
-    validate_empty_rows
+    validate_empty_rows, validate_ids, reconcile_ids
+from level_agreement.validation.duplicate_keys import resolve_duplicate_keys, estimate_merge_size
+from level_agreement.validation.schema import FileSchema, PREDICTION_FORMAT
 from level_agreement.upload.file_upload import load_file
 
 
@@ -88,3 +95,138 @@ def test_validate_ids(file, comparison_file):
     dataframe1 = load_file(file)
     dataframe2 = load_file(comparison_file)
     assert dataframe1['id'].isin(dataframe2['id']).all() and dataframe2['id'].isin(dataframe1['id']).all()
+
+
+def test_reconcile_ids_report(caplog, capsys):
+    """
+    This test function checks unmatched IDs are dropped from both sides and reported with their row counts
+    """
+    dataframe1 = pd.DataFrame({'id': [1, 2, 2, 3, None], 'comment': list('abcde')})
+    dataframe2 = pd.DataFrame({'id': [4, 3, None, 1, 4, 5], 'comment': list('fghijk')})
+
+    df1, df2, report = reconcile_ids(dataframe1, dataframe2)
+
+    assert df1['comment'].tolist() == ['a', 'd', 'e']
+    assert df2['comment'].tolist() == ['g', 'h', 'i']
+    assert report.to_dict('list') == {'id': [2, 4, 5], 'Dropped From': ['Prediction X', 'Prediction Y', 'Prediction Y'],
+                                      'Rows': [2, 2, 1]}
+    with caplog.at_level(logging.INFO, logger='level_agreement.validation.file_validation'):
+        validated_1, validated_2 = validate_ids(dataframe1, dataframe2)
+    assert validated_1.equals(df1) and validated_2.equals(df2)
+    assert '5 rows of 3 IDs missing from the other file were removed' in caplog.text
+    assert capsys.readouterr().out == ''
+
+
+@pytest.mark.parametrize('file, comparison_file', [('./latest_human.csv', './latest_model.csv')])
+def test_reconcile_ids_matching_files(file, comparison_file):
+    dataframe1 = load_file(file)
+    dataframe2 = load_file(comparison_file)
+
+    df1, df2, report = reconcile_ids(dataframe1, dataframe2)
+
+    assert df1 is dataframe1 and df2 is dataframe2
+    assert report.empty
+
+
+@pytest.fixture
+def duplicated_keys():
+    return pd.DataFrame({'id': [1, 2, 1, 3, 1],
+                         'comment': ['a', 'b', 'a', 'c', 'x'],
+                         'prediction': ["['p', 'q']", "['r']", "['q', 's']", "['t']", "[]"]})
+
+
+@pytest.mark.parametrize('policy, expected_predictions', [
+    ('first', ["['p', 'q']", "['r']", "['t']", "[]"]),
+    ('last', ["['r']", "['q', 's']", "['t']", "[]"]),
+    ('union', ["['p', 'q', 's']", "['r']", "['t']", "[]"]),
+])
+def test_resolve_duplicate_keys(duplicated_keys, policy, expected_predictions):
+    """
+    This test function checks every policy leaves one row per id and comment and counts the affected rows
+    """
+    resolved, affected = resolve_duplicate_keys(duplicated_keys, policy)
+
+    assert affected == 2
+    assert resolved['prediction'].tolist() == expected_predictions
+    assert estimate_merge_size(resolved, resolved) == len(resolved)
+
+
+def test_resolve_duplicate_keys_error(duplicated_keys):
+    with pytest.raises(ValueError) as exec_info:
+        resolve_duplicate_keys(duplicated_keys)
+    assert "2 rows share an id and comment" in str(exec_info.value)
+
+
+@pytest.mark.parametrize('file', ['./empty_row.csv', './latest_human.csv'])
+def test_estimate_merge_size(duplicated_keys, file):
+    """
+    This test function checks the estimate matches the size of the actual join, missing keys included
+    """
+    dataframe = load_file(file)
+
+    assert estimate_merge_size(dataframe, dataframe) == len(dataframe.merge(dataframe, on=['id', 'comment']))
+    assert estimate_merge_size(duplicated_keys, duplicated_keys) == 7
+
+
+@pytest.mark.parametrize('file_path', ['./empty_row.csv'])
+def test_file_schema_report(file_path):
+    """
+    This test function checks every empty cell and malformed prediction is reported with its row
+    """
+    dataframe = load_file(file_path)
+    expected_empty = [(row, column) for column in ['id', 'comment', 'prediction']
+                      for row in np.flatnonzero(dataframe[column].isna())]
+
+    report = FileSchema().validate(dataframe)
+
+    empty = report[report['error'] == 'Empty cell']
+    assert sorted(zip(empty['row'], empty['column'])) == sorted(expected_empty)
+    assert report.loc[report['error'] == 'Malformed prediction', 'row'].tolist() == [2]
+
+
+@pytest.mark.parametrize('file_path', ['./empty_row.csv'])
+def test_file_schema_check_fills_like_validators(file_path):
+    expected = validate_empty_rows(load_file(file_path))
+
+    dataframe, report = FileSchema().check(load_file(file_path))
+
+    pd.testing.assert_frame_equal(dataframe, expected)
+
+
+@pytest.mark.parametrize('file_path, error_message', [
+    ('./no_id_column.csv', 'File is missing the id column'),
+    ('./no_comment_column.csv', 'File is missing the comment column'),
+])
+def test_file_schema_missing_columns(file_path, error_message):
+    dataframe = load_file(file_path)
+
+    assert FileSchema().validate(dataframe)['error'].tolist()[0] == error_message
+    with pytest.raises(ValueError) as exec_info:
+        FileSchema().check(dataframe)
+    assert error_message == str(exec_info.value)
+
+
+def test_file_schema_empty_file():
+    report = FileSchema().validate(pd.DataFrame(columns=['id', 'comment', 'prediction']))
+
+    assert report['error'].tolist() == ['DataFrame is empty']
+    with pytest.raises(AssertionError):
+        FileSchema().check(pd.DataFrame(columns=['id', 'comment', 'prediction']))
+
+
+@pytest.mark.parametrize('labels', [22, 5000])
+def test_file_schema_malformed_prediction_time(labels):
+    """
+    This test function checks a long malformed prediction is reported quickly instead of backtracking, with
+    Python's regular expressions as well as the pyarrow ones pandas may use
+    """
+    malformed = "[" + ", ".join(f"food fries {label}" for label in range(labels)) + "]]"
+    dataframe = pd.DataFrame({'id': [1, 2], 'comment': ['a', 'b'], 'prediction': [malformed, malformed[:-1]]})
+
+    start = time.perf_counter()
+    report = FileSchema().validate(dataframe)
+    matches = [re.fullmatch(PREDICTION_FORMAT, prediction) for prediction in dataframe['prediction']]
+
+    assert time.perf_counter() - start < 1
+    assert report.loc[report['error'] == 'Malformed prediction', 'row'].tolist() == [0]
+    assert [match is not None for match in matches] == [False, True]